@@ -1,51 +1,251 @@
 from datetime import datetime, timezone
+from typing import Dict, List, Optional
 import asyncio
-from .dtos import ChatMessageRequestDTO, ChatMessageResponseDTO
-from src.domain.entities import ChatMessage, ChatContext
+from .dtos import (
+    ChatMessageRequestDTO,
+    ChatMessageResponseDTO,
+    ChatBatchItemResultDTO,
+    ChatBatchResponseDTO,
+)
+from src.domain.entities import ChatMessage, ChatContext, Product
 from src.domain.repositories import IProductRepository, IChatRepository
-from src.domain.exceptions import ChatServiceError
+from src.domain.exceptions import AIServiceError, ChatServiceError
+from .pipeline import Stage, run_stages
 
 # Servicio encargado de manejar la lógica de negocio del chat con IA.
 # Se comunica con los repositorios de productos y chat, y con el servicio de IA (Gemini)
 # para generar respuestas inteligentes a partir de los mensajes del usuario.
 
+
+# Alternativas para el prompt: por cada producto agotado, los ids de hasta "k"
+# productos parecidos con stock según "similarity" (un objeto con
+# similar(product_id, k, in_stock_only)). Si el índice falla para un producto,
+# ese producto se queda sin alternativas.
+def stock_alternatives(similarity, products: List[Product], k: int) -> Dict[int, List[int]]:
+    if similarity is None or k <= 0:
+        return {}
+    in_catalog = {p.id for p in products}
+    alternatives: Dict[int, List[int]] = {}
+    for p in products:
+        if p.stock != 0:
+            continue
+        try:
+            matches = similarity.similar(p.id, k, in_stock_only=True) or []
+        except Exception:
+            continue
+        ids = [pid for pid, _ in matches if pid in in_catalog]
+        if ids:
+            alternatives[p.id] = ids
+    return alternatives
+
+
 class ChatService:
     # Constructor que inicializa el servicio con los repositorios y el proveedor de IA.
-    def __init__(self, product_repo: IProductRepository, chat_repo: IChatRepository, ai_service):
+    # "writer" es opcional: si se recibe (con "await submit(mensajes)" y wait_for(sesión)),
+    # la respuesta del asistente se guarda en segundo plano después de responder al cliente.
+    # "similarity" también es opcional: con él se sugieren en el prompt hasta
+    # "alternatives_per_product" alternativas con stock por producto agotado.
+    def __init__(self, product_repo: IProductRepository, chat_repo: IChatRepository, ai_service,
+                 writer=None, similarity=None, alternatives_per_product: int = 2):
         self.product_repo = product_repo
         self.chat_repo = chat_repo
         self.ai_service = ai_service
+        self.writer = writer
+        self.similarity = similarity
+        self.alternatives_per_product = alternatives_per_product
+        # Duración (ms) de cada etapa del último mensaje procesado
+        self.last_timings: Dict[str, float] = {}
 
     # Método principal que procesa un mensaje del usuario.
-    # Obtiene el contexto del chat, llama a Gemini para obtener una respuesta,
-    # guarda ambos mensajes en el historial y devuelve la respuesta al cliente.
-    async def process_message(self, request: ChatMessageRequestDTO) -> ChatMessageResponseDTO:
-        try:
-            # Obtiene todos los productos del catálogo y el historial reciente de chat.
-            products = self.product_repo.get_all()
-            history = self.chat_repo.get_recent_messages(request.session_id, 6)
-            context = ChatContext(messages=history)
-
-            # Ejecuta la llamada síncrona de Gemini en un hilo separado
-            ai_reply = await asyncio.to_thread(
-                self.ai_service.generate_response_sync,
-                request.message, products, context
+    # El flujo se declara como etapas y las independientes corren en paralelo:
+    #
+    #   products ─┬─> alternatives ─┐
+    #             ├─────────────────┴─> llm ───┐
+    #   history ──┤                            ├─> persist_reply
+    #             └─> persist_user ────────────┘
+    #
+    # - El catálogo y el historial se leen a la vez.
+    # - Las alternativas de los productos agotados se buscan mientras se lee
+    #   el historial y se pasan al modelo como datos.
+    # - El mensaje del usuario se guarda mientras el modelo genera la respuesta
+    #   (después de leer el historial, para no incluirlo en su propio contexto).
+    # - La respuesta del asistente se agrega al contexto en caché de la sesión
+    #   (remember_pending) y se entrega al "writer", que la anota en su diario
+    #   antes de retornar y la guarda después de responder: el siguiente turno
+    #   la ve aunque la escritura siga en curso, su mensaje de usuario se guarda
+    #   después de ella, y si el proceso cae antes de la escritura se recupera
+    #   del diario al arrancar. Sin writer se guarda antes de retornar.
+    # Los repositorios de productos y de chat se usan desde hilos distintos al
+    # mismo tiempo, por lo que no deben compartir la misma sesión de base de datos.
+    #
+    # Opciones para quien reintenta el mismo mensaje (la cola de trabajos):
+    # - "raise_model_errors": un fallo del modelo se propaga como AIServiceError
+    #   en lugar de responder con el texto de disculpa.
+    # - "user_timestamp": fecha fija del mensaje del usuario (la de creación del
+    #   trabajo, o la del primer intento con la misma Idempotency-Key), para
+    #   reconocerlo en un reintento.
+    # - "resume": si un intento anterior ya guardó ese mensaje, no se guarda otra
+    #   vez y se quita del historial que ve el modelo.
+    async def process_message(
+        self, request: ChatMessageRequestDTO, raise_model_errors: bool = False,
+        user_timestamp: Optional[datetime] = None, resume: bool = False,
+    ) -> ChatMessageResponseDTO:
+        session_id, message = request.session_id, request.message
+        started = user_timestamp or datetime.now(timezone.utc)
+        existing: List[ChatMessage] = []
+
+        async def load_products(_):
+            return await asyncio.to_thread(self.product_repo.get_all)
+
+        async def load_history(_):
+            if resume:
+                found = await asyncio.to_thread(self.chat_repo.find_message, session_id, "user", message, started)
+                if found is not None:
+                    existing.append(found)
+            history = await asyncio.to_thread(self.chat_repo.get_recent_messages, session_id, 6)
+            return [m for m in history if not existing or m.id != existing[0].id]
+
+        async def find_alternatives(r):
+            return await asyncio.to_thread(
+                stock_alternatives, self.similarity, r["products"], self.alternatives_per_product
             )
 
-            # Crea los mensajes (usuario y asistente) y los guarda en la base de datos.
-            now = datetime.now(timezone.utc)
-            u_msg = ChatMessage(None, request.session_id, "user", request.message, now)
-            a_msg = ChatMessage(None, request.session_id, "assistant", ai_reply, now)
-            self.chat_repo.save_message(u_msg)
-            self.chat_repo.save_message(a_msg)
-
-            # Retorna la respuesta formateada para el cliente.
-            return ChatMessageResponseDTO(
-                session_id=request.session_id,
-                user_message=request.message,
-                assistant_message=ai_reply,
-                timestamp=now
+        async def persist_user(_):
+            if self.writer is not None:
+                # La respuesta anterior de la sesión se guarda antes que este mensaje
+                await self.writer.wait_for(session_id)
+            if existing:
+                return existing[0]
+            u_msg = ChatMessage(None, session_id, "user", message, started)
+            return await asyncio.to_thread(self.chat_repo.save_message, u_msg)
+
+        # Ejecuta la llamada síncrona de Gemini en un hilo separado
+        async def generate(r):
+            context = ChatContext(messages=r["history"])
+            return await asyncio.to_thread(
+                self.ai_service.generate_response_sync, message, r["products"], context, r["alternatives"],
+                raise_errors=raise_model_errors,
             )
+
+        async def persist_reply(r):
+            a_msg = ChatMessage(None, session_id, "assistant", r["llm"], datetime.now(timezone.utc))
+            if self.writer is not None:
+                self.chat_repo.remember_pending([a_msg])
+                await self.writer.submit([a_msg])
+            else:
+                await asyncio.to_thread(self.chat_repo.save_message, a_msg)
+            return a_msg
+
+        try:
+            results, self.last_timings = await run_stages([
+                Stage("products", load_products),
+                Stage("history", load_history),
+                Stage("alternatives", find_alternatives, after=("products",)),
+                Stage("persist_user", persist_user, after=("history",)),
+                Stage("llm", generate, after=("products", "history", "alternatives")),
+                Stage("persist_reply", persist_reply, after=("llm", "persist_user")),
+            ])
+        except AIServiceError:
+            raise
         except Exception as e:
             # Manejo de errores para identificar fallas durante la generación de respuesta.
             raise ChatServiceError(f"Gemini/Chat error: {e}") from e
+
+        # Retorna la respuesta formateada para el cliente.
+        a_msg = results["persist_reply"]
+        return ChatMessageResponseDTO(
+            session_id=session_id,
+            user_message=message,
+            assistant_message=a_msg.message,
+            timestamp=a_msg.timestamp
+        )
+
+    # Método para procesar muchos mensajes en una sola llamada (lotes nocturnos, QA).
+    # - El catálogo se carga una sola vez y el historial una vez por sesión.
+    # - Las llamadas al modelo se ejecutan en paralelo con un máximo de
+    #   "max_concurrency" simultáneas, pero en orden dentro de cada sesión
+    #   (cada turno ve en su contexto los turnos anteriores del lote).
+    # - Todos los mensajes se guardan al final en una sola escritura; si esa
+    #   escritura falla, los resultados llevan "persist_error" en lugar de
+    #   perder las respuestas.
+    # - Un fallo del modelo es un error del mensaje (ok=False): ese turno no
+    #   se guarda ni entra al contexto de los siguientes.
+    # Las lecturas y la escritura corren en hilos, fuera del event loop; los
+    # repositorios pueden compartir la sesión de BD porque se usan de a uno.
+    # Retorna un resultado por mensaje, en el orden de la petición.
+    async def process_batch(
+        self, requests: List[ChatMessageRequestDTO], max_concurrency: int = 4
+    ) -> ChatBatchResponseDTO:
+        products = await asyncio.to_thread(self.product_repo.get_all)
+        alternatives = await asyncio.to_thread(
+            stock_alternatives, self.similarity, products, self.alternatives_per_product
+        )
+
+        # Agrupa los índices por sesión conservando el orden original
+        sessions: Dict[str, List[int]] = {}
+        for i, req in enumerate(requests):
+            sessions.setdefault(req.session_id, []).append(i)
+
+        # Historial inicial de cada sesión (lecturas secuenciales sobre la misma sesión de BD)
+        histories = {
+            sid: await asyncio.to_thread(self.chat_repo.get_recent_messages, sid, 6) for sid in sessions
+        }
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        results: List[Optional[ChatBatchItemResultDTO]] = [None] * len(requests)
+        turns: Dict[int, List[ChatMessage]] = {}
+
+        async def run_session(session_id: str, indexes: List[int]):
+            history = histories[session_id]
+            for i in indexes:
+                req = requests[i]
+                try:
+                    started = datetime.now(timezone.utc)
+                    context = ChatContext(messages=list(history))
+                    async with semaphore:
+                        ai_reply = await asyncio.to_thread(
+                            self.ai_service.generate_response_sync,
+                            req.message, products, context, alternatives, raise_errors=True
+                        )
+                    now = datetime.now(timezone.utc)
+                    u_msg = ChatMessage(None, session_id, "user", req.message, started)
+                    a_msg = ChatMessage(None, session_id, "assistant", ai_reply, now)
+                except Exception as e:
+                    results[i] = ChatBatchItemResultDTO(
+                        index=i, session_id=session_id, ok=False, error=f"{type(e).__name__}: {e}"
+                    )
+                    continue
+
+                history.extend((u_msg, a_msg))
+                del history[:-6]  # Solo se necesitan los últimos mensajes como contexto
+                turns[i] = [u_msg, a_msg]
+                results[i] = ChatBatchItemResultDTO(
+                    index=i,
+                    session_id=session_id,
+                    ok=True,
+                    response=ChatMessageResponseDTO(
+                        session_id=session_id,
+                        user_message=req.message,
+                        assistant_message=ai_reply,
+                        timestamp=now
+                    ),
+                )
+
+        await asyncio.gather(*(run_session(sid, idx) for sid, idx in sessions.items()))
+
+        # Guarda todos los turnos exitosos en una sola escritura, en el orden de la petición.
+        # Si falla, las respuestas ya generadas se entregan igual, marcadas con el error.
+        try:
+            await asyncio.to_thread(self.chat_repo.save_messages, [m for i in sorted(turns) for m in turns[i]])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            for i in turns:
+                results[i].persist_error = error
+
+        succeeded = sum(1 for r in results if r.ok)
+        return ChatBatchResponseDTO(
+            total=len(results),
+            succeeded=succeeded,
+            failed=len(results) - succeeded,
+            items=results,
+        )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, validator
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 # Este archivo define los Data Transfer Objects (DTOs),
@@ -39,6 +39,114 @@ class ProductDTO(BaseModel):
         from_attributes = True
 
 
+class SimilarProductDTO(ProductDTO):
+    # Producto recomendado por similitud con otro producto del catálogo.
+    # "score" es la similitud coseno (0 a 1; más alto = más parecido).
+
+    score: float = 0.0
+
+
+class StockQuantityDTO(BaseModel):
+    # Cantidad a reservar o liberar de un producto (/products/{id}/reserve y /release).
+
+    quantity: int = 1
+
+    # Valida que la cantidad sea positiva.
+    @validator("quantity")
+    def quantity_positive(cls, v):
+        if v < 1:
+            raise ValueError("quantity debe ser >= 1")
+        return v
+
+
+class StockItemDTO(StockQuantityDTO):
+    # Producto y cantidad dentro de una reserva de varios productos.
+
+    product_id: int
+
+
+class StockReservationRequestDTO(BaseModel):
+    # Reserva (o liberación) de varios productos en una sola transacción:
+    # se aplican todos los productos o ninguno.
+
+    items: List[StockItemDTO]
+
+    # Valida que la lista no esté vacía.
+    @validator("items")
+    def items_not_empty(cls, v):
+        if not v:
+            raise ValueError("items vacío")
+        return v
+
+
+class StockLevelDTO(BaseModel):
+    # Resultado por producto: cantidad reservada/liberada y stock resultante.
+
+    product_id: int
+    quantity: int
+    stock: int
+
+
+class StockReservationResponseDTO(BaseModel):
+    # Resultado de una reserva o liberación, un elemento por producto.
+
+    items: List[StockLevelDTO]
+
+
+class ProductPatchDTO(BaseModel):
+    # Cambio de un producto dentro de PATCH /products: solo se modifican los
+    # campos presentes. Sin "id" (o con un id inexistente) se crea el
+    # producto, y entonces se requieren todos los campos salvo description.
+    # Los valores se validan en ProductService para informar el error de
+    # cada elemento sin rechazar el lote completo.
+
+    id: Optional[int] = None
+    name: Optional[str] = None
+    brand: Optional[str] = None
+    category: Optional[str] = None
+    size: Optional[str] = None
+    color: Optional[str] = None
+    price: Optional[float] = None
+    stock: Optional[int] = None
+    description: Optional[str] = None
+
+
+class ProductBulkRequestDTO(BaseModel):
+    # Lote de cambios de productos aplicado en una sola transacción.
+
+    items: List[ProductPatchDTO]
+
+    # Valida que la lista no esté vacía.
+    @validator("items")
+    def items_not_empty(cls, v):
+        if not v:
+            raise ValueError("items vacío")
+        return v
+
+
+class ProductBulkItemResultDTO(BaseModel):
+    # Resultado de un elemento del lote (en el orden recibido).
+    # status: "updated", "created", "not_found" o "invalid".
+
+    index: int
+    id: Optional[int] = None
+    status: str
+    error: Optional[str] = None
+
+
+class ProductBulkResponseDTO(BaseModel):
+    # Resultado de PATCH /products: totales por estado, versión del
+    # catálogo tras el lote y el detalle de cada elemento.
+
+    total: int
+    updated: int
+    created: int
+    not_found: int
+    invalid: int
+    catalog_version: int
+    items: List[ProductBulkItemResultDTO]
+
+
 class ChatMessageRequestDTO(BaseModel):
     # Define el formato esperado del mensaje enviado por el usuario al chat.
     # Incluye validaciones para evitar cadenas vacías.
@@ -61,6 +169,34 @@ class ChatMessageRequestDTO(BaseModel):
         return v
 
 
+class ChatJobRequestDTO(ChatMessageRequestDTO):
+    # Mensaje de chat para procesar en segundo plano (POST /chat/jobs).
+    # Si se indica "webhook_url", el resultado se envía allí por POST al terminar.
+
+    webhook_url: Optional[str] = None
+
+    # Valida que el webhook sea una URL http(s).
+    @validator("webhook_url")
+    def webhook_http(cls, v):
+        if v is not None and not v.startswith(("http://", "https://")):
+            raise ValueError("webhook_url debe empezar con http:// o https://")
+        return v
+
+
+class ChatJobDTO(BaseModel):
+    # Estado de un trabajo de chat. "result" tiene la misma forma que la
+    # respuesta de POST /chat cuando status = "done".
+
+    job_id: str
+    session_id: str
+    status: str
+    attempts: int
+    result: Optional["ChatMessageResponseDTO"] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
 class ChatMessageResponseDTO(BaseModel):
     # Define la estructura de respuesta del asistente al usuario.
     # Incluye los mensajes y el timestamp de generación.
@@ -82,3 +218,51 @@ class ChatHistoryDTO(BaseModel):
     # Permite construir el DTO directamente desde modelos ORM.
     class Config:
         from_attributes = True
+
+
+class ChatBatchRequestDTO(BaseModel):
+    # Lote de mensajes para procesar en una sola llamada (/chat/batch).
+    # Los mensajes de una misma sesión se procesan en el orden recibido.
+
+    items: List[ChatMessageRequestDTO]
+    max_concurrency: Optional[int] = None
+
+    # Valida que el lote no esté vacío.
+    @validator("items")
+    def items_not_empty(cls, v):
+        if not v:
+            raise ValueError("items vacío")
+        return v
+
+    # Valida que la concurrencia sea positiva.
+    @validator("max_concurrency")
+    def concurrency_positive(cls, v):
+        if v is not None and v < 1:
+            raise ValueError("max_concurrency debe ser >= 1")
+        return v
+
+
+class ChatBatchItemResultDTO(BaseModel):
+    # Resultado de un mensaje del lote: la respuesta o el error ocurrido.
+    # "index" es la posición del mensaje en la petición original.
+    # "persist_error" indica que la respuesta se generó pero el turno no
+    # se pudo guardar en el historial.
+
+    index: int
+    session_id: str
+    ok: bool
+    response: Optional[ChatMessageResponseDTO] = None
+    error: Optional[str] = None
+    persist_error: Optional[str] = None
+
+
+class ChatBatchResponseDTO(BaseModel):
+    # Resumen del lote y resultados por mensaje, en el orden de la petición.
+
+    total: int
+    succeeded: int
+    failed: int
+    items: List[ChatBatchItemResultDTO]
+
+
+ChatJobDTO.model_rebuild()
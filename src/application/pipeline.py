@@ -0,0 +1,48 @@
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import asyncio
+import time
+
+# Ejecutor de etapas para los flujos de la capa de aplicación (por ejemplo, el chat).
+# Cada etapa declara de qué etapas depende; todas se lanzan a la vez y cada una
+# espera solo a sus dependencias, así las etapas independientes corren en paralelo.
+# Se mide la duración de cada etapa (sin contar la espera de sus dependencias).
+
+
+@dataclass
+class Stage:
+    # Etapa del flujo: "run" recibe los resultados de las etapas anteriores
+    # (por nombre) y retorna el resultado de esta etapa.
+    name: str
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+    after: Tuple[str, ...] = field(default_factory=tuple)
+
+
+# Ejecuta las etapas y retorna (resultados, duraciones en ms) por nombre de etapa.
+# Si una etapa falla se cancelan las demás y se propaga la excepción.
+async def run_stages(stages: List[Stage]) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    results: Dict[str, Any] = {}
+    timings: Dict[str, float] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(stage: Stage):
+        if stage.after:
+            await asyncio.gather(*(tasks[name] for name in stage.after))
+        started = time.perf_counter()
+        results[stage.name] = await stage.run(results)
+        timings[stage.name] = round((time.perf_counter() - started) * 1000, 3)
+
+    for stage in stages:
+        unknown = [name for name in stage.after if name not in tasks]
+        if unknown:
+            raise ValueError(f"La etapa {stage.name} depende de etapas no declaradas antes: {unknown}")
+        tasks[stage.name] = asyncio.ensure_future(run(stage))
+
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return results, timings
@@ -1,5 +1,15 @@
-from typing import List
-from .dtos import ProductDTO
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from .dtos import (
+    ProductDTO,
+    SimilarProductDTO,
+    StockItemDTO,
+    StockLevelDTO,
+    StockReservationResponseDTO,
+    ProductPatchDTO,
+    ProductBulkItemResultDTO,
+    ProductBulkResponseDTO,
+)
 from src.domain.repositories import IProductRepository
 from src.domain.exceptions import ProductNotFoundError
 
@@ -7,11 +17,16 @@ from src.domain.exceptions import ProductNotFoundError
 # Se comunica con el repositorio de productos para obtener información
 # y devolverla en formato de DTO (Data Transfer Object).
 
+# Campos obligatorios para crear un producto (description es opcional)
+_REQUIRED_FIELDS = ("name", "brand", "category", "size", "color", "price", "stock")
+
 class ProductService:
     # Constructor del servicio de productos.
-    # Recibe una instancia del repositorio de productos (IProductRepository).
-    def __init__(self, repo: IProductRepository):
+    # Recibe una instancia del repositorio de productos (IProductRepository) y,
+    # opcionalmente, el índice de productos similares.
+    def __init__(self, repo: IProductRepository, similarity=None):
         self.repo = repo
+        self.similarity = similarity
 
     # Retorna una lista de todos los productos disponibles.
     # Convierte los objetos del repositorio a instancias de ProductDTO.
@@ -25,3 +40,104 @@ class ProductService:
         if not p:
             raise ProductNotFoundError(f"Producto {product_id} no encontrado")
         return ProductDTO.model_validate(p)
+
+    # Retorna la versión del catálogo y la fecha de su última modificación.
+    # Permite a la API validar cachés sin cargar los productos.
+    def get_catalog_version(self) -> Tuple[int, Optional[datetime]]:
+        return self.repo.get_catalog_version()
+
+    # Retorna la versión del stock y la fecha de su último cambio (reservas).
+    def get_stock_version(self) -> Tuple[int, Optional[datetime]]:
+        return self.repo.get_stock_version()
+
+    # Retorna hasta "k" productos parecidos al producto indicado, del más al
+    # menos similar. Con "in_stock_only" se omiten los productos agotados.
+    # Si el producto no existe, lanza una excepción ProductNotFoundError.
+    def get_similar_products(self, product_id: int, k: int = 5, in_stock_only: bool = False) -> List[SimilarProductDTO]:
+        matches = self.similarity.similar(product_id, k, in_stock_only) if self.similarity else []
+        if matches is None or (not matches and self.repo.get_by_id(product_id) is None):
+            raise ProductNotFoundError(f"Producto {product_id} no encontrado")
+        result = []
+        for pid, score in matches:
+            p = self.repo.get_by_id(pid)
+            if p is not None:
+                result.append(SimilarProductDTO.model_validate(p).model_copy(update={"score": score}))
+        return result
+
+    # Reserva stock de uno o varios productos en una sola operación atómica.
+    # Si algún producto no existe o no tiene stock suficiente no se reserva
+    # ninguno (ProductNotFoundError / InsufficientStockError).
+    def reserve_stock(self, items: List[StockItemDTO]) -> StockReservationResponseDTO:
+        return self._stock_response(items, self.repo.reserve_stock)
+
+    # Devuelve al stock unidades reservadas previamente (por ejemplo, un
+    # carrito abandonado o un pago rechazado).
+    def release_stock(self, items: List[StockItemDTO]) -> StockReservationResponseDTO:
+        return self._stock_response(items, self.repo.release_stock)
+
+    def _stock_response(self, items: List[StockItemDTO], apply) -> StockReservationResponseDTO:
+        stocks = apply([(i.product_id, i.quantity) for i in items])
+        quantities = {}
+        for i in items:
+            quantities[i.product_id] = quantities.get(i.product_id, 0) + i.quantity
+        return StockReservationResponseDTO(items=[
+            StockLevelDTO(product_id=pid, quantity=quantities[pid], stock=stock)
+            for pid, stock in stocks.items()
+        ])
+
+    # Aplica un lote de cambios parciales (y altas) en una sola transacción.
+    # Los elementos inválidos se informan como "invalid" y no se aplican; si
+    # el mismo id aparece varias veces, sus cambios se combinan en orden (el
+    # último valor de cada campo gana) y todos reciben el mismo resultado.
+    def bulk_upsert(self, items: List[ProductPatchDTO]) -> ProductBulkResponseDTO:
+        results: List[Optional[ProductBulkItemResultDTO]] = [None] * len(items)
+        merged: List[Dict] = []
+        positions: List[List[int]] = []
+        by_id: Dict[int, int] = {}
+        for index, item in enumerate(items):
+            fields = item.model_dump(exclude_none=True)
+            error = self._patch_error(fields)
+            if error:
+                results[index] = ProductBulkItemResultDTO(index=index, id=item.id, status="invalid", error=error)
+                continue
+            slot = by_id.get(item.id) if item.id is not None else None
+            if slot is None:
+                slot = len(merged)
+                merged.append({})
+                positions.append([])
+                if item.id is not None:
+                    by_id[item.id] = slot
+            merged[slot].update(fields)
+            positions[slot].append(index)
+
+        outcomes = self.repo.bulk_upsert(merged) if merged else []
+        for (product_id, status), indexes in zip(outcomes, positions):
+            for index in indexes:
+                results[index] = ProductBulkItemResultDTO(index=index, id=product_id, status=status)
+
+        counts = {s: 0 for s in ("updated", "created", "not_found", "invalid")}
+        for r in results:
+            counts[r.status] += 1
+        return ProductBulkResponseDTO(
+            total=len(items),
+            catalog_version=self.repo.get_catalog_version()[0],
+            items=results,
+            **counts,
+        )
+
+    @staticmethod
+    def _patch_error(fields: Dict) -> Optional[str]:
+        if "price" in fields and fields["price"] <= 0:
+            return "price debe ser > 0"
+        if "stock" in fields and fields["stock"] < 0:
+            return "stock no puede ser negativo"
+        for name in _REQUIRED_FIELDS:
+            if isinstance(fields.get(name), str) and not fields[name].strip():
+                return f"{name} vacío"
+        if "id" not in fields:
+            missing = [name for name in _REQUIRED_FIELDS if name not in fields]
+            if missing:
+                return f"faltan campos para crear el producto: {', '.join(missing)}"
+        elif len(fields) == 1:
+            return "no hay campos para actualizar"
+        return None
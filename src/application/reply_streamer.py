@@ -0,0 +1,81 @@
+from typing import AsyncIterator, List
+import asyncio
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from src.domain.entities import ChatContext
+from src.domain.exceptions import ChatServiceError
+from .chat_service import stock_alternatives
+
+# Entrega la respuesta del asistente en fragmentos, a medida que el modelo los produce.
+# Solo necesita el proveedor de IA (no los repositorios): lo usa el canal WebSocket,
+# que lee el contexto y guarda los mensajes por su cuenta.
+#
+# El generador síncrono del proveedor se consume en un hilo y cada fragmento se
+# entrega al event loop por una cola acotada ("max_buffered" fragmentos): si el
+# cliente lee más lento de lo que el modelo genera, el hilo espera en lugar de
+# acumular la respuesta en memoria. Si quien consume deja de iterar (por ejemplo,
+# el cliente se desconectó), el hilo corta el stream del modelo en el siguiente
+# fragmento y no se espera a que termine.
+
+
+class ReplyStreamer:
+    # "similarity" y "alternatives_per_product" cumplen la misma función que en ChatService
+    def __init__(self, ai_service, max_buffered: int = 32, similarity=None, alternatives_per_product: int = 2):
+        self.ai_service = ai_service
+        self.max_buffered = max(1, max_buffered)
+        self.similarity = similarity
+        self.alternatives_per_product = alternatives_per_product
+
+    # Si el proveedor no soporta streaming, se entrega la respuesta completa como
+    # un único fragmento. Los errores del modelo se propagan como ChatServiceError.
+    async def stream(self, message: str, products: List, context: ChatContext) -> AsyncIterator[str]:
+        alternatives = await asyncio.to_thread(
+            stock_alternatives, self.similarity, products, self.alternatives_per_product
+        )
+        stream = getattr(self.ai_service, "generate_response_stream", None)
+        if stream is None:
+            yield await asyncio.to_thread(
+                self.ai_service.generate_response_sync, message, products, context, alternatives
+            )
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_buffered)
+        stop = threading.Event()
+        done = object()
+
+        # Encola desde el hilo; espera si la cola está llena, salvo que se pida parar
+        def put(item) -> bool:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    future.result(timeout=0.1)
+                    return True
+                except FutureTimeoutError:
+                    if stop.is_set():
+                        future.cancel()
+                        return False
+
+        def produce():
+            try:
+                for chunk in stream(message, products, context, alternatives):
+                    if stop.is_set() or not put(chunk):
+                        break  # cierra el generador del proveedor (y su stream HTTP)
+            except Exception as e:
+                if not stop.is_set():
+                    put(e)
+                    return
+            if not stop.is_set():
+                put(done)
+
+        loop.run_in_executor(None, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise ChatServiceError(f"Gemini/Chat error: {item}") from item
+                yield item
+        finally:
+            stop.set()
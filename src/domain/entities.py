@@ -5,8 +5,13 @@ from datetime import datetime
 # Este archivo define las entidades del dominio.
 # Representan los objetos principales del sistema (Producto, Mensaje y Contexto del Chat)
 # con sus reglas de negocio básicas y validaciones.
+#
+# Las entidades usan "slots" para reducir memoria y tiempo de acceso a atributos.
+# Los datos que vienen del usuario se validan en __post_init__; las filas que ya
+# fueron validadas al escribirse en la base de datos se hidratan con el
+# constructor "from_trusted", que omite esa validación.
 
-@dataclass
+@dataclass(slots=True)
 class Product:
     # Entidad que representa un producto dentro del sistema de e-commerce.
     # Incluye validaciones para asegurar la integridad de los datos.
@@ -31,12 +36,28 @@ class Product:
         if self.stock < 0:
             raise ValueError("El stock no puede ser negativo")
 
+    # Constructor de confianza para filas leídas de la base de datos:
+    # crea la instancia sin ejecutar __post_init__.
+    @classmethod
+    def from_trusted(cls, id, name, brand, category, size, color, price, stock, description) -> "Product":
+        p = object.__new__(cls)
+        p.id = id
+        p.name = name
+        p.brand = brand
+        p.category = category
+        p.size = size
+        p.color = color
+        p.price = price
+        p.stock = stock
+        p.description = description
+        return p
+
     # Indica si el producto está disponible (stock mayor que 0).
     def is_available(self) -> bool:
         return self.stock > 0
 
 
-@dataclass
+@dataclass(slots=True)
 class ChatMessage:
     # Entidad que representa un mensaje individual dentro de una sesión de chat.
     # Puede ser enviado por el usuario o por el asistente.
@@ -56,8 +77,20 @@ class ChatMessage:
         if not self.message.strip():
             raise ValueError("message vacío")
 
+    # Constructor de confianza para filas leídas de la base de datos:
+    # crea la instancia sin ejecutar __post_init__.
+    @classmethod
+    def from_trusted(cls, id, session_id, role, message, timestamp) -> "ChatMessage":
+        m = object.__new__(cls)
+        m.id = id
+        m.session_id = session_id
+        m.role = role
+        m.message = message
+        m.timestamp = timestamp
+        return m
+
 
-@dataclass
+@dataclass(slots=True)
 class ChatContext:
     # Entidad que almacena el contexto de una sesión de chat,
     # incluyendo los mensajes más recientes del historial.
@@ -12,3 +12,28 @@ class ChatServiceError(Exception):
     # Excepción que se lanza cuando ocurre un error en el servicio de chat.
     # Generalmente se utiliza para capturar errores de comunicación con la IA (Gemini API).
     ...
+
+
+class AIServiceError(ChatServiceError):
+    # Excepción que se lanza cuando el modelo de IA no pudo generar la respuesta
+    # (error de red, tiempo de espera agotado, cuota, etc.). Permite distinguir una
+    # falla del modelo de una respuesta válida para decidir si reintentar.
+    ...
+
+
+class InsufficientStockError(Exception):
+    # Excepción que se lanza cuando se intenta reservar más unidades de las disponibles.
+    # Guarda el producto, la cantidad pedida y el stock disponible en ese momento.
+    def __init__(self, product_id: int, requested: int, available: int):
+        super().__init__(
+            f"Stock insuficiente para el producto {product_id}: pedido {requested}, disponible {available}"
+        )
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+
+
+class StockBusyError(Exception):
+    # Excepción que se lanza cuando no se pudo actualizar el stock porque la base de datos
+    # estuvo ocupada por otras escrituras durante todos los reintentos.
+    ...
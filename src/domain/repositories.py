@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 from .entities import Product, ChatMessage
 
 # Este archivo define las interfaces (contratos) que deben implementar los repositorios del dominio.
@@ -45,6 +46,42 @@ class IProductRepository(ABC):
         # Retorna True si la eliminación fue exitosa, False en caso contrario.
         ...
 
+    @abstractmethod
+    def bulk_upsert(self, items: List[Dict[str, Any]]) -> List[Tuple[Optional[int], str]]:
+        # Aplica muchos cambios de productos en una sola transacción. Cada elemento es un
+        # diccionario con "id" (opcional) y solo los campos a cambiar:
+        # - si el id existe, se actualizan solo esos campos;
+        # - si no tiene id, o el id no existe y trae todos los campos, se crea el producto.
+        # Retorna (id, resultado) por elemento, en el mismo orden: "updated", "created"
+        # o "not_found". La versión del catálogo se incrementa una sola vez.
+        ...
+
+    @abstractmethod
+    def reserve_stock(self, items: List[Tuple[int, int]]) -> Dict[int, int]:
+        # Descuenta stock de uno o varios productos [(id, cantidad), ...] en una sola
+        # transacción: o se reservan todos o ninguno. Retorna el stock resultante por id.
+        # Lanza InsufficientStockError si algún producto no tiene unidades suficientes.
+        ...
+
+    @abstractmethod
+    def release_stock(self, items: List[Tuple[int, int]]) -> Dict[int, int]:
+        # Devuelve al stock unidades reservadas previamente, en una sola transacción.
+        # Retorna el stock resultante por id.
+        ...
+
+    @abstractmethod
+    def get_catalog_version(self) -> Tuple[int, Optional[datetime]]:
+        # Retorna la versión actual del catálogo y la fecha de su última modificación.
+        # Se usa para validar cachés (ETag / Last-Modified) sin leer los productos.
+        # Los cambios de stock (reservas y devoluciones) no la modifican.
+        ...
+
+    @abstractmethod
+    def get_stock_version(self) -> Tuple[int, Optional[datetime]]:
+        # Retorna la versión del stock y la fecha de su último cambio. Se incrementa
+        # con cada reserva o devolución de stock.
+        ...
+
 
 # --------------------------------------------------------------
 # INTERFAZ: IChatRepository
@@ -57,6 +94,12 @@ class IChatRepository(ABC):
     def save_message(self, message: ChatMessage) -> ChatMessage:
         # Guarda un mensaje (ya sea del usuario o del asistente) en la base de datos.
         ...
+
+    @abstractmethod
+    def save_messages(self, messages: List[ChatMessage]) -> List[ChatMessage]:
+        # Guarda varios mensajes en una sola escritura (una transacción).
+        # Retorna los mensajes con sus ids asignados, en el mismo orden.
+        ...
     
     @abstractmethod
     def get_session_history(self, session_id: str, limit: Optional[int] = None) -> List[ChatMessage]:
@@ -75,3 +118,27 @@ class IChatRepository(ABC):
         # Retorna los últimos mensajes enviados en una sesión.
         # Se usa para mantener el contexto en las conversaciones con la IA.
         ...
+
+    @abstractmethod
+    def get_session_version(self, session_id: str) -> Tuple[int, Optional[int], Optional[int], Optional[datetime]]:
+        # Retorna (cantidad de mensajes, primer id, último id, fecha del último mensaje)
+        # de una sesión. Cambia cada vez que se agregan o eliminan mensajes, por lo que
+        # sirve para validar cachés del historial sin leer los mensajes.
+        ...
+
+    @abstractmethod
+    def get_last_message_id(self, session_id: str) -> Optional[int]:
+        # Retorna el id del último mensaje guardado de la sesión (o None).
+        ...
+
+    @abstractmethod
+    def find_message(self, session_id: str, role: str, message: str, timestamp: datetime) -> Optional[ChatMessage]:
+        # Busca un mensaje guardado de la sesión con ese rol, texto y fecha exacta.
+        # Permite que un reintento no vuelva a guardar el mismo mensaje.
+        ...
+
+    def remember_pending(self, messages: List[ChatMessage]) -> None:
+        # Opcional: registra mensajes que se van a guardar en segundo plano, para que
+        # get_recent_messages los incluya antes de que lleguen a la base de datos.
+        # Por defecto no hace nada (los repositorios sin caché los verán al guardarse).
+        return None
@@ -0,0 +1,36 @@
+from sqlalchemy.orm import Session
+
+from src.infrastructure.cache.session_context_cache import session_cache
+from src.infrastructure.catalog.snapshot import catalog_snapshot
+from src.infrastructure.repositories.cached_chat_repository import CachedChatRepository
+from src.infrastructure.repositories.chat_repository import SQLChatRepository
+from src.infrastructure.repositories.product_repository import SQLProductRepository
+from src.infrastructure.repositories.snapshot_product_repository import SnapshotProductRepository
+
+# --------------------------------------------------------------
+# Módulo: dependencies.py
+# --------------------------------------------------------------
+# Fábricas de repositorios compartidas por los distintos routers de la
+# API (HTTP y WebSocket), para que todos armen los adaptadores igual.
+# --------------------------------------------------------------
+
+
+# --------------------------------------------------------------
+# Función: product_repository
+# --------------------------------------------------------------
+# Las lecturas de productos se resuelven desde el snapshot del catálogo
+# compartido entre workers; las escrituras van a SQL y republican el
+# snapshot. Con CATALOG_SNAPSHOT_ENABLED=false se usa solo SQL.
+# --------------------------------------------------------------
+def product_repository(db: Session) -> SnapshotProductRepository:
+    return SnapshotProductRepository(SQLProductRepository(db), catalog_snapshot)
+
+
+# --------------------------------------------------------------
+# Función: chat_repository
+# --------------------------------------------------------------
+# Repositorio de chat con la caché LRU de contextos de sesión delante
+# del repositorio SQL (write-through en los guardados).
+# --------------------------------------------------------------
+def chat_repository(db: Session) -> CachedChatRepository:
+    return CachedChatRepository(SQLChatRepository(db), session_cache)
@@ -0,0 +1,205 @@
+import gzip
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # Dependencia opcional: sin ella solo se usa gzip
+    brotli = None
+
+# --------------------------------------------------------------
+# Módulo: http_cache.py
+# --------------------------------------------------------------
+# Utilidades HTTP para los endpoints de lectura:
+# - Validación condicional (ETag / If-None-Match y Last-Modified /
+#   If-Modified-Since) para responder 304 sin recalcular el cuerpo.
+# - Políticas Cache-Control por ruta, configurables desde el .env.
+# - Middleware de compresión gzip/brotli por encima de un tamaño mínimo,
+#   que nunca toca respuestas en streaming (por ejemplo, el chat).
+# --------------------------------------------------------------
+
+# Políticas de caché por tipo de recurso
+CACHE_CONTROL_CATALOG = os.getenv("CACHE_CONTROL_CATALOG", "public, max-age=60, stale-while-revalidate=300")
+CACHE_CONTROL_HISTORY = os.getenv("CACHE_CONTROL_HISTORY", "private, no-cache")
+CACHE_CONTROL_NO_STORE = "no-store"
+
+
+# --------------------------------------------------------------
+# Función: http_date
+# --------------------------------------------------------------
+# Formatea una fecha como HTTP-date (RFC 7231), asumiendo UTC cuando
+# la fecha no tiene zona horaria (caso de SQLite).
+# --------------------------------------------------------------
+def http_date(dt: datetime) -> str:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+
+# --------------------------------------------------------------
+# Función: is_not_modified
+# --------------------------------------------------------------
+# Evalúa las cabeceras condicionales de la petición. Si hay
+# If-None-Match se usa solo el ETag (comparación débil); si no, se
+# compara If-Modified-Since con la fecha de última modificación.
+# --------------------------------------------------------------
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        wanted = etag.removeprefix("W/")
+        return any(tag.strip().removeprefix("W/") == wanted for tag in if_none_match.split(","))
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        # HTTP-date tiene resolución de segundos
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+# --------------------------------------------------------------
+# Función: cache_headers
+# --------------------------------------------------------------
+# Construye las cabeceras de validación y de política de caché.
+# --------------------------------------------------------------
+def cache_headers(etag: str, last_modified: Optional[datetime], cache_control: str) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+# --------------------------------------------------------------
+# Función: conditional
+# --------------------------------------------------------------
+# Punto de uso en los endpoints: agrega las cabeceras a la respuesta y
+# retorna un 304 listo para devolver si el cliente ya tiene la versión
+# actual, o None si hay que generar el cuerpo.
+# --------------------------------------------------------------
+def conditional(
+    request: Request, response: Response, etag: str,
+    last_modified: Optional[datetime], cache_control: str,
+) -> Optional[Response]:
+    headers = cache_headers(etag, last_modified, cache_control)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+# --------------------------------------------------------------
+# Clase: CompressionMiddleware
+# --------------------------------------------------------------
+# Middleware ASGI que comprime con brotli (si está instalado y el
+# cliente lo acepta) o gzip las respuestas de al menos "minimum_size"
+# bytes. No comprime:
+# - respuestas en streaming (varios fragmentos de cuerpo o
+#   Content-Type text/event-stream), para no retrasar el primer byte,
+# - respuestas ya codificadas o sin cuerpo (304, HEAD),
+# - tipos que ya vienen comprimidos (imágenes, etc.).
+# --------------------------------------------------------------
+class CompressionMiddleware:
+    COMPRESSIBLE = ("application/json", "text/", "application/javascript", "application/xml")
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_encoding(self, accept_encoding: str) -> Optional[str]:
+        accepted = {}
+        for part in accept_encoding.lower().split(","):
+            name, _, params = part.strip().partition(";")
+            q = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    q = 0.0
+            accepted[name.strip()] = q
+        if brotli is not None and accepted.get("br", 0) > 0:
+            return "br"
+        if accepted.get("gzip", 0) > 0:
+            return "gzip"
+        return None
+
+    def _compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    # La respuesta depende de Accept-Encoding si su tipo se podría comprimir
+    # (aunque esta vez no se comprima) o si es un 304 de esos recursos
+    def _varies(self, message) -> bool:
+        headers = Headers(raw=message["headers"])
+        if message.get("status") == 304:
+            return True
+        content_type = headers.get("content-type", "")
+        return (
+            "content-encoding" not in headers
+            and not content_type.startswith("text/event-stream")
+            and content_type.startswith(self.COMPRESSIBLE)
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self._choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+
+        start_message = None
+        passthrough = False
+
+        # Todas las respuestas comprimibles llevan "Vary: Accept-Encoding",
+        # también las que se envían sin comprimir: así una caché compartida
+        # no entrega la versión sin comprimir a un cliente que acepta gzip
+        # (ni la comprimida a uno que no lo acepta).
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                if not self._varies(message):
+                    passthrough = True
+                    await send(message)
+                    return
+                MutableHeaders(scope=message).add_vary_header("Accept-Encoding")
+                if encoding is None or message.get("status") == 304:
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message
+                return
+
+            if message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                # Cuerpo en varios fragmentos = streaming: se envía tal cual
+                if message.get("more_body", False) or len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressed = self._compress(body, encoding)
+                headers = MutableHeaders(scope=start_message)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(compressed))
+                await send(start_message)
+                await send({"type": "http.response.body", "body": compressed})
+                return
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
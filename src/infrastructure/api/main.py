@@ -1,12 +1,20 @@
-from fastapi import FastAPI, Depends, HTTPException, APIRouter, Path
+import time
+
+# Marca de inicio para medir el tiempo de arranque en frío (/ops/startup)
+_BOOT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Depends, HTTPException, APIRouter, Header, Path, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timezone
+import asyncio
+import logging
 import os
+import sys
+import zlib
 
 from dotenv import load_dotenv
-import google.generativeai as genai
 
 # --------------------------------------------------------------
 # Este archivo define la API principal del sistema.
@@ -17,25 +25,62 @@ import google.generativeai as genai
 # Carga las variables de entorno desde el archivo .env
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # -------------------- Infraestructura (DB) --------------------
-from src.infrastructure.db.database import Base, engine, get_db
-from src.infrastructure.db.init_data import load_initial_data
+from src.infrastructure.db.database import get_db, SessionLocal
+from src.infrastructure.db.init_db import ensure_schema
+from src.infrastructure.db.retention import retention_job, enable_incremental_vacuum
 
 # -------------------- Repositorios --------------------
-from src.infrastructure.repositories.product_repository import SQLProductRepository
-from src.infrastructure.repositories.chat_repository import SQLChatRepository
+from src.infrastructure.catalog.snapshot import catalog_snapshot
+from src.infrastructure.catalog.similarity import similarity_index, PROMPT_ALTERNATIVES
+from src.infrastructure.repositories.product_repository import stock_stats
+from src.infrastructure.api.dependencies import product_repository, chat_repository
+from src.infrastructure.cache.session_context_cache import session_cache
+from src.infrastructure.cache import idempotency_store as idempotency
+from src.infrastructure.cache.idempotency_store import idempotency_store
+from src.infrastructure.api import websocket_chat
+from src.infrastructure.api.stage_metrics import chat_stage_metrics, server_timing
+from src.infrastructure.chat_writer import chat_writer
+from src.infrastructure.jobs.queue import chat_job_queue, job_payload
+from src.infrastructure.jobs.worker import ChatJobWorker
+from src.infrastructure.jobs.webhooks import WebhookURLError, check_webhook_url
+
+# -------------------- Caché HTTP y compresión --------------------
+from src.infrastructure.api.http_cache import (
+    CompressionMiddleware,
+    conditional,
+    CACHE_CONTROL_CATALOG,
+    CACHE_CONTROL_HISTORY,
+    CACHE_CONTROL_NO_STORE,
+)
 
 # -------------------- Servicio LLM (Gemini) --------------------
-from src.infrastructure.llm_providers.gemini_service import GeminiService
+from src.infrastructure.llm_providers.factory import get_ai_service
+from src.infrastructure.chat_batch import DEFAULT_CONCURRENCY, MAX_BATCH_ITEMS
 
 # -------------------- Capa de Aplicación --------------------
 from src.application.product_service import ProductService
 from src.application.chat_service import ChatService
+from src.domain.exceptions import AIServiceError, ProductNotFoundError, InsufficientStockError, StockBusyError
 from src.application.dtos import (
     ProductDTO,
+    SimilarProductDTO,
+    StockQuantityDTO,
+    StockItemDTO,
+    StockReservationRequestDTO,
+    StockReservationResponseDTO,
+    ProductPatchDTO,
+    ProductBulkRequestDTO,
+    ProductBulkResponseDTO,
     ChatMessageRequestDTO,
     ChatMessageResponseDTO,
     ChatHistoryDTO,
+    ChatBatchRequestDTO,
+    ChatBatchResponseDTO,
+    ChatJobRequestDTO,
+    ChatJobDTO,
 )
 
 # --------------------------------------------------------------
@@ -59,19 +104,138 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --------------------------------------------------------------
+# Compresión gzip/brotli de respuestas grandes
+# (las respuestas en streaming se envían sin comprimir)
+# --------------------------------------------------------------
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+)
+
 
 # --------------------------------------------------------------
 # EVENTOS DE INICIO DE LA APLICACIÓN
 # --------------------------------------------------------------
 @app.on_event("startup")
 def on_startup():
-    # Crea las tablas en la base de datos y carga los datos iniciales (seed)
-    Base.metadata.create_all(bind=engine)
-    db = next(get_db())
+    # Verifica la versión del esquema (una lectura de "PRAGMA user_version").
+    # La creación de tablas y el seed solo se ejecutan si la base de datos
+    # no está inicializada; el comando explícito es:
+    #     python -m src.infrastructure.db.init_db
+    app.state.schema_initialized = ensure_schema()
+    # Regenera el snapshot del catálogo solo si su versión no coincide
+    # con la de la base de datos (normalmente ya está al día)
+    catalog_snapshot.ensure_fresh()
+    app.state.startup_ms = round((time.perf_counter() - _BOOT_STARTED) * 1000, 1)
+    logger.info("API lista en %.1f ms", app.state.startup_ms)
+
+
+# Con WARMUP_ON_STARTUP=true (lo activa serve.py) el worker carga el catálogo,
+# el índice de similares y el cliente de Gemini antes de aceptar conexiones,
+# así las primeras peticiones no pagan esos costos.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true"
+
+
+@app.on_event("startup")
+async def warm_similarity_index():
+    # Construye el índice de productos similares en segundo plano para que
+    # la primera consulta no pague su costo (ni lo sume al arranque)
+    if similarity_index.enabled:
+        app.state.similarity_warmup = asyncio.create_task(asyncio.to_thread(similarity_index.refresh))
+        if WARMUP_ON_STARTUP:
+            await app.state.similarity_warmup
+
+
+def _warm_runtime():
+    db = SessionLocal()
     try:
-        load_initial_data(db)
+        product_repository(db).get_all()
     finally:
         db.close()
+    try:
+        get_ai_service().warm()
+    except Exception:
+        logger.exception("No se pudo inicializar el cliente de IA durante el arranque")
+
+
+@app.on_event("startup")
+async def warm_runtime():
+    if WARMUP_ON_STARTUP:
+        started = time.perf_counter()
+        await asyncio.to_thread(_warm_runtime)
+        logger.info("Catálogo y cliente de IA cargados en %.1f ms", (time.perf_counter() - started) * 1000)
+
+
+# --------------------------------------------------------------
+# TAREA DE RETENCIÓN DEL HISTORIAL DE CHAT (segundo plano)
+# --------------------------------------------------------------
+# Si CHAT_RETENTION_ENABLED=true, archiva y depura "chat_memory"
+# cada CHAT_RETENTION_INTERVAL_SECONDS segundos. La ejecución corre
+# en un hilo para no bloquear el event loop. Con varios workers solo la
+# ejecuta el que tiene el bloqueo de CHAT_RETENTION_LOCK; los demás
+# vuelven a intentarlo en cada periodo por si ese proceso muere.
+async def _retention_loop():
+    while True:
+        if retention_job.acquire_leadership():
+            await asyncio.to_thread(retention_job.run_once)
+        await asyncio.sleep(retention_job.config.interval_seconds)
+
+
+@app.on_event("startup")
+async def start_retention_job():
+    if retention_job.config.enabled:
+        app.state.retention_task = asyncio.create_task(_retention_loop())
+        logger.info("Retención de chat activada (TTL=%s días)", retention_job.config.ttl_days)
+
+
+@app.on_event("shutdown")
+async def stop_retention_job():
+    task = getattr(app.state, "retention_task", None)
+    if task:
+        task.cancel()
+        retention_job.release_leadership()
+
+
+@app.on_event("shutdown")
+def flush_catalog_snapshot():
+    # Publica el snapshot si quedó una publicación diferida (reservas de stock)
+    catalog_snapshot.flush()
+
+
+@app.on_event("startup")
+async def start_inprocess_job_worker():
+    # Opcional: consume la cola de trabajos dentro de este proceso (útil con
+    # un solo contenedor). En producción se usan procesos de worker aparte.
+    concurrency = int(os.getenv("CHAT_JOBS_INPROCESS_CONCURRENCY", "0"))
+    if concurrency > 0:
+        worker = ChatJobWorker(chat_job_queue, concurrency=concurrency)
+        app.state.job_worker = worker
+        app.state.job_worker_task = asyncio.create_task(worker.run())
+
+
+@app.on_event("shutdown")
+async def stop_inprocess_job_worker():
+    worker = getattr(app.state, "job_worker", None)
+    if worker:
+        worker.stop()
+        await app.state.job_worker_task
+
+
+@app.on_event("startup")
+def recover_chat_writes():
+    # Reinserta los mensajes que no se pudieron guardar en la ejecución anterior.
+    # Con serve.py ya lo hizo el proceso principal y aquí no queda nada.
+    try:
+        chat_writer.recover()
+    except Exception:
+        logger.exception("No se pudieron recuperar los mensajes de chat pendientes")
+
+
+@app.on_event("shutdown")
+async def flush_chat_writes():
+    # Espera las escrituras pendientes de /chat y de los turnos por WebSocket
+    await chat_writer.flush()
 
 
 # --------------------------------------------------------------
@@ -92,46 +256,295 @@ def health():
 # --------------------------------------------------------------
 # ENDPOINTS DE PRODUCTOS
 # --------------------------------------------------------------
+# Fecha de última modificación considerando también los cambios de stock
+def _latest(*dates: Optional[datetime]) -> Optional[datetime]:
+    known = [d if d.tzinfo else d.replace(tzinfo=timezone.utc) for d in dates if d is not None]
+    return max(known) if known else None
+
+
 @app.get("/products", response_model=List[ProductDTO], tags=["products"])
-def list_products(db: Session = Depends(get_db)):
-    # Retorna la lista completa de productos desde el repositorio SQL
-    service = ProductService(SQLProductRepository(db))
+def list_products(request: Request, response: Response, db: Session = Depends(get_db)):
+    # Retorna la lista completa de productos desde el repositorio SQL.
+    # Si el cliente ya tiene la versión actual del catálogo (y del stock,
+    # que también viene en la lista) responde 304.
+    service = ProductService(product_repository(db))
+    version, updated_at = service.get_catalog_version()
+    stock_version, stock_updated_at = service.get_stock_version()
+    not_modified = conditional(request, response, f'W/"catalog-{version}-{stock_version}"',
+                               _latest(updated_at, stock_updated_at), CACHE_CONTROL_CATALOG)
+    if not_modified:
+        return not_modified
     return service.get_all_products()
 
 
 @app.get("/products/{product_id}", response_model=ProductDTO, tags=["products"])
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    # Retorna un producto específico según su ID
-    service = ProductService(SQLProductRepository(db))
+def get_product(product_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    # Retorna un producto específico según su ID. El ETag incluye su
+    # propio stock, así las reservas de otros productos no lo invalidan.
+    service = ProductService(product_repository(db))
     try:
-        return service.get_product_by_id(product_id)
+        product = service.get_product_by_id(product_id)
     except Exception as e:
         # Si no se encuentra el producto, devuelve error 404
         raise HTTPException(status_code=404, detail=str(e))
+    version, updated_at = service.get_catalog_version()
+    _, stock_updated_at = service.get_stock_version()
+    not_modified = conditional(
+        request, response, f'W/"product-{product_id}-{version}-{product.stock}"',
+        _latest(updated_at, stock_updated_at), CACHE_CONTROL_CATALOG,
+    )
+    if not_modified:
+        return not_modified
+    return product
+
+
+@app.get("/products/{product_id}/similar", response_model=List[SimilarProductDTO], tags=["products"])
+def similar_products(product_id: int, request: Request, response: Response,
+                     k: int = Query(5, ge=1, le=50), in_stock: bool = False,
+                     db: Session = Depends(get_db)):
+    # Retorna los "k" productos más parecidos (marca, categoría, talla, color,
+    # precio y descripción) según el índice de similitud del catálogo.
+    # Con in_stock=true solo se sugieren productos con stock.
+    # El resultado sale del índice memorizado, así que se calcula antes de
+    # validar: el ETag incluye el id y el stock de cada sugerencia, y las
+    # reservas de otros productos no lo invalidan.
+    service = ProductService(product_repository(db), similarity_index)
+    try:
+        products = service.get_similar_products(product_id, k, in_stock)
+    except ProductNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    version, updated_at = service.get_catalog_version()
+    _, stock_updated_at = service.get_stock_version()
+    digest = zlib.crc32(",".join(f"{p.id}:{p.stock}" for p in products).encode())
+    not_modified = conditional(
+        request, response, f'W/"similar-{product_id}-{k}-{int(in_stock)}-{version}-{digest:08x}"',
+        _latest(updated_at, stock_updated_at), CACHE_CONTROL_CATALOG,
+    )
+    if not_modified:
+        return not_modified
+    return products
+
+
+# --------------------------------------------------------------
+# ENDPOINTS DE ACTUALIZACIÓN DE PRODUCTOS
+# --------------------------------------------------------------
+# Pensados para el sistema de mercadería que envía precios y stock de
+# miles de productos a la vez: cada lote se aplica con una sentencia
+# UPDATE por bloque y una sola transacción, y la versión del catálogo
+# sube una vez por lote.
+PRODUCT_BULK_MAX_ITEMS = int(os.getenv("PRODUCT_BULK_MAX_ITEMS", "10000"))
+
+
+@app.patch("/products", response_model=ProductBulkResponseDTO, tags=["products"])
+def patch_products(payload: ProductBulkRequestDTO, response: Response, db: Session = Depends(get_db)):
+    # Actualiza (o crea) varios productos; retorna el resultado de cada elemento
+    if len(payload.items) > PRODUCT_BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"El lote supera el máximo de {PRODUCT_BULK_MAX_ITEMS} productos")
+    response.headers["Cache-Control"] = CACHE_CONTROL_NO_STORE
+    return ProductService(product_repository(db)).bulk_upsert(payload.items)
+
+
+@app.patch("/products/{product_id}", response_model=ProductDTO, tags=["products"])
+def patch_product(product_id: int, payload: ProductPatchDTO, response: Response, db: Session = Depends(get_db)):
+    # Cambia solo los campos enviados de un producto y retorna el producto actualizado
+    service = ProductService(product_repository(db))
+    result = service.bulk_upsert([payload.model_copy(update={"id": product_id})]).items[0]
+    if result.status == "invalid":
+        raise HTTPException(status_code=422, detail=result.error)
+    if result.status == "not_found":
+        raise HTTPException(status_code=404, detail=f"Producto {product_id} no encontrado")
+    response.headers["Cache-Control"] = CACHE_CONTROL_NO_STORE
+    return service.get_product_by_id(product_id)
+
+
+# --------------------------------------------------------------
+# ENDPOINTS DE RESERVA DE STOCK
+# --------------------------------------------------------------
+# Cada reserva es un UPDATE condicional en la base de datos: nunca se
+# vende más stock del disponible aunque lleguen compras simultáneas.
+# - 404: algún producto no existe
+# - 409: stock insuficiente (no se reserva ningún producto)
+# - 503: la base de datos siguió ocupada tras los reintentos
+def _apply_stock(db: Session, items: List[StockItemDTO], reserve: bool) -> StockReservationResponseDTO:
+    service = ProductService(product_repository(db))
+    try:
+        return service.reserve_stock(items) if reserve else service.release_stock(items)
+    except ProductNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except InsufficientStockError as e:
+        raise HTTPException(status_code=409, detail={
+            "message": str(e),
+            "product_id": e.product_id,
+            "requested": e.requested,
+            "available": e.available,
+        })
+    except StockBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
+@app.post("/products/reserve", response_model=StockReservationResponseDTO, tags=["stock"])
+def reserve_many(payload: StockReservationRequestDTO, response: Response, db: Session = Depends(get_db)):
+    # Reserva varios productos en una sola transacción (todos o ninguno)
+    response.headers["Cache-Control"] = CACHE_CONTROL_NO_STORE
+    return _apply_stock(db, payload.items, reserve=True)
+
+
+@app.post("/products/release", response_model=StockReservationResponseDTO, tags=["stock"])
+def release_many(payload: StockReservationRequestDTO, response: Response, db: Session = Depends(get_db)):
+    # Libera varios productos en una sola transacción
+    response.headers["Cache-Control"] = CACHE_CONTROL_NO_STORE
+    return _apply_stock(db, payload.items, reserve=False)
+
+
+@app.post("/products/{product_id}/reserve", response_model=StockReservationResponseDTO, tags=["stock"])
+def reserve_one(product_id: int, response: Response, payload: StockQuantityDTO = StockQuantityDTO(),
+                db: Session = Depends(get_db)):
+    # Reserva "quantity" unidades de un producto (1 por defecto)
+    response.headers["Cache-Control"] = CACHE_CONTROL_NO_STORE
+    return _apply_stock(db, [StockItemDTO(product_id=product_id, quantity=payload.quantity)], reserve=True)
+
+
+@app.post("/products/{product_id}/release", response_model=StockReservationResponseDTO, tags=["stock"])
+def release_one(product_id: int, response: Response, payload: StockQuantityDTO = StockQuantityDTO(),
+                db: Session = Depends(get_db)):
+    # Devuelve "quantity" unidades de un producto al stock
+    response.headers["Cache-Control"] = CACHE_CONTROL_NO_STORE
+    return _apply_stock(db, [StockItemDTO(product_id=product_id, quantity=payload.quantity)], reserve=False)
 
 
 # --------------------------------------------------------------
 # ENDPOINTS DE CHAT CON IA
 # --------------------------------------------------------------
 @app.post("/chat", response_model=ChatMessageResponseDTO, tags=["chat"])
-async def chat_endpoint(payload: ChatMessageRequestDTO, db: Session = Depends(get_db)):
-    # Procesa un mensaje enviado por el usuario al asistente IA (Gemini)
-    product_repo = SQLProductRepository(db)
-    chat_repo = SQLChatRepository(db)
-    ai = GeminiService()  # Toma la clave API de GEMINI_API_KEY o GOOGLE_API_KEY
-    chat_service = ChatService(product_repo, chat_repo, ai)
-
+async def chat_endpoint(payload: ChatMessageRequestDTO, response: Response,
+                        db: Session = Depends(get_db),
+                        chat_db: Session = Depends(get_db, use_cache=False),
+                        idempotency_key: Optional[str] = Header(None, max_length=100)):
+    # Procesa un mensaje enviado por el usuario al asistente IA (Gemini).
+    # El catálogo y el historial se leen en paralelo, cada uno con su propia
+    # sesión de BD; la respuesta del asistente se guarda en segundo plano.
+    # Con la cabecera Idempotency-Key (por session_id) los reintentos
+    # reciben la respuesta de la primera petición sin llamar al modelo.
+    # En ese caso un fallo del modelo responde 503 (y libera la clave) en
+    # lugar de guardar el texto de disculpa como respuesta definitiva, y el
+    # mensaje del usuario se guarda con la fecha del primer intento: el
+    # reintento reconoce el que ya guardó el intento fallido (como los
+    # reintentos de la cola de trabajos) en lugar de duplicarlo.
+    started = time.perf_counter()
+    response.headers["Cache-Control"] = CACHE_CONTROL_NO_STORE
+
+    token = None
+    if idempotency_key:
+        outcome, stored = await idempotency_store.acquire(
+            payload.session_id, idempotency_key, idempotency.fingerprint(payload.message)
+        )
+        if outcome == idempotency.DONE:
+            response.headers["Idempotent-Replayed"] = "true"
+            return stored
+        if outcome == idempotency.CONFLICT:
+            raise HTTPException(status_code=422, detail="Idempotency-Key ya usada con otro mensaje en esta sesión")
+        if outcome == idempotency.PENDING:
+            raise HTTPException(status_code=409, detail="La petición original con esta Idempotency-Key sigue en curso",
+                                headers={"Retry-After": "1"})
+        token = stored
+
+    product_repo = product_repository(db)
+    chat_repo = chat_repository(chat_db)
+    completed = False
     try:
-        return await chat_service.process_message(payload)
+        ai = get_ai_service()  # Instancia compartida (GEMINI_API_KEY o GOOGLE_API_KEY)
+        chat_service = ChatService(product_repo, chat_repo, ai, writer=chat_writer,
+                                   similarity=similarity_index, alternatives_per_product=PROMPT_ALTERNATIVES)
+        if token is not None:
+            result = await chat_service.process_message(
+                payload, raise_model_errors=True, resume=True,
+                user_timestamp=idempotency_store.first_attempt(payload.session_id, idempotency_key),
+            )
+        else:
+            result = await chat_service.process_message(payload)
+        if token is not None:
+            await idempotency_store.complete(payload.session_id, idempotency_key, token,
+                                             result.model_dump(mode="json"))
+        completed = True
+    except AIServiceError as e:
+        raise HTTPException(status_code=503, detail=f"Gemini/Chat error: {e}", headers={"Retry-After": "5"})
     except Exception as e:
         # Si hay un error con el modelo, la clave o la cuota, devuelve error 500
         raise HTTPException(status_code=500, detail=f"Gemini/Chat error: {e}")
+    finally:
+        # Sin respuesta (error o cliente desconectado) la clave se libera
+        # para que el siguiente reintento vuelva a intentarlo
+        if token is not None and not completed:
+            await idempotency_store.abandon(payload.session_id, idempotency_key, token)
+
+    total_ms = (time.perf_counter() - started) * 1000
+    chat_stage_metrics.record(chat_service.last_timings, total_ms)
+    response.headers["Server-Timing"] = server_timing(chat_service.last_timings, total_ms)
+    return result
+
+
+@app.post("/chat/batch", response_model=ChatBatchResponseDTO, tags=["chat"])
+async def chat_batch_endpoint(payload: ChatBatchRequestDTO, response: Response, db: Session = Depends(get_db)):
+    # Procesa muchos mensajes en una sola petición: carga el catálogo una vez,
+    # llama al modelo con concurrencia acotada (en orden dentro de cada sesión)
+    # y guarda todos los turnos en una sola escritura.
+    response.headers["Cache-Control"] = CACHE_CONTROL_NO_STORE
+    if len(payload.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"El lote supera el máximo de {MAX_BATCH_ITEMS} mensajes")
+
+    try:
+        chat_service = ChatService(product_repository(db), chat_repository(db), get_ai_service(),
+                                   similarity=similarity_index, alternatives_per_product=PROMPT_ALTERNATIVES)
+        return await chat_service.process_batch(payload.items, payload.max_concurrency or DEFAULT_CONCURRENCY)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gemini/Chat error: {e}")
+
+
+# --------------------------------------------------------------
+# MODO DE TRABAJOS (chat asíncrono)
+# --------------------------------------------------------------
+# POST /chat/jobs guarda el mensaje en la cola persistente y responde de
+# inmediato con el id del trabajo; los workers
+# (python -m src.infrastructure.jobs.worker) llaman al modelo. El cliente
+# consulta GET /chat/jobs/{job_id} o recibe el resultado en su webhook.
+# El webhook debe apuntar a un host público o de CHAT_JOB_WEBHOOK_HOSTS.
+@app.post("/chat/jobs", response_model=ChatJobDTO, status_code=202, tags=["chat"])
+def create_chat_job(payload: ChatJobRequestDTO, request: Request, response: Response):
+    if payload.webhook_url is not None:
+        try:
+            check_webhook_url(payload.webhook_url)
+        except WebhookURLError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    job_id = chat_job_queue.enqueue(payload.session_id, payload.message, payload.webhook_url)
+    response.headers["Cache-Control"] = CACHE_CONTROL_NO_STORE
+    response.headers["Location"] = str(request.url_for("get_chat_job", job_id=job_id))
+    return job_payload(chat_job_queue.get(job_id))
+
+
+@app.get("/chat/jobs/{job_id}", response_model=ChatJobDTO, tags=["chat"])
+def get_chat_job(job_id: str, response: Response):
+    job = chat_job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado")
+    response.headers["Cache-Control"] = CACHE_CONTROL_NO_STORE
+    if job.status in ("queued", "running"):
+        # Sugerencia de espera para el siguiente sondeo
+        response.headers["Retry-After"] = "1"
+    return job_payload(job)
 
 
 @app.get("/chat/history/{session_id}", response_model=List[ChatHistoryDTO], tags=["chat"])
-def history(session_id: str, limit: int = 10, db: Session = Depends(get_db)):
-    # Obtiene el historial de una sesión de chat específica
-    chat_repo = SQLChatRepository(db)
+def history(session_id: str, request: Request, response: Response,
+            limit: int = 10, db: Session = Depends(get_db)):
+    # Obtiene el historial de una sesión de chat específica.
+    # El ETag se deriva de los ids de los mensajes de la sesión, así que
+    # cambia con cada mensaje nuevo o eliminado.
+    chat_repo = chat_repository(db)
+    count, first_id, last_id, last_at = chat_repo.get_session_version(session_id)
+    etag = f'W/"history-{count}-{first_id or 0}-{last_id or 0}-{limit}"'
+    not_modified = conditional(request, response, etag, last_at, CACHE_CONTROL_HISTORY)
+    if not_modified:
+        return not_modified
     items = chat_repo.get_session_history(session_id, limit)
     return [ChatHistoryDTO.model_validate(i) for i in items]
 
@@ -140,7 +553,7 @@ def history(session_id: str, limit: int = 10, db: Session = Depends(get_db)):
 def clear_history(session_id: str = Path(..., description="ID de la sesión a limpiar"),
                   db: Session = Depends(get_db)):
     # Elimina todos los mensajes asociados a una sesión de chat
-    chat_repo = SQLChatRepository(db)
+    chat_repo = chat_repository(db)
     deleted = chat_repo.delete_session_history(session_id)
     return {"session_id": session_id, "deleted_messages": deleted}
 
@@ -163,6 +576,9 @@ def list_models():
         )
 
     # Configura la librería del SDK antes de consultar los modelos
+    # (se importa aquí para no cargar el SDK durante el arranque)
+    import google.generativeai as genai
+
     genai.configure(api_key=api_key)
 
     # Obtiene la lista de modelos disponibles para la API Key actual
@@ -181,3 +597,112 @@ def list_models():
 
 # Se incluye el router de IA dentro de la aplicación principal
 app.include_router(ai_router)
+
+# Canal de chat por WebSocket (/ws/chat/{session_id})
+app.include_router(websocket_chat.router)
+
+
+# --------------------------------------------------------------
+# ENDPOINTS DE OPERACIÓN (MÉTRICAS INTERNAS)
+# --------------------------------------------------------------
+ops_router = APIRouter(prefix="/ops", tags=["ops"])
+
+
+@ops_router.get("/startup")
+def startup_stats():
+    # Tiempo transcurrido desde la importación de este módulo hasta que
+    # terminó el evento de inicio, y si fue necesario inicializar la BD
+    return {
+        "startup_ms": getattr(app.state, "startup_ms", None),
+        "schema_initialized": getattr(app.state, "schema_initialized", None),
+        "gemini_sdk_loaded": "google.generativeai" in sys.modules,
+    }
+
+
+@ops_router.get("/session-cache")
+def session_cache_stats():
+    # Tamaño y tasa de aciertos de la caché de contextos de sesión
+    return session_cache.stats()
+
+
+@ops_router.get("/chat-stages")
+def chat_stage_stats():
+    # Duración promedio y máxima de cada etapa de POST /chat, y las
+    # escrituras en segundo plano pendientes o fallidas
+    return {"stages": chat_stage_metrics.as_dict(), "writer": chat_writer.stats()}
+
+
+@ops_router.get("/llm-pool")
+def llm_pool_stats():
+    # Uso de cada clave/modelo del pool de Gemini (si hay varias claves configuradas)
+    try:
+        pool = getattr(get_ai_service(), "pool", None)
+    except ValueError:  # sin API key configurada
+        pool = None
+    return pool.stats() if pool else {"entries": []}
+
+
+@ops_router.get("/idempotency")
+def idempotency_stats():
+    # Respuestas de /chat guardadas y reintentos resueltos sin llamar al modelo
+    return idempotency_store.stats()
+
+
+@ops_router.get("/chat-jobs")
+def chat_job_stats():
+    # Trabajos de chat por estado (cola compartida por todos los workers)
+    return chat_job_queue.counts()
+
+
+@ops_router.get("/stock")
+def stock_contention_stats():
+    # Reservas, rechazos por stock insuficiente y contención del bloqueo
+    # de escritura de SQLite en este worker
+    return stock_stats.as_dict()
+
+
+@ops_router.get("/similarity")
+def similarity_stats():
+    # Tamaño del índice de productos similares y filas recalculadas
+    return similarity_index.stats()
+
+
+@ops_router.get("/websocket")
+def websocket_stats():
+    # Conexiones WebSocket abiertas en este worker y escrituras pendientes
+    return websocket_chat.ws_stats()
+
+
+@ops_router.get("/retention")
+def retention_stats():
+    # Estadísticas de la tarea de retención: filas archivadas/borradas
+    # y espacio recuperado en el archivo SQLite
+    cfg = retention_job.config
+    return {
+        "enabled": cfg.enabled,
+        "ttl_days": cfg.ttl_days,
+        "max_messages_per_session": cfg.max_messages_per_session,
+        "archive_dir": cfg.archive_dir,
+        # Si este worker es el que ejecuta la tarea periódica
+        "leader": retention_job.is_leader,
+        "stats": retention_job.stats.as_dict(),
+    }
+
+
+@ops_router.post("/retention/run")
+async def retention_run():
+    # Fuerza una ejecución inmediata de la tarea de retención
+    summary = await asyncio.to_thread(retention_job.run_once)
+    return {"summary": summary, "stats": retention_job.stats.as_dict()}
+
+
+@ops_router.post("/retention/enable-incremental-vacuum")
+async def retention_enable_incremental_vacuum():
+    # Mantenimiento único: convierte la base a auto_vacuum=INCREMENTAL con
+    # un VACUUM completo (bloquea la base mientras dura; usar en una
+    # ventana de mantenimiento)
+    converted = await asyncio.to_thread(enable_incremental_vacuum)
+    return {"converted": converted}
+
+
+app.include_router(ops_router)
@@ -0,0 +1,135 @@
+import argparse
+import importlib.util
+import logging
+import math
+import os
+import sys
+
+from dotenv import load_dotenv
+
+# --------------------------------------------------------------
+# Módulo: serve.py
+# --------------------------------------------------------------
+# Punto de entrada de producción de la API (lo usa el Dockerfile).
+#
+# - Lanza un worker de uvicorn por CPU disponible (respeta la afinidad
+#   del proceso y el límite de CPU del contenedor).
+# - Usa uvloop y httptools si están instalados.
+# - Prepara el esquema y el snapshot del catálogo una sola vez antes de
+#   lanzar los workers; cada worker además carga el catálogo, el índice
+#   de similares y el cliente de Gemini antes de aceptar conexiones
+#   (WARMUP_ON_STARTUP).
+# - Limita keep-alive, conexiones simultáneas y backlog.
+# - Con SIGTERM deja de aceptar conexiones, espera hasta
+#   SERVE_GRACEFUL_TIMEOUT_SECONDS a que terminen las peticiones en curso
+#   (incluidas las llamadas a Gemini) y luego ejecuta los eventos de
+#   cierre: se guardan las escrituras de chat pendientes y se publica el
+#   snapshot del catálogo.
+#
+# Uso:
+#     python -m src.infrastructure.api.serve [--workers 4] [--port 8000]
+# --------------------------------------------------------------
+
+APP = "src.infrastructure.api.main:app"
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------------------------------------------------
+# Función: available_cpus
+# --------------------------------------------------------------
+# CPUs que este proceso puede usar: las de su afinidad, acotadas por la
+# cuota de CPU del cgroup (docker --cpus) si existe.
+# --------------------------------------------------------------
+def available_cpus() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS / Windows
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as fh:
+            quota, period = fh.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def _has(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+# --------------------------------------------------------------
+# Función: preload
+# --------------------------------------------------------------
+# Deja la base de datos y el snapshot del catálogo al día en el proceso
+# principal, para que los workers no compitan por inicializarlos, y
+# reinserta una sola vez los mensajes de chat que quedaron pendientes.
+# --------------------------------------------------------------
+def preload() -> None:
+    from src.infrastructure.db.init_db import ensure_schema
+    from src.infrastructure.catalog.snapshot import catalog_snapshot
+    from src.infrastructure.chat_writer import chat_writer
+
+    ensure_schema()
+    catalog_snapshot.ensure_fresh()
+    chat_writer.recover()
+
+
+def main(argv=None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Servidor de producción de la API")
+    parser.add_argument("--host", default=os.getenv("SERVE_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int("SERVE_PORT", 8000))
+    parser.add_argument("--workers", type=int, default=_env_int("SERVE_WORKERS", 0) or available_cpus())
+    parser.add_argument("--keep-alive", type=int, default=_env_int("SERVE_KEEPALIVE_SECONDS", 15),
+                        help="Segundos que se mantiene abierta una conexión inactiva")
+    parser.add_argument("--limit-concurrency", type=int, default=_env_int("SERVE_LIMIT_CONCURRENCY", 512),
+                        help="Conexiones simultáneas por worker antes de responder 503 (0 = sin límite)")
+    parser.add_argument("--backlog", type=int, default=_env_int("SERVE_BACKLOG", 2048))
+    parser.add_argument("--graceful-timeout", type=int, default=_env_int("SERVE_GRACEFUL_TIMEOUT_SECONDS", 30),
+                        help="Segundos de espera de las peticiones en curso al recibir SIGTERM")
+    parser.add_argument("--log-level", default=os.getenv("SERVE_LOG_LEVEL", "info"))
+    parser.add_argument("--access-log", action="store_true",
+                        default=os.getenv("SERVE_ACCESS_LOG", "false").lower() == "true")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    workers = max(1, args.workers)
+    loop = "uvloop" if _has("uvloop") else "asyncio"
+    http = "httptools" if _has("httptools") else "h11"
+
+    # Los workers heredan estas variables (se respetan las definidas en .env)
+    os.environ.setdefault("WARMUP_ON_STARTUP", "true")
+    # Cada worker usa 1/N de los límites por minuto del pool de Gemini
+    os.environ.setdefault("GEMINI_POOL_WORKERS", str(workers))
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+    preload()
+    logger.info("Iniciando %s workers (loop=%s, http=%s) en %s:%s", workers, loop, http, args.host, args.port)
+
+    uvicorn.run(
+        APP,
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        timeout_keep_alive=args.keep_alive,
+        limit_concurrency=args.limit_concurrency or None,
+        backlog=args.backlog,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+        access_log=args.access_log,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import threading
+from typing import Dict
+
+# --------------------------------------------------------------
+# Módulo: stage_metrics.py
+# --------------------------------------------------------------
+# Acumula las duraciones por etapa del flujo de POST /chat (lectura del
+# catálogo e historial, llamada al modelo, guardado) para /ops/chat-stages,
+# y arma la cabecera "Server-Timing" de cada respuesta.
+#
+# "overhead" es el tiempo total de la petición menos la llamada al
+# modelo: con las etapas en paralelo debería mantenerse en pocos ms.
+# --------------------------------------------------------------
+
+
+class StageMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._count: Dict[str, int] = {}
+        self._total: Dict[str, float] = {}
+        self._max: Dict[str, float] = {}
+
+    def record(self, timings: Dict[str, float], total_ms: float) -> None:
+        values = dict(timings, total=total_ms, overhead=max(0.0, total_ms - timings.get("llm", 0.0)))
+        with self._lock:
+            for name, ms in values.items():
+                self._count[name] = self._count.get(name, 0) + 1
+                self._total[name] = self._total.get(name, 0.0) + ms
+                self._max[name] = max(self._max.get(name, 0.0), ms)
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {
+                    "count": n,
+                    "avg_ms": round(self._total[name] / n, 3),
+                    "max_ms": round(self._max[name], 3),
+                }
+                for name, n in self._count.items()
+            }
+
+
+# Cabecera Server-Timing (visible en las herramientas de desarrollo del navegador)
+def server_timing(timings: Dict[str, float], total_ms: float) -> str:
+    parts = [f"{name.replace('_', '-')};dur={ms:.1f}" for name, ms in timings.items()]
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+chat_stage_metrics = StageMetrics()
@@ -0,0 +1,95 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+# --------------------------------------------------------------
+# Módulo: startup_report.py
+# --------------------------------------------------------------
+# Herramienta para medir el tiempo de arranque en frío de la API.
+# Importa la aplicación en un proceso nuevo con "python -X importtime"
+# y muestra el tiempo de importación por módulo, ordenado de mayor a
+# menor, comparando el total contra un objetivo (COLD_START_TARGET_MS).
+#
+# Uso:
+#     python -m src.infrastructure.api.startup_report [--top 20] [--target-ms 1500]
+#
+# Devuelve código de salida 1 si el arranque supera el objetivo, para
+# poder usarlo como verificación en CI.
+# --------------------------------------------------------------
+
+APP_MODULE = "src.infrastructure.api.main"
+
+
+# --------------------------------------------------------------
+# Función: measure_imports
+# --------------------------------------------------------------
+# Ejecuta la importación de la app en un subproceso y devuelve:
+# - la lista (módulo, propio_us, acumulado_us, profundidad)
+# - el tiempo total de pared en milisegundos.
+# --------------------------------------------------------------
+def measure_imports(module: str = APP_MODULE) -> Tuple[List[Tuple[str, int, int, int]], float]:
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        # Formato: "import time:   self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # El nombre viene indentado con dos espacios por nivel de anidamiento
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows, wall_ms
+
+
+# --------------------------------------------------------------
+# Función: main
+# --------------------------------------------------------------
+# Imprime el reporte: módulos de primer nivel con mayor tiempo
+# acumulado y el total frente al objetivo.
+# --------------------------------------------------------------
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reporte de tiempo de arranque de la API")
+    parser.add_argument("--module", default=APP_MODULE)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--target-ms", type=float, default=float(os.getenv("COLD_START_TARGET_MS", "1500")))
+    args = parser.parse_args(argv)
+
+    rows, wall_ms = measure_imports(args.module)
+    app_row = next((r for r in rows if r[0] == args.module), None)
+    import_ms = app_row[2] / 1000 if app_row else wall_ms
+
+    # Se listan los módulos hijos directos de cada paquete del proyecto
+    # y de las dependencias de primer nivel (profundidad <= 1).
+    top_level = sorted((r for r in rows if r[3] <= 1), key=lambda r: r[2], reverse=True)
+
+    print(f"{'módulo':<55} {'propio ms':>10} {'acumulado ms':>13}")
+    print("-" * 80)
+    for name, self_us, cumulative_us, _ in top_level[: args.top]:
+        print(f"{name:<55} {self_us / 1000:>10.1f} {cumulative_us / 1000:>13.1f}")
+    print("-" * 80)
+    print(f"Importación de {args.module}: {import_ms:.1f} ms (proceso completo: {wall_ms:.1f} ms)")
+    print(f"Objetivo: {args.target_ms:.0f} ms")
+
+    if import_ms > args.target_ms:
+        print("RESULTADO: el arranque supera el objetivo")
+        return 1
+    print("RESULTADO: dentro del objetivo")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
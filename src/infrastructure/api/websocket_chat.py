@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import aclosing
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from src.application.reply_streamer import ReplyStreamer
+from src.domain.entities import ChatContext, ChatMessage
+from src.infrastructure.api.dependencies import product_repository, chat_repository
+from src.infrastructure.catalog.similarity import similarity_index, PROMPT_ALTERNATIVES
+from src.infrastructure.chat_writer import chat_writer
+from src.infrastructure.db.database import SessionLocal
+from src.infrastructure.llm_providers.factory import get_ai_service
+
+# --------------------------------------------------------------
+# Módulo: websocket_chat.py
+# --------------------------------------------------------------
+# Canal de chat por WebSocket para el widget web, que mantiene la
+# conversación abierta durante minutos.
+#
+# A diferencia de POST /chat, el contexto de la sesión se lee de la base
+# de datos una sola vez al conectar y luego se mantiene en memoria,
+# actualizándose con cada turno. La respuesta del asistente se envía en
+# fragmentos a medida que el modelo la genera, y los mensajes se guardan
+# en segundo plano sin demorar el siguiente turno.
+#
+# Protocolo (JSON):
+#   cliente  → {"message": "..."}        (también se acepta texto plano)
+#   servidor → {"type": "start"}
+#              {"type": "delta", "text": "..."}   (uno o más)
+#              {"type": "done", "assistant_message": "...", "timestamp": "..."}
+#              {"type": "error", "detail": "..."}
+#
+# Para que miles de sockets abiertos por worker sigan siendo baratos:
+# - cada conexión solo guarda los últimos mensajes del contexto,
+# - se procesa un turno a la vez por conexión (si el cliente envía más
+#   rápido de lo que se responde, los mensajes esperan en el socket),
+# - los envíos tienen tiempo límite: un cliente que no lee se desconecta,
+# - entre el modelo y el socket se guardan como máximo
+#   WS_STREAM_BUFFER_CHUNKS fragmentos, y si el cliente se desconecta se
+#   corta el stream del modelo,
+# - si el modelo falla a mitad de la respuesta se envía "error" y el
+#   turno no se guarda,
+# - las conexiones inactivas se cierran tras WS_IDLE_TIMEOUT_SECONDS,
+# - hay un máximo de conexiones simultáneas por worker.
+# --------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "300"))
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "5000"))
+WS_MAX_MESSAGE_CHARS = int(os.getenv("WS_MAX_MESSAGE_CHARS", "4000"))
+WS_STREAM_BUFFER = int(os.getenv("WS_STREAM_BUFFER_CHUNKS", "32"))
+CONTEXT_MESSAGES = 6
+
+router = APIRouter(tags=["chat"])
+
+# Estado del worker: conexiones abiertas
+_active_connections = 0
+
+
+# --------------------------------------------------------------
+# Función: ws_stats
+# --------------------------------------------------------------
+# Métricas del canal WebSocket para /ops/websocket.
+# --------------------------------------------------------------
+def ws_stats() -> dict:
+    return {
+        "active_connections": _active_connections,
+        "max_connections": WS_MAX_CONNECTIONS,
+        "pending_writes": chat_writer.stats()["pending_writes"],
+        "write_errors": chat_writer.stats()["write_errors"],
+        "idle_timeout_seconds": WS_IDLE_TIMEOUT_SECONDS,
+    }
+
+
+# --------------------------------------------------------------
+# Funciones de acceso a datos (se ejecutan en hilos)
+# --------------------------------------------------------------
+# Cada una abre y cierra su propia sesión de BD: la conexión WebSocket
+# no retiene una sesión mientras está inactiva.
+def _load_history(session_id: str) -> List[ChatMessage]:
+    db = SessionLocal()
+    try:
+        return chat_repository(db).get_recent_messages(session_id, CONTEXT_MESSAGES)
+    finally:
+        db.close()
+
+
+def _load_products() -> list:
+    db = SessionLocal()
+    try:
+        return product_repository(db).get_all()
+    finally:
+        db.close()
+
+
+def _parse_message(raw: str) -> str:
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return raw.strip()
+    if isinstance(data, dict):
+        return str(data.get("message", "")).strip()
+    return str(data).strip()
+
+
+# --------------------------------------------------------------
+# Endpoint: /ws/chat/{session_id}
+# --------------------------------------------------------------
+@router.websocket("/ws/chat/{session_id}")
+async def chat_socket(websocket: WebSocket, session_id: str):
+    global _active_connections
+    if not session_id.strip() or _active_connections >= WS_MAX_CONNECTIONS:
+        # 1013 = "Try Again Later"
+        await websocket.close(code=1013)
+        return
+
+    await websocket.accept()
+    _active_connections += 1
+
+    async def send(payload: dict):
+        await asyncio.wait_for(websocket.send_json(payload), timeout=WS_SEND_TIMEOUT_SECONDS)
+
+    try:
+        # El contexto se carga una sola vez por conexión
+        history = await asyncio.to_thread(_load_history, session_id)
+        context = ChatContext(messages=history, max_messages=CONTEXT_MESSAGES)
+        streamer = ReplyStreamer(get_ai_service(), max_buffered=WS_STREAM_BUFFER,
+                                 similarity=similarity_index, alternatives_per_product=PROMPT_ALTERNATIVES)
+
+        while True:
+            try:
+                raw = await asyncio.wait_for(websocket.receive_text(), timeout=WS_IDLE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                await websocket.close(code=1000, reason="idle timeout")
+                return
+
+            message = _parse_message(raw)
+            if not message:
+                await send({"type": "error", "detail": "message vacío"})
+                continue
+            if len(message) > WS_MAX_MESSAGE_CHARS:
+                await send({"type": "error", "detail": f"message supera {WS_MAX_MESSAGE_CHARS} caracteres"})
+                continue
+
+            started = datetime.now(timezone.utc)
+            products = await asyncio.to_thread(_load_products)
+            await send({"type": "start"})
+
+            chunks = []
+            try:
+                # aclosing: si el envío falla (cliente desconectado) se corta el stream
+                async with aclosing(streamer.stream(message, products, context)) as deltas:
+                    async for delta in deltas:
+                        chunks.append(delta)
+                        await send({"type": "delta", "text": delta})
+            except (asyncio.TimeoutError, WebSocketDisconnect):
+                raise
+            except Exception as e:
+                # Falla del modelo: el texto parcial no se guarda como respuesta
+                await send({"type": "error", "detail": str(e)})
+                continue
+
+            reply = "".join(chunks).strip()
+            if not reply:
+                await send({"type": "error", "detail": "El modelo no generó respuesta"})
+                continue
+            now = datetime.now(timezone.utc)
+            u_msg = ChatMessage(None, session_id, "user", message, started)
+            a_msg = ChatMessage(None, session_id, "assistant", reply, now)
+
+            # Actualiza el contexto en memoria (solo los últimos mensajes)
+            context.messages.extend((u_msg, a_msg))
+            del context.messages[:-CONTEXT_MESSAGES]
+
+            # Anota el turno en el diario y lo guarda en segundo plano (ver chat_writer)
+            await chat_writer.submit([u_msg, a_msg])
+
+            await send({"type": "done", "assistant_message": reply, "timestamp": now.isoformat()})
+    except WebSocketDisconnect:
+        pass
+    except asyncio.TimeoutError:
+        # El cliente no está leyendo: se libera la conexión
+        logger.info("WebSocket %s: envío sin respuesta del cliente, se cierra", session_id)
+        try:
+            await websocket.close(code=1008)
+        except Exception:
+            pass
+    finally:
+        _active_connections -= 1
@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from src.infrastructure.db.database import engine as default_engine
+from src.infrastructure.db.models import ChatIdempotencyModel
+
+# --------------------------------------------------------------
+# Módulo: idempotency_store.py
+# --------------------------------------------------------------
+# Respuestas de POST /chat guardadas por (session_id, Idempotency-Key)
+# en la tabla "chat_idempotency", compartida por todos los workers.
+#
+# Flujo de una petición con clave:
+# - acquire() registra la clave como 'pending' y la petición llama al
+#   modelo (NEW); al terminar, complete() guarda la respuesta por
+#   IDEMPOTENCY_TTL_SECONDS, o abandon() la marca 'abandoned' si falló,
+#   para que el siguiente reintento vuelva a intentarlo.
+# - La clave guarda la fecha del primer intento (first_attempt()), y un
+#   reintento que la retoma recibe la misma: el mensaje del usuario se
+#   guarda con esa fecha y el reintento reconoce el que ya guardó el
+#   intento fallido, en lugar de duplicarlo.
+# - Un reintento con la clave ya respondida recibe la respuesta guardada
+#   (DONE) sin llamar al modelo.
+# - Un reintento mientras la primera sigue en curso espera hasta
+#   IDEMPOTENCY_WAIT_SECONDS a que termine (en el mismo worker se le
+#   avisa de inmediato; desde otros workers consulta la tabla).
+# - La misma clave con otro mensaje es un error del cliente (CONFLICT).
+#
+# Si el worker que atendía la primera petición muere, la clave 'pending'
+# vence a los IDEMPOTENCY_PENDING_SECONDS y otra petición la retoma
+# (también con la fecha del primer intento).
+# Cada registro guarda un token de la petición dueña ("owner"):
+# complete() y abandon() solo afectan la fila con su propio token, así
+# una petición lenta cuya clave ya retomó otra no pisa (ni borra) la
+# respuesta de la nueva dueña.
+# --------------------------------------------------------------
+
+_t = ChatIdempotencyModel.__table__
+
+NEW, DONE, PENDING, CONFLICT = "new", "done", "pending", "conflict"
+ABANDONED = "abandoned"
+
+
+# Huella del mensaje (detecta una clave reutilizada con otro contenido)
+def fingerprint(message: str) -> str:
+    return hashlib.sha256(message.encode("utf-8")).hexdigest()[:16]
+
+
+class IdempotencyStore:
+    def __init__(self, bind: Optional[Engine] = None, ttl_seconds: float = 86400,
+                 pending_seconds: float = 120, wait_seconds: float = 60):
+        self.engine = bind or default_engine
+        self.ttl_seconds = ttl_seconds
+        self.pending_seconds = pending_seconds
+        self.wait_seconds = wait_seconds
+        self._events: Dict[Tuple[str, str], asyncio.Event] = {}
+        # Fecha del primer intento de cada clave en curso en este worker
+        self._started: Dict[Tuple[str, str], datetime] = {}
+        self._last_purge = 0.0
+        self.stored = 0
+        self.replayed = 0
+        self.waited = 0
+        self.conflicts = 0
+        self.timeouts = 0
+        self.lost = 0
+
+    @classmethod
+    def from_env(cls) -> "IdempotencyStore":
+        return cls(
+            ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")),
+            pending_seconds=float(os.getenv("IDEMPOTENCY_PENDING_SECONDS", "120")),
+            wait_seconds=float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60")),
+        )
+
+    # ----------------------------------------------------------
+    # Método: acquire
+    # ----------------------------------------------------------
+    # Retorna (NEW, token) si esta petición debe llamar al modelo (el
+    # token se pasa luego a complete/abandon), (DONE, respuesta) si ya
+    # hay respuesta guardada, (CONFLICT, None) si la clave se usó con
+    # otro mensaje, o (PENDING, None) si la primera petición no terminó
+    # dentro del tiempo de espera.
+    # ----------------------------------------------------------
+    async def acquire(self, session_id: str, key: str, digest: str) -> Tuple[str, object]:
+        outcome, stored = await asyncio.to_thread(self._begin, session_id, key, digest)
+        if outcome == PENDING:
+            self.waited += 1
+            outcome, stored = await self._wait(session_id, key, digest)
+        if outcome == NEW:
+            stored, self._started[(session_id, key)] = stored
+            self._events[(session_id, key)] = asyncio.Event()
+        elif outcome == DONE:
+            self.replayed += 1
+        elif outcome == CONFLICT:
+            self.conflicts += 1
+        else:
+            self.timeouts += 1
+        return outcome, stored
+
+    # Fecha del primer intento de una clave adquirida (NEW) por esta petición
+    def first_attempt(self, session_id: str, key: str) -> Optional[datetime]:
+        return self._started.get((session_id, key))
+
+    # Retorna False si la clave ya no era de esta petición (venció y la retomó otra)
+    async def complete(self, session_id: str, key: str, token: str, response: dict) -> bool:
+        try:
+            owned = await asyncio.to_thread(self._complete, session_id, key, token, response)
+            if owned:
+                self.stored += 1
+            else:
+                self.lost += 1
+            return owned
+        finally:
+            self._wake(session_id, key)
+
+    async def abandon(self, session_id: str, key: str, token: str) -> None:
+        try:
+            await asyncio.to_thread(self._abandon, session_id, key, token)
+        finally:
+            self._wake(session_id, key)
+
+    def _wake(self, session_id: str, key: str) -> None:
+        self._started.pop((session_id, key), None)
+        event = self._events.pop((session_id, key), None)
+        if event:
+            event.set()
+
+    # Espera a que la primera petición termine: se despierta con su aviso
+    # (mismo worker) o consulta la tabla con espera creciente
+    async def _wait(self, session_id: str, key: str, digest: str) -> Tuple[str, Optional[dict]]:
+        deadline = time.monotonic() + self.wait_seconds
+        delay = 0.05
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return PENDING, None
+            event = self._events.get((session_id, key))
+            try:
+                if event:
+                    await asyncio.wait_for(event.wait(), timeout=min(delay, remaining))
+                else:
+                    await asyncio.sleep(min(delay, remaining))
+            except asyncio.TimeoutError:
+                pass
+            outcome, stored = await asyncio.to_thread(self._begin, session_id, key, digest)
+            if outcome != PENDING:
+                return outcome, stored
+            delay = min(delay * 2, 1.0)
+
+    # ----------------------------------------------------------
+    # Método: _begin
+    # ----------------------------------------------------------
+    # Intenta registrar la clave como 'pending'. Con NEW retorna
+    # (token, fecha del primer intento).
+    # - Una fila del mismo mensaje 'abandoned', o 'pending' vencida, se
+    #   retoma con un UPDATE que conserva la fecha del primer intento.
+    # - Si no, se inserta (el INSERT falla si la clave ya existe). Antes
+    #   se borra la fila de esa clave si ya venció.
+    # ----------------------------------------------------------
+    def _begin(self, session_id: str, key: str, digest: str) -> Tuple[str, object]:
+        self._maybe_purge()
+        for _ in range(3):
+            now = time.time()
+            token = uuid.uuid4().hex
+            same_key = (_t.c.session_id == session_id, _t.c.key == key)
+            try:
+                with self.engine.begin() as conn:
+                    resumed = conn.execute(
+                        update(_t)
+                        .where(*same_key, _t.c.fingerprint == digest,
+                               or_(_t.c.status == ABANDONED, and_(_t.c.status == PENDING, _t.c.expires_at < now)))
+                        .values(status=PENDING, owner=token, expires_at=now + self.pending_seconds)
+                        .returning(_t.c.started_at)
+                    ).first()
+                    if resumed is not None:
+                        return NEW, (token, resumed.started_at)
+                    conn.execute(delete(_t).where(*same_key, _t.c.expires_at < now))
+                    started = datetime.now(timezone.utc)
+                    conn.execute(insert(_t).values(session_id=session_id, key=key, status=PENDING,
+                                                   fingerprint=digest, expires_at=now + self.pending_seconds,
+                                                   owner=token, started_at=started))
+                return NEW, (token, started)
+            except IntegrityError:
+                pass
+            with self.engine.connect() as conn:
+                row = conn.execute(
+                    select(_t.c.status, _t.c.fingerprint, _t.c.response)
+                    .where(_t.c.session_id == session_id, _t.c.key == key)
+                ).first()
+            if row is None:  # venció o se liberó entre las dos sentencias
+                continue
+            if row.fingerprint != digest:
+                return CONFLICT, None
+            if row.status == DONE:
+                return DONE, json.loads(row.response)
+            if row.status == ABANDONED:
+                continue  # Se liberó entre las dos sentencias: se reintenta retomarla
+            return PENDING, None
+        return PENDING, None
+
+    def _complete(self, session_id: str, key: str, token: str, response: dict) -> bool:
+        with self.engine.begin() as conn:
+            updated = conn.execute(
+                update(_t)
+                .where(_t.c.session_id == session_id, _t.c.key == key, _t.c.owner == token,
+                       _t.c.status == PENDING)
+                .values(status=DONE, response=json.dumps(response, ensure_ascii=False, separators=(",", ":")),
+                        expires_at=time.time() + self.ttl_seconds)
+            )
+        return updated.rowcount == 1
+
+    # La fila se conserva (con la fecha del primer intento) hasta que la
+    # retome un reintento o venza con IDEMPOTENCY_TTL_SECONDS
+    def _abandon(self, session_id: str, key: str, token: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(_t)
+                .where(_t.c.session_id == session_id, _t.c.key == key, _t.c.owner == token,
+                       _t.c.status == PENDING)
+                .values(status=ABANDONED, owner=None, expires_at=time.time() + self.ttl_seconds)
+            )
+
+    # Borra las claves vencidas como mucho una vez cada 5 minutos
+    def _maybe_purge(self) -> None:
+        if time.monotonic() - self._last_purge < 300:
+            return
+        self._last_purge = time.monotonic()
+        self.purge()
+
+    def purge(self) -> int:
+        with self.engine.begin() as conn:
+            return conn.execute(delete(_t).where(_t.c.expires_at < time.time())).rowcount
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "in_flight": len(self._events),
+            "stored_responses": self.stored,
+            "replayed": self.replayed,
+            "waited_for_in_flight": self.waited,
+            "key_conflicts": self.conflicts,
+            "wait_timeouts": self.timeouts,
+            # Respuestas descartadas porque la clave venció y la retomó otra petición
+            "lost_ownership": self.lost,
+        }
+
+
+# --------------------------------------------------------------
+# Instancia compartida para este proceso
+# --------------------------------------------------------------
+idempotency_store = IdempotencyStore.from_env()
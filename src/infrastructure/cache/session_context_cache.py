@@ -0,0 +1,309 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import timezone
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from src.domain.entities import ChatMessage
+from .session_versions import SessionVersionBoard
+
+# --------------------------------------------------------------
+# Módulo: session_context_cache.py
+# --------------------------------------------------------------
+# Caché LRU en memoria con los últimos mensajes de cada sesión de chat.
+#
+# Cada turno de /chat lee los últimos mensajes de la sesión para armar
+# el contexto, aunque el turno anterior de esa misma sesión acaba de
+# escribirlos. Esta caché guarda los últimos N mensajes por sesión:
+# - se llena la primera vez que se leen de la base de datos,
+# - se actualiza al guardar mensajes nuevos (write-through),
+# - recibe también las respuestas que todavía se están guardando en
+#   segundo plano (add_pending, sin id); cuando llegan a la base de
+#   datos, append() las reemplaza por la versión guardada,
+# - se invalida al borrar el historial de la sesión,
+# - expulsa la sesión menos usada cuando se alcanza el máximo de
+#   sesiones, y descarta las sesiones inactivas tras "idle_seconds".
+#
+# Es una caché por proceso, pero otro worker pudo escribir en la sesión.
+# Para detectarlo sin ir a la base de datos, cada escritura deja un sello
+# en la señal compartida entre procesos (session_versions.py,
+# SESSION_CACHE_SIGNAL_PATH); cada entrada guarda el sello que vio y se
+# descarta si el de la señal cambió. Así una sesión activa no consulta la
+# base de datos en cada turno. Con SESSION_CACHE_VALIDATE=true además se
+# compara el último id cacheado con el de la base de datos en cada uso
+# (solo hace falta si algo escribe en chat_memory sin pasar por la caché).
+#
+# Cada sesión tiene además un contador de cambios local ("generation")
+# que sube con cada append/invalidate, esté o no en caché. Una lectura de
+# la base de datos solo se guarda con put() si el contador no cambió
+# desde que se empezó a leer; así no pisa mensajes agregados mientras
+# tanto.
+# --------------------------------------------------------------
+
+
+# Orden de la base de datos (fecha, id; los pendientes al final de su
+# fecha). Las fechas leídas de SQLite no tienen zona y las de los mensajes
+# nuevos están en UTC: se comparan como UTC sin zona.
+def _order_key(m: ChatMessage):
+    ts = m.timestamp
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts, m.id is None, m.id or 0
+
+
+class _Entry:
+    __slots__ = ("messages", "last_access", "stamp")
+
+    def __init__(self, messages: Iterable[ChatMessage], size: int, stamp: Optional[int] = None):
+        self.messages: Deque[ChatMessage] = deque(messages, maxlen=size)
+        self.last_access = time.monotonic()
+        # Sello de la señal compartida con el que coincide esta entrada
+        self.stamp = stamp
+
+    # Último id guardado en la base de datos (los mensajes pendientes no tienen id)
+    @property
+    def last_id(self) -> Optional[int]:
+        for m in reversed(self.messages):
+            if m.id is not None:
+                return m.id
+        return None
+
+    # Agrega mensajes guardados; si uno estaba pendiente (mismo rol, texto
+    # y fecha, sin id) se reemplaza en su lugar. Escrituras concurrentes
+    # pueden llegar desordenadas: se mantiene el orden de la base de datos
+    # (fecha, id) y se conservan los más recientes.
+    def merge(self, messages: Iterable[ChatMessage]) -> None:
+        items = list(self.messages)
+        for m in messages:
+            for i, old in enumerate(items):
+                if (old.id is None and m.id is not None and old.role == m.role
+                        and old.timestamp == m.timestamp and old.message == m.message):
+                    items[i] = m
+                    break
+            else:
+                items.append(m)
+        items.sort(key=_order_key)
+        self.messages = deque(items, maxlen=self.messages.maxlen)
+
+
+# --------------------------------------------------------------
+# Clase: SessionContextCache
+# --------------------------------------------------------------
+# Todas las operaciones son seguras entre hilos (los repositorios se
+# usan desde hilos del pool de FastAPI y desde asyncio.to_thread).
+# --------------------------------------------------------------
+class SessionContextCache:
+    def __init__(self, max_sessions: int = 10000, messages_per_session: int = 6,
+                 idle_seconds: float = 900, enabled: bool = True, validate: bool = False,
+                 versions: Optional[SessionVersionBoard] = None):
+        self.max_sessions = max_sessions
+        self.messages_per_session = messages_per_session
+        self.idle_seconds = idle_seconds
+        self.enabled = enabled
+        self.validate = validate
+        self.versions = versions if versions is not None and versions.enabled else None
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Último cambio de cada sesión, acotado; las sesiones descartadas
+        # quedan cubiertas por "_floor" (el mayor cambio descartado)
+        self._changes: "OrderedDict[str, int]" = OrderedDict()
+        self._sequence = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    @classmethod
+    def from_env(cls) -> "SessionContextCache":
+        def flag(name: str, default: str) -> bool:
+            return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "on"}
+
+        return cls(
+            max_sessions=int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "10000")),
+            messages_per_session=int(os.getenv("SESSION_CACHE_MESSAGES", "6")),
+            idle_seconds=float(os.getenv("SESSION_CACHE_IDLE_SECONDS", "900")),
+            enabled=flag("SESSION_CACHE_ENABLED", "true"),
+            validate=flag("SESSION_CACHE_VALIDATE", "false"),
+            versions=SessionVersionBoard.from_env(),
+        )
+
+    # ----------------------------------------------------------
+    # Método: get
+    # ----------------------------------------------------------
+    # Retorna los últimos "count" mensajes cacheados de la sesión, o None
+    # si no están (o si se piden más de los que guarda la caché, o si otro
+    # proceso cambió la sesión según la señal compartida).
+    # ----------------------------------------------------------
+    def get(self, session_id: str, count: int) -> Optional[List[ChatMessage]]:
+        if not self.enabled or count > self.messages_per_session:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            if now - entry.last_access > self.idle_seconds:
+                del self._entries[session_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if self.versions is not None and self.versions.read(session_id) != entry.stamp:
+                del self._entries[session_id]
+                self.stale += 1
+                self.misses += 1
+                return None
+            entry.last_access = now
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            messages = list(entry.messages)
+        return messages[-count:] if count > 0 else []
+
+    # Último id cacheado de la sesión (para validar contra la base de datos)
+    def last_id(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            return entry.last_id if entry else None
+
+    # Contador de cambios local y sello compartido de la sesión; se lee
+    # antes de consultar la base de datos y se pasa a put()
+    def generation(self, session_id: str) -> Tuple[int, Optional[int]]:
+        with self._lock:
+            local = self._changes.get(session_id, self._floor)
+        return local, self.versions.read(session_id) if self.versions is not None else None
+
+    # Registra un cambio en la sesión (con el lock tomado). Con "shared"
+    # también en la señal entre procesos; si otro proceso había cambiado
+    # la sesión desde el sello de la entrada, la entrada se descarta.
+    def _touch(self, session_id: str, shared: bool = True) -> None:
+        self._sequence += 1
+        self._changes[session_id] = self._sequence
+        self._changes.move_to_end(session_id)
+        while len(self._changes) > 2 * self.max_sessions:
+            _, evicted = self._changes.popitem(last=False)
+            self._floor = max(self._floor, evicted)
+        if shared and self.versions is not None:
+            entry = self._entries.get(session_id)
+            stamp, unchanged = self.versions.bump(session_id, entry.stamp if entry else None)
+            if entry is not None:
+                if unchanged:
+                    entry.stamp = stamp
+                else:
+                    del self._entries[session_id]
+                    self.stale += 1
+
+    # ----------------------------------------------------------
+    # Método: put
+    # ----------------------------------------------------------
+    # Guarda los últimos mensajes leídos de la base de datos. Deben ser
+    # los más recientes de la sesión (hasta messages_per_session).
+    # Con "expected_generation" (el valor de generation() antes de la
+    # lectura) no guarda nada si la sesión cambió mientras tanto.
+    # Retorna True si la entrada quedó guardada.
+    # ----------------------------------------------------------
+    def put(self, session_id: str, messages: List[ChatMessage],
+            expected_generation: Optional[Tuple[int, Optional[int]]] = None) -> bool:
+        if not self.enabled:
+            return False
+        if expected_generation is not None:
+            stamp = expected_generation[1]
+        else:
+            stamp = self.versions.read(session_id) if self.versions is not None else None
+        with self._lock:
+            if (expected_generation is not None
+                    and self._changes.get(session_id, self._floor) != expected_generation[0]):
+                return False
+            self._entries[session_id] = _Entry(messages, self.messages_per_session, stamp)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    # ----------------------------------------------------------
+    # Método: append
+    # ----------------------------------------------------------
+    # Agrega mensajes recién guardados a la sesión, solo si ya está en
+    # caché (si no está, la próxima lectura la cargará completa). Los
+    # que estaban pendientes se reemplazan por su versión guardada.
+    # ----------------------------------------------------------
+    def append(self, session_id: str, messages: List[ChatMessage]) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._touch(session_id)
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry.merge(messages)
+                entry.last_access = time.monotonic()
+                self._entries.move_to_end(session_id)
+
+    # ----------------------------------------------------------
+    # Método: add_pending
+    # ----------------------------------------------------------
+    # Agrega mensajes que todavía no están en la base de datos (se guardan
+    # en segundo plano), para que el siguiente turno de la sesión los vea
+    # en su contexto. No cuentan para last_id ni para la validación, ni
+    # cambian la señal compartida (otros procesos no pueden verlos).
+    # ----------------------------------------------------------
+    def add_pending(self, session_id: str, messages: List[ChatMessage]) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._touch(session_id, shared=False)
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry.messages.extend(messages)
+                entry.last_access = time.monotonic()
+                self._entries.move_to_end(session_id)
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._touch(session_id)
+            if self._entries.pop(session_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    # ----------------------------------------------------------
+    # Método: stats
+    # ----------------------------------------------------------
+    # Métricas para /ops/session-cache, incluida una estimación del
+    # tamaño de los textos guardados.
+    # ----------------------------------------------------------
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            sessions = len(self._entries)
+            messages = sum(len(e.messages) for e in self._entries.values())
+            text_bytes = sum(len(m.message) for e in self._entries.values() for m in e.messages)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "validate": self.validate,
+            "shared_versions": self.versions.path if self.versions is not None else None,
+            "sessions": sessions,
+            "max_sessions": self.max_sessions,
+            "messages": messages,
+            "messages_per_session": self.messages_per_session,
+            "approx_text_bytes": text_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            # Entradas descartadas porque otro proceso cambió la sesión
+            "stale": self.stale,
+        }
+
+
+# --------------------------------------------------------------
+# Instancia compartida para este proceso
+# --------------------------------------------------------------
+session_cache = SessionContextCache.from_env()
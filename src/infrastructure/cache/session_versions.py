@@ -0,0 +1,121 @@
+import logging
+import mmap
+import os
+import random
+import struct
+import threading
+import zlib
+from typing import Optional, Tuple
+
+from src.infrastructure.file_lock import fcntl, locked
+
+# --------------------------------------------------------------
+# Módulo: session_versions.py
+# --------------------------------------------------------------
+# Señal de cambios de sesión compartida entre procesos, para que la
+# caché de contextos de cada worker sepa si otro worker escribió en una
+# sesión sin consultar la base de datos.
+#
+# Es un archivo mapeado en memoria (como el snapshot del catálogo) con
+# una tabla fija de "slots" de 8 bytes. Cada sesión cae en un slot según
+# el crc32 de su id; cada escritura en la sesión guarda en su slot un
+# valor aleatorio nuevo ("sello"). Un worker que guardó el sello que vio
+# al llenar su caché sabe que la sesión cambió si el slot ya no lo tiene.
+# Dos sesiones en el mismo slot solo provocan invalidaciones de más.
+#
+# Las lecturas no toman bloqueo. Las escrituras comparan y reemplazan el
+# sello bajo flock, para que un worker no tape con su sello el cambio de
+# otro que todavía no vio.
+#
+# Formato: cabecera (magic, cantidad de slots) + uint64[slots].
+# --------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"SESSVER1"
+_HEADER = struct.Struct("=8sI4x")
+_SLOT = struct.Struct("=Q")
+
+
+class SessionVersionBoard:
+    def __init__(self, path: Optional[str], slots: int = 65536):
+        self.path = path or None
+        self.slots = max(1, slots)
+        self._mm: Optional[mmap.mmap] = None
+        self._fh = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SessionVersionBoard":
+        return cls(
+            path=os.getenv("SESSION_CACHE_SIGNAL_PATH", "./data/session_versions.bin").strip(),
+            slots=int(os.getenv("SESSION_CACHE_SIGNAL_SLOTS", "65536")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    # Abre (o crea) el archivo la primera vez que se usa. Si no se puede,
+    # la señal queda desactivada y se registra en el log.
+    def _map(self) -> Optional[mmap.mmap]:
+        if self._mm is not None or self.path is None:
+            return self._mm
+        with self._lock:
+            if self._mm is not None or self.path is None:
+                return self._mm
+            try:
+                with locked(f"{self.path}.lock"):
+                    fh = open(self.path, "a+b")
+                    fh.seek(0)
+                    header = fh.read(_HEADER.size)
+                    if len(header) == _HEADER.size and header[:8] == _MAGIC:
+                        self.slots = _HEADER.unpack(header)[1]
+                    else:
+                        fh.truncate(0)
+                        fh.write(_HEADER.pack(_MAGIC, self.slots))
+                        fh.flush()
+                    size = _HEADER.size + self.slots * _SLOT.size
+                    if os.fstat(fh.fileno()).st_size < size:
+                        fh.truncate(size)
+                    self._mm = mmap.mmap(fh.fileno(), size)
+                    self._fh = fh
+            except (OSError, ValueError):
+                logger.exception("No se pudo abrir %s; la caché de sesiones no verá cambios de otros procesos",
+                                 self.path)
+                self.path = None
+        return self._mm
+
+    def _offset(self, session_id: str) -> int:
+        return _HEADER.size + (zlib.crc32(session_id.encode("utf-8")) % self.slots) * _SLOT.size
+
+    # Sello actual de la sesión (None si la señal está desactivada)
+    def read(self, session_id: str) -> Optional[int]:
+        mm = self._map()
+        if mm is None:
+            return None
+        return _SLOT.unpack_from(mm, self._offset(session_id))[0]
+
+    # ----------------------------------------------------------
+    # Método: bump
+    # ----------------------------------------------------------
+    # Registra un cambio en la sesión. Retorna (sello nuevo, True si el
+    # sello anterior era "expected"), es decir, si nadie más cambió la
+    # sesión desde que quien llama vio "expected".
+    # ----------------------------------------------------------
+    def bump(self, session_id: str, expected: Optional[int] = None) -> Tuple[Optional[int], bool]:
+        mm = self._map()
+        if mm is None:
+            return None, False
+        offset = self._offset(session_id)
+        stamp = random.getrandbits(63) | 1
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._fh, fcntl.LOCK_EX)
+            try:
+                previous = _SLOT.unpack_from(mm, offset)[0]
+                _SLOT.pack_into(mm, offset, stamp)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fh, fcntl.LOCK_UN)
+        return stamp, expected is not None and previous == expected
@@ -0,0 +1,583 @@
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.domain.entities import Product
+from src.infrastructure.db.database import SessionLocal
+from src.infrastructure.repositories.product_repository import SQLProductRepository
+from src.infrastructure.repositories.snapshot_product_repository import SnapshotProductRepository
+from .snapshot import catalog_snapshot
+
+# --------------------------------------------------------------
+# Módulo: similarity.py
+# --------------------------------------------------------------
+# Índice de productos similares ("también te puede gustar" y
+# alternativas para productos agotados).
+#
+# Cada producto se representa con un vector de características armado a
+# partir de marca, categoría, talla, color, franja de precio y términos
+# del nombre y la descripción. Los vectores están normalizados y son
+# dispersos (un producto tiene unas decenas de características), así que
+# se guardan en formato CSR con arreglos NumPy: "indptr" (inicio de cada
+# producto), "cols" (característica) y "vals" (peso float32).
+#
+# Cada característica tiene su propia columna en un vocabulario que solo
+# crece (sin colisiones entre características distintas). Una columna
+# asignada no cambia, así que el vector de un producto depende solo de
+# sus propios campos: cuando cambia la versión del catálogo solo se
+# recalculan los vectores de los productos cuyos campos cambiaron (el
+# stock no forma parte del vector y se copia siempre). Si el vocabulario
+# acumula muchas características que ya no usa ningún producto, se
+# vuelve a armar desde cero en la siguiente reconstrucción.
+#
+# Se guarda además la traspuesta (una lista de productos por
+# característica, también CSR). Con ella, al construir el índice se
+# calculan por bloques de productos los SIMILARITY_TOPK vecinos más
+# parecidos de cada uno ("neighbors", sin filtrar por stock). Una
+# consulta lee esa lista y filtra por stock: O(k), sin recorrer el
+# catálogo. Solo si se piden más vecinos de los precalculados, o si el
+# filtro de stock deja menos de "k", se calcula la similitud contra todo
+# el catálogo sumando las listas de la traspuesta (≈ 5 ms para 100k
+# productos en un núcleo). Los resultados se memorizan por versión.
+#
+# El precálculo compara todos los pares que comparten alguna
+# característica, así que crece con el cuadrado del catálogo (≈ 1 s para
+# 5k productos y ≈ 12 s para 20k en un núcleo; 100k llevaría varios
+# minutos). Por eso corre en un hilo propio después de publicar el
+# índice: mientras tanto las consultas recorren el catálogo como antes.
+# Con SIMILARITY_TOPK=0 se desactiva.
+#
+# Memoria aproximada: 16 bytes por característica distinta de cero de
+# cada producto (≈ 20 por producto: 100k productos ≈ 40 MB por worker)
+# más 8 bytes por vecino precalculado (100k × 20 ≈ 16 MB).
+#
+# Cuando cambia la versión, similar() sigue respondiendo con el índice
+# anterior y la reconstrucción corre en un hilo aparte; solo la primera
+# construcción (sin índice previo) se hace en la misma llamada. Si solo
+# cambió la versión del stock (reservas), se recarga únicamente el
+# arreglo de stock, sin tocar los vectores.
+#
+# NumPy se importa en la primera construcción del índice para no sumar
+# su costo al arranque de la API.
+# --------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+# Celdas float32 de la matriz de similitud de un bloque durante el
+# precálculo de vecinos (≈ 16 MB)
+_BLOCK_CELLS = 4 * 1024 * 1024
+
+# Peso de cada grupo de características en el vector
+_WEIGHTS = {
+    "brand": 1.0,
+    "category": 1.5,
+    "size": 0.5,
+    "color": 0.75,
+    "price": 1.0,
+    "terms": 1.0,
+}
+
+# Ancho de las franjas de precio (escala logarítmica: cada franja es un 25 % más cara)
+_PRICE_BAND_RATIO = math.log(1.25)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = {
+    "con", "para", "por", "los", "las", "del", "una", "uno", "unos", "unas",
+    "que", "sus", "muy", "más", "mas", "the", "and", "for", "with",
+}
+
+
+def _flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "on"}
+
+
+# Campos del producto que determinan su vector (el stock no se incluye)
+def _feature_key(p) -> Tuple:
+    return (p.name, p.brand, p.category, p.size, p.color, p.price, p.description)
+
+
+# --------------------------------------------------------------
+# Función: product_features
+# --------------------------------------------------------------
+# Retorna la lista de (característica, peso) de un producto. Las tallas
+# numéricas y las franjas de precio suman también sus vecinas con la
+# mitad del peso, para que 41 y 42 (o precios cercanos) se parezcan.
+# --------------------------------------------------------------
+def product_features(p) -> List[Tuple[str, float]]:
+    feats: List[Tuple[str, float]] = []
+    for group in ("brand", "category", "color"):
+        value = (getattr(p, group) or "").strip().lower()
+        if value:
+            feats.append((f"{group}:{value}", _WEIGHTS[group]))
+
+    size = (p.size or "").strip().lower()
+    if size:
+        feats.append((f"size:{size}", _WEIGHTS["size"]))
+        try:
+            n = float(size.replace(",", "."))
+        except ValueError:
+            pass
+        else:
+            for near in (n - 1, n + 1):
+                feats.append((f"size:{near:g}", _WEIGHTS["size"] / 2))
+
+    if p.price and p.price > 0:
+        band = math.floor(math.log(p.price) / _PRICE_BAND_RATIO)
+        feats.append((f"price:{band}", _WEIGHTS["price"]))
+        feats.append((f"price:{band - 1}", _WEIGHTS["price"] / 2))
+        feats.append((f"price:{band + 1}", _WEIGHTS["price"] / 2))
+
+    terms = {
+        t for t in _TOKEN.findall(f"{p.name or ''} {p.description or ''}".lower())
+        if len(t) > 2 and t not in _STOPWORDS
+    }
+    if terms:
+        # El peso del grupo se reparte entre los términos
+        w = _WEIGHTS["terms"] / math.sqrt(len(terms))
+        feats.extend((f"term:{t}", w) for t in terms)
+    return feats
+
+
+# --------------------------------------------------------------
+# Función: _top_neighbors
+# --------------------------------------------------------------
+# Precalcula los "top_k" vecinos de cada producto (posiciones y
+# similitudes, de mayor a menor; -1 y 0 donde no hay más productos con
+# similitud positiva). Procesa bloques de productos: para cada
+# característica del bloque suma, en una matriz bloque × catálogo, el
+# producto de los pesos de esos productos por los de su lista en la
+# traspuesta, y luego elige el top-k de cada fila con argpartition.
+# --------------------------------------------------------------
+def _top_neighbors(indptr, cols, vals, t_indptr, t_rows, t_vals, top_k: int):
+    import numpy as np
+
+    n = len(indptr) - 1
+    k = min(top_k, max(n - 1, 0))
+    neighbors = np.full((n, k), -1, dtype=np.int32)
+    scores_out = np.zeros((n, k), dtype=np.float32)
+    if k == 0:
+        return neighbors, scores_out
+
+    row_of = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    block = max(1, min(n, _BLOCK_CELLS // n))
+    for r0 in range(0, n, block):
+        r1 = min(n, r0 + block)
+        a, b = indptr[r0], indptr[r1]
+        order = np.argsort(cols[a:b], kind="stable")
+        b_cols, b_vals, b_rows = cols[a:b][order], vals[a:b][order], row_of[a:b][order] - r0
+        scores = np.zeros((r1 - r0, n), dtype=np.float32)
+        starts = np.flatnonzero(np.r_[True, b_cols[1:] != b_cols[:-1]]) if len(b_cols) else []
+        ends = np.r_[starts[1:], len(b_cols)] if len(b_cols) else []
+        # Dentro de una característica cada producto aparece una sola vez:
+        # los índices de cada suma no se repiten
+        for s, e in zip(starts, ends):
+            col = b_cols[s]
+            pa, pb = t_indptr[col], t_indptr[col + 1]
+            scores[np.ix_(b_rows[s:e], t_rows[pa:pb])] += np.outer(b_vals[s:e], t_vals[pa:pb])
+        local = np.arange(r1 - r0)
+        scores[local, local + r0] = -1.0
+        top = np.argpartition(scores, n - k, axis=1)[:, n - k:]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        positive = top_scores > 0
+        neighbors[r0:r1] = np.where(positive, top, -1)
+        scores_out[r0:r1] = np.where(positive, top_scores, 0.0)
+    return neighbors, scores_out
+
+
+# --------------------------------------------------------------
+# Clase: SimilarityIndex
+# --------------------------------------------------------------
+# "version_source" retorna la versión actual del catálogo,
+# "stock_version_source" (opcional) la del stock y "products_source" los
+# productos (ordenados por id). Antes de cada consulta se comparan las
+# versiones (en el snapshot es solo la cabecera del archivo) y, si
+# cambiaron, el índice se actualiza de forma incremental.
+# --------------------------------------------------------------
+class SimilarityIndex:
+    def __init__(self, version_source: Callable[[], int], products_source: Callable[[], Sequence[Product]],
+                 top_k: int = 20, enabled: bool = True, memo_size: int = 4096,
+                 stock_version_source: Optional[Callable[[], int]] = None):
+        self.version_source = version_source
+        self.products_source = products_source
+        self.stock_version_source = stock_version_source
+        self.top_k = max(0, top_k)
+        self.enabled = enabled
+        self.memo_size = memo_size
+        self.version: Optional[int] = None
+        self.stock_version: Optional[int] = None
+        # Estado publicado como una tupla (se reemplaza completa en cada reconstrucción):
+        # ids int64[n] ordenado, stocks int64[n], vectores CSR por producto
+        # (indptr int64[n+1], cols int32, vals float32), su traspuesta por
+        # característica (t_indptr int64[features+1], t_rows int32, t_vals float32)
+        # y los vecinos precalculados (neighbors int32[n, top_k], posición o -1,
+        # y neighbor_scores float32[n, top_k], de mayor a menor)
+        self._state = None
+        self._keys: List[Tuple] = []
+        # Columna de cada característica (solo crece, ver cabecera)
+        self._vocab: Dict[str, int] = {}
+        self._features_in_use = 0
+        self._memo: "OrderedDict[Tuple, List[Tuple[int, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._neighbors_lock = threading.Lock()
+        self._refreshing = False
+        self._computing_neighbors = False
+        self.rebuilds = 0
+        self.stock_refreshes = 0
+        self.rows_computed = 0
+        self.rows_reused = 0
+        self.stale_queries = 0
+        self.neighbor_hits = 0
+        self.full_scans = 0
+        self.neighbors_ms: Optional[float] = None
+
+    @classmethod
+    def from_env(cls, version_source, products_source, stock_version_source=None) -> "SimilarityIndex":
+        return cls(
+            version_source,
+            products_source,
+            top_k=int(os.getenv("SIMILARITY_TOPK", "20")),
+            enabled=_flag("SIMILARITY_ENABLED", "true"),
+            stock_version_source=stock_version_source,
+        )
+
+    def _versions(self) -> Tuple[int, Optional[int]]:
+        stock_version = self.stock_version_source() if self.stock_version_source else None
+        return self.version_source(), stock_version
+
+    # ----------------------------------------------------------
+    # Método privado: _vector
+    # ----------------------------------------------------------
+    # Calcula el vector normalizado de un producto como listas
+    # (columnas ordenadas, pesos). Las características nuevas reciben la
+    # siguiente columna del vocabulario (solo se llama con _build_lock).
+    # ----------------------------------------------------------
+    def _vector(self, p) -> Tuple[List[int], List[float]]:
+        cols: Dict[int, float] = {}
+        for feat, weight in product_features(p):
+            col = self._vocab.setdefault(feat, len(self._vocab))
+            cols[col] = cols.get(col, 0.0) + weight
+        norm = math.sqrt(sum(w * w for w in cols.values()))
+        if not norm:
+            return [], []
+        order = sorted(cols)
+        return order, [cols[c] / norm for c in order]
+
+    # ----------------------------------------------------------
+    # Método: refresh
+    # ----------------------------------------------------------
+    # Reconstruye el índice si la versión del catálogo cambió. Los
+    # vectores de los productos cuyos campos no cambiaron se copian del
+    # índice anterior; solo se calculan los nuevos o modificados. El
+    # índice anterior sigue disponible hasta que el nuevo está completo.
+    # ----------------------------------------------------------
+    def refresh(self) -> None:
+        version, stock_version = self._versions()
+        if (version, stock_version) == (self.version, self.stock_version):
+            return
+        with self._build_lock:
+            if (version, stock_version) == (self.version, self.stock_version):
+                return
+            import numpy as np
+
+            products = list(self.products_source())
+            if version == self.version and self._refresh_stocks(products, stock_version):
+                return
+            n = len(products)
+            ids = np.fromiter((p.id for p in products), dtype=np.int64, count=n)
+            stocks = np.fromiter((p.stock for p in products), dtype=np.int64, count=n)
+            keys = [_feature_key(p) for p in products]
+
+            old_pos: Dict[int, int] = {}
+            if len(self._vocab) > 2 * self._features_in_use + 1024:
+                # Demasiadas características sin uso: se recalcula todo
+                self._vocab = {}
+            elif self._state is not None:
+                old_ids, _, old_indptr, old_cols, old_vals = self._state[:5]
+                old_pos = {int(pid): i for i, pid in enumerate(old_ids)}
+            lengths = np.zeros(n, dtype=np.int64)
+            parts_cols, parts_vals = [], []
+            reused = 0
+            for i, p in enumerate(products):
+                j = old_pos.get(p.id)
+                if j is not None and self._keys[j] == keys[i]:
+                    a, b = old_indptr[j], old_indptr[j + 1]
+                    parts_cols.append(old_cols[a:b])
+                    parts_vals.append(old_vals[a:b])
+                    reused += 1
+                else:
+                    cols, vals = self._vector(p)
+                    parts_cols.append(np.asarray(cols, dtype=np.int32))
+                    parts_vals.append(np.asarray(vals, dtype=np.float32))
+                lengths[i] = len(parts_cols[-1])
+
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(lengths, out=indptr[1:])
+            cols = np.concatenate(parts_cols) if n else np.zeros(0, dtype=np.int32)
+            vals = np.concatenate(parts_vals) if n else np.zeros(0, dtype=np.float32)
+
+            # Traspuesta: productos agrupados por característica
+            features = len(self._vocab)
+            order = np.argsort(cols, kind="stable")
+            t_rows = np.repeat(np.arange(n, dtype=np.int32), lengths)[order]
+            t_vals = vals[order]
+            counts = np.bincount(cols, minlength=features)
+            t_indptr = np.zeros(features + 1, dtype=np.int64)
+            np.cumsum(counts, out=t_indptr[1:])
+
+            with self._lock:
+                self._state = (ids, stocks, indptr, cols, vals, t_indptr, t_rows, t_vals, None, None)
+                self._keys = keys
+                self._features_in_use = int(np.count_nonzero(counts))
+                self._memo.clear()
+                self.version = version
+                self.stock_version = stock_version
+            self.rebuilds += 1
+            self.rows_reused += reused
+            self.rows_computed += n - reused
+            logger.info("Índice de similitud actualizado (versión %s, %s productos, %s recalculados)",
+                        version, n, n - reused)
+        self._neighbors_in_background()
+
+    # ----------------------------------------------------------
+    # Método: compute_neighbors
+    # ----------------------------------------------------------
+    # Precalcula los vecinos del índice publicado, si todavía no los
+    # tiene, y los agrega al estado (si mientras tanto solo cambió el
+    # stock, los vecinos siguen valiendo).
+    # ----------------------------------------------------------
+    def compute_neighbors(self) -> None:
+        with self._neighbors_lock:
+            state = self._state
+            if state is None or state[8] is not None or not self.top_k:
+                return
+            started = time.perf_counter()
+            neighbors, neighbor_scores = _top_neighbors(*state[2:8], self.top_k)
+            elapsed = round((time.perf_counter() - started) * 1000, 1)
+            with self._lock:
+                current = self._state
+                if current[2] is not state[2]:
+                    return
+                self._state = current[:8] + (neighbors, neighbor_scores)
+                self.neighbors_ms = elapsed
+            logger.info("Vecinos del índice de similitud precalculados en %s ms", elapsed)
+
+    # Lanza compute_neighbors() en un hilo si no hay otro en curso; el
+    # hilo sigue mientras se publiquen índices nuevos sin vecinos
+    def _neighbors_in_background(self) -> None:
+        if not self.top_k:
+            return
+        with self._lock:
+            if self._computing_neighbors:
+                return
+            self._computing_neighbors = True
+
+        def run():
+            try:
+                while True:
+                    self.compute_neighbors()
+                    with self._lock:
+                        state = self._state
+                        if state is None or state[8] is not None:
+                            self._computing_neighbors = False
+                            return
+            except Exception:
+                logger.exception("No se pudieron precalcular los vecinos del índice de similitud")
+                with self._lock:
+                    self._computing_neighbors = False
+
+        threading.Thread(target=run, name="similarity-neighbors", daemon=True).start()
+
+    # ----------------------------------------------------------
+    # Método privado: _refresh_stocks
+    # ----------------------------------------------------------
+    # Solo cambió el stock: reemplaza el arreglo de stock si los productos
+    # son los mismos. Retorna False si hay que reconstruir el índice.
+    # ----------------------------------------------------------
+    def _refresh_stocks(self, products: Sequence[Product], stock_version: Optional[int]) -> bool:
+        import numpy as np
+
+        state = self._state
+        if state is None:
+            return False
+        n = len(products)
+        ids = np.fromiter((p.id for p in products), dtype=np.int64, count=n)
+        if not np.array_equal(ids, state[0]):
+            return False
+        stocks = np.fromiter((p.stock for p in products), dtype=np.int64, count=n)
+        with self._lock:
+            self._state = (state[0], stocks) + state[2:]
+            self._memo.clear()
+            self.stock_version = stock_version
+        self.stock_refreshes += 1
+        return True
+
+    # ----------------------------------------------------------
+    # Método privado: _refresh_in_background
+    # ----------------------------------------------------------
+    # Lanza refresh() en un hilo si la versión cambió y no hay otra
+    # reconstrucción en curso. Sin índice previo, construye en línea.
+    # ----------------------------------------------------------
+    def _refresh_in_background(self) -> None:
+        if self._state is None:
+            self.refresh()
+            return
+        if self._versions() == (self.version, self.stock_version):
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("No se pudo actualizar el índice de similitud")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="similarity-refresh", daemon=True).start()
+
+    # ----------------------------------------------------------
+    # Método: similar
+    # ----------------------------------------------------------
+    # Retorna hasta "k" pares (id, similitud) de los productos más
+    # parecidos a "product_id", de mayor a menor similitud. Con
+    # "in_stock_only" se excluyen los productos agotados.
+    # Retorna None si el producto no está en el índice.
+    #
+    # Responde desde los vecinos precalculados si alcanzan: hay "k" que
+    # pasan el filtro de stock, o la lista no está llena (el producto no
+    # se parece a ningún otro fuera de ella). Si no, recorre el catálogo.
+    # ----------------------------------------------------------
+    def similar(self, product_id: int, k: int = 5, in_stock_only: bool = False) -> Optional[List[Tuple[int, float]]]:
+        if not self.enabled:
+            return []
+        self._refresh_in_background()
+        memo_key = (product_id, k, in_stock_only)
+        with self._lock:
+            if self._refreshing:
+                self.stale_queries += 1
+            cached = self._memo.get(memo_key)
+            if cached is not None:
+                self._memo.move_to_end(memo_key)
+                return cached
+            state = self._state
+        ids, stocks, indptr, cols, vals, t_indptr, t_rows, t_vals, neighbors, neighbor_scores = state
+
+        import numpy as np
+
+        i = int(np.searchsorted(ids, product_id))
+        if i >= len(ids) or ids[i] != product_id:
+            return None
+
+        result = None
+        if neighbors is not None and 0 < k <= neighbors.shape[1]:
+            rows = neighbors[i]
+            found = rows >= 0
+            if in_stock_only:
+                found &= stocks[rows] > 0
+            picked = np.flatnonzero(found)[:k]
+            if len(picked) == k or rows[-1] < 0:
+                result = [(int(ids[rows[j]]), round(float(neighbor_scores[i, j]), 4)) for j in picked]
+                self.neighbor_hits += 1
+        if result is None:
+            result = self._scan(state, i, k, in_stock_only)
+
+        with self._lock:
+            if state is self._state:
+                self._memo[memo_key] = result
+                if len(self._memo) > self.memo_size:
+                    self._memo.popitem(last=False)
+        return result
+
+    # Similitud contra todo el catálogo (consultas que no resuelven los vecinos precalculados)
+    def _scan(self, state, i: int, k: int, in_stock_only: bool) -> List[Tuple[int, float]]:
+        import numpy as np
+
+        ids, stocks, indptr, cols, vals, t_indptr, t_rows, t_vals = state[:8]
+        self.full_scans += 1
+        # Solo se suman los productos que comparten alguna característica con el consultado
+        # (dentro de una característica cada producto aparece una sola vez)
+        scores = np.zeros(len(ids), dtype=np.float32)
+        for col, weight in zip(cols[indptr[i]:indptr[i + 1]], vals[indptr[i]:indptr[i + 1]]):
+            a, b = t_indptr[col], t_indptr[col + 1]
+            scores[t_rows[a:b]] += t_vals[a:b] * weight
+        scores[i] = -1.0
+        if in_stock_only:
+            scores[stocks <= 0] = -1.0
+        k = min(k, len(ids) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(scores, len(scores) - k)[-k:]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[j]), round(float(scores[j]), 4)) for j in top if scores[j] > 0]
+
+    def stats(self) -> Dict[str, object]:
+        state = self._state
+        return {
+            "enabled": self.enabled,
+            "version": self.version,
+            "stock_version": self.stock_version,
+            "products": 0 if state is None else int(len(state[0])),
+            "features": len(self._vocab),
+            "features_in_use": self._features_in_use,
+            "nonzeros": 0 if state is None else int(len(state[3])),
+            "top_k": self.top_k,
+            "neighbors_ms": self.neighbors_ms,
+            "neighbor_hits": self.neighbor_hits,
+            "full_scans": self.full_scans,
+            "index_bytes": 0 if state is None else int(sum(a.nbytes for a in state if a is not None)),
+            "rebuilds": self.rebuilds,
+            "stock_refreshes": self.stock_refreshes,
+            "refreshing": self._refreshing,
+            "computing_neighbors": self._computing_neighbors,
+            "stale_queries": self.stale_queries,
+            "rows_computed": self.rows_computed,
+            "rows_reused": self.rows_reused,
+            "memoized_queries": len(self._memo),
+        }
+
+
+# --------------------------------------------------------------
+# Fuentes del índice compartido
+# --------------------------------------------------------------
+# Leen el catálogo desde el snapshot mmap (o SQL si está desactivado),
+# con una sesión de BD propia para poder usarse desde cualquier hilo.
+def _with_repo(fn):
+    db = SessionLocal()
+    try:
+        return fn(SnapshotProductRepository(SQLProductRepository(db), catalog_snapshot))
+    finally:
+        db.close()
+
+
+def _catalog_version() -> int:
+    return _with_repo(lambda repo: repo.get_catalog_version()[0])
+
+
+def _stock_version() -> int:
+    return _with_repo(lambda repo: repo.get_stock_version()[0])
+
+
+def _catalog_products() -> List[Product]:
+    return _with_repo(lambda repo: repo.get_all())
+
+
+# --------------------------------------------------------------
+# Instancia compartida para este proceso
+# --------------------------------------------------------------
+# Alternativas con stock que se sugieren en el prompt por producto agotado
+PROMPT_ALTERNATIVES = int(os.getenv("PROMPT_ALTERNATIVES", "2"))
+
+similarity_index = SimilarityIndex.from_env(_catalog_version, _catalog_products, _stock_version)
@@ -0,0 +1,513 @@
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from src.domain.entities import Product
+from src.infrastructure.db.database import engine as default_engine
+from src.infrastructure.db.models import ProductModel
+from .version import read_catalog_version, read_stock_version
+
+try:
+    import fcntl
+except ImportError:  # Windows: no hay flock, se publica sin bloqueo entre procesos
+    fcntl = None
+
+# --------------------------------------------------------------
+# Módulo: snapshot.py
+# --------------------------------------------------------------
+# Este módulo implementa una "foto" binaria y compacta del catálogo de
+# productos, pensada para compartirse entre varios workers de uvicorn.
+#
+# En lugar de que cada worker consulte y guarde su propia copia de los
+# productos, el catálogo se escribe en un archivo con arreglos por
+# columna y una tabla de cadenas deduplicada. Cada worker lo abre con
+# mmap en modo solo lectura, de modo que el sistema operativo comparte
+# las mismas páginas de memoria entre todos los procesos.
+#
+# Formato del archivo (orden de bytes nativo, secciones consecutivas):
+#   cabecera  : magic, formato, cantidad, versión del catálogo,
+#               fecha de actualización del catálogo, versión del stock,
+#               fecha del último cambio de stock, cantidad de cadenas
+#   id        : int64[n]
+#   price     : float64[n]
+#   stock     : int64[n]
+#   name, brand, category, size, color, description : uint32[n] cada una
+#               (índices a la tabla de cadenas)
+#   offsets   : uint32[cadenas + 1]
+#   blob      : bytes UTF-8 de todas las cadenas
+#
+# El archivo se reemplaza de forma atómica (escritura en un temporal y
+# os.replace); los lectores detectan el cambio con os.stat y pasan a la
+# nueva versión sin afectar a las vistas que todavía usan la anterior.
+#
+# Los cambios de stock (reservas) no cambian la versión del catálogo ni
+# reescriben el archivo: solo se sobrescriben en el mismo archivo los
+# valores de la columna "stock" de los productos afectados y la versión
+# del stock de la cabecera. Como todos los procesos mapean el archivo
+# compartido, ven el stock nuevo sin volver a cargarlo.
+# --------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"CATSNAP1"
+_FORMAT = 2
+_HEADER = struct.Struct("=8sIIQdQdI4x")
+_STOCK = struct.Struct("=q")
+_STR_COLUMNS = ("name", "brand", "category", "size", "color", "description")
+
+
+# SQLite devuelve las fechas sin zona horaria; se guardan siempre en UTC
+def _as_utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+# --------------------------------------------------------------
+# Clase: CatalogSnapshot
+# --------------------------------------------------------------
+# Archivo de catálogo mapeado en memoria. Las columnas se exponen como
+# memoryviews sobre el mmap, sin copiar los datos.
+# --------------------------------------------------------------
+class CatalogSnapshot:
+    def __init__(self, path: str):
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, count, version, updated_at, _, _, n_strings = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or fmt != _FORMAT:
+            raise ValueError(f"Archivo de catálogo inválido: {path}")
+
+        self.path = path
+        self.count = count
+        self.version = version
+        self.updated_at = updated_at
+
+        mv = memoryview(self._mm)
+        offset = _HEADER.size
+
+        def take(fmt_char: str, n: int) -> memoryview:
+            nonlocal offset
+            size = struct.calcsize(fmt_char) * n
+            view = mv[offset:offset + size].cast(fmt_char)
+            offset += size
+            return view
+
+        self.ids = take("q", count)
+        self.prices = take("d", count)
+        self.stocks = take("q", count)
+        self.str_columns: Dict[str, memoryview] = {c: take("I", count) for c in _STR_COLUMNS}
+        self._offsets = take("I", n_strings + 1)
+        self._blob = mv[offset:]
+
+    # La versión del stock se lee de la cabecera en cada consulta, porque
+    # las reservas la actualizan sobre el mismo archivo
+    @property
+    def stock_version(self) -> Tuple[int, Optional[float]]:
+        _, _, _, _, _, stock_version, stock_updated_at, _ = _HEADER.unpack_from(self._mm, 0)
+        return stock_version, stock_updated_at or None
+
+    # Decodifica la cadena con índice "j" de la tabla de cadenas
+    def string(self, j: int) -> str:
+        return str(self._blob[self._offsets[j]:self._offsets[j + 1]], "utf-8")
+
+    # Posición de un producto por ID (los IDs están ordenados)
+    def index_of(self, product_id: int) -> Optional[int]:
+        i = bisect.bisect_left(self.ids, product_id)
+        if i < self.count and self.ids[i] == product_id:
+            return i
+        return None
+
+    def view(self, i: int) -> "ProductView":
+        return ProductView(self, i)
+
+    def __iter__(self) -> Iterator["ProductView"]:
+        return (ProductView(self, i) for i in range(self.count))
+
+    def __len__(self) -> int:
+        return self.count
+
+
+# --------------------------------------------------------------
+# Clase: ProductView
+# --------------------------------------------------------------
+# Vista de solo lectura de un producto dentro del snapshot. Expone los
+# mismos atributos que la entidad Product (y is_available), por lo que
+# puede usarse donde se espera un Product: DTOs, prompts del LLM, etc.
+# --------------------------------------------------------------
+class ProductView:
+    __slots__ = ("_snap", "_i")
+
+    def __init__(self, snap: CatalogSnapshot, i: int):
+        self._snap = snap
+        self._i = i
+
+    def _str(self, column: str) -> str:
+        return self._snap.string(self._snap.str_columns[column][self._i])
+
+    @property
+    def id(self) -> int:
+        return self._snap.ids[self._i]
+
+    @property
+    def name(self) -> str:
+        return self._str("name")
+
+    @property
+    def brand(self) -> str:
+        return self._str("brand")
+
+    @property
+    def category(self) -> str:
+        return self._str("category")
+
+    @property
+    def size(self) -> str:
+        return self._str("size")
+
+    @property
+    def color(self) -> str:
+        return self._str("color")
+
+    @property
+    def price(self) -> float:
+        return self._snap.prices[self._i]
+
+    @property
+    def stock(self) -> int:
+        return self._snap.stocks[self._i]
+
+    @property
+    def description(self) -> str:
+        return self._str("description")
+
+    # Indica si el producto está disponible (stock mayor que 0).
+    def is_available(self) -> bool:
+        return self.stock > 0
+
+    # Copia la vista a una entidad Product independiente del snapshot.
+    def to_entity(self) -> Product:
+        return Product(
+            id=self.id, name=self.name, brand=self.brand, category=self.category,
+            size=self.size, color=self.color, price=self.price, stock=self.stock,
+            description=self.description,
+        )
+
+    def __repr__(self) -> str:
+        return f"ProductView(id={self.id}, name={self.name!r}, version={self._snap.version})"
+
+
+# --------------------------------------------------------------
+# Función: write_snapshot
+# --------------------------------------------------------------
+# Serializa las filas de productos (ordenadas por id) en un archivo
+# temporal y lo publica con os.replace (reemplazo atómico).
+# --------------------------------------------------------------
+def write_snapshot(path: str, rows: List[Tuple], version: int, updated_at: Optional[datetime] = None,
+                   stock_version: int = 0, stock_updated_at: Optional[datetime] = None) -> None:
+    strings: Dict[str, int] = {}
+    blob = bytearray()
+    offsets = array("I", [0])
+
+    def intern(value: Optional[str]) -> int:
+        value = value or ""
+        j = strings.get(value)
+        if j is None:
+            j = strings[value] = len(offsets) - 1
+            blob.extend(value.encode("utf-8"))
+            offsets.append(len(blob))
+        return j
+
+    ids, prices, stocks = array("q"), array("d"), array("q")
+    str_cols = {c: array("I") for c in _STR_COLUMNS}
+    for r in rows:
+        ids.append(r.id)
+        prices.append(r.price)
+        stocks.append(r.stock)
+        for c in _STR_COLUMNS:
+            str_cols[c].append(intern(getattr(r, c)))
+
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        updated_ts = _as_utc(updated_at).timestamp() if updated_at else time.time()
+        stock_ts = _as_utc(stock_updated_at).timestamp() if stock_updated_at else 0.0
+        fh.write(_HEADER.pack(_MAGIC, _FORMAT, len(ids), version, updated_ts,
+                              stock_version, stock_ts, len(offsets) - 1))
+        for arr in (ids, prices, stocks, *(str_cols[c] for c in _STR_COLUMNS), offsets):
+            arr.tofile(fh)
+        fh.write(blob)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+# --------------------------------------------------------------
+# Función: read_snapshot_versions
+# --------------------------------------------------------------
+# Lee solo la cabecera del archivo y retorna (versión del catálogo,
+# versión del stock). Retorna None si no existe o no es un snapshot
+# válido.
+# --------------------------------------------------------------
+def read_snapshot_versions(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        with open(path, "rb") as fh:
+            magic, fmt, _, version, _, stock_version, _, _ = _HEADER.unpack(fh.read(_HEADER.size))
+    except (OSError, struct.error):
+        return None
+    return (version, stock_version) if magic == _MAGIC and fmt == _FORMAT else None
+
+
+def read_snapshot_version(path: str) -> Optional[int]:
+    versions = read_snapshot_versions(path)
+    return versions[0] if versions else None
+
+
+# --------------------------------------------------------------
+# Función: update_snapshot_stock
+# --------------------------------------------------------------
+# Sobrescribe en el archivo el stock de los productos indicados
+# [(id, stock), ...] y la versión del stock de la cabecera. Retorna
+# False (sin escribir nada) si el archivo no es de la versión de
+# catálogo "version" o si falta alguno de los productos: en ese caso
+# hay que publicar el snapshot completo.
+# --------------------------------------------------------------
+def update_snapshot_stock(path: str, version: int, stocks: List[Tuple[int, int]],
+                          stock_version: int, stock_updated_at: Optional[datetime]) -> bool:
+    with open(path, "r+b") as fh:
+        mm = mmap.mmap(fh.fileno(), 0)
+        ids = None
+        try:
+            magic, fmt, count, file_version, updated_ts, file_stock_version, stock_ts, n_strings = \
+                _HEADER.unpack_from(mm, 0)
+            if magic != _MAGIC or fmt != _FORMAT or file_version != version:
+                return False
+            ids = memoryview(mm)[_HEADER.size:_HEADER.size + 8 * count].cast("q")
+            stocks_offset = _HEADER.size + 16 * count
+            positions = []
+            for product_id, stock in stocks:
+                i = bisect.bisect_left(ids, product_id)
+                if i >= count or ids[i] != product_id:
+                    return False
+                positions.append((i, stock))
+            for i, stock in positions:
+                _STOCK.pack_into(mm, stocks_offset + 8 * i, stock)
+            if stock_version > file_stock_version:
+                stock_ts = _as_utc(stock_updated_at).timestamp() if stock_updated_at else time.time()
+                _HEADER.pack_into(mm, 0, magic, fmt, count, file_version, updated_ts,
+                                  stock_version, stock_ts, n_strings)
+            mm.flush()
+            return True
+        finally:
+            if ids is not None:
+                ids.release()
+            mm.close()
+
+
+# --------------------------------------------------------------
+# Clase: CatalogSnapshotStore
+# --------------------------------------------------------------
+# Punto de acceso al snapshot para un proceso:
+# - current(): snapshot mapeado más reciente (se recarga si el archivo
+#   fue reemplazado por otro proceso).
+# - publish(): regenera el archivo a partir de la base de datos.
+# - publish_soon(): igual que publish, pero diferido unos milisegundos
+#   para agrupar muchas escrituras seguidas en una sola regeneración.
+# - publish_stock_soon(ids): tras una reserva, actualiza solo el stock
+#   de esos productos en el archivo (también diferido y agrupado); si el
+#   archivo no está en la versión actual del catálogo, lo regenera.
+# - ensure_fresh(): regenera solo si las versiones del archivo no
+#   coinciden con las de "catalog_meta" (se usa al arrancar).
+# Las escrituras sobre el archivo se serializan entre procesos con
+# flock sobre "{path}.lock".
+# --------------------------------------------------------------
+class CatalogSnapshotStore:
+    def __init__(self, path: str, enabled: bool = True, bind: Optional[Engine] = None,
+                 publish_delay: float = 0.2):
+        self.path = path
+        self.enabled = enabled
+        self.engine = bind or default_engine
+        self.publish_delay = publish_delay
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._stat_key = None
+        self._lock = threading.Lock()
+        self._pending: Optional[threading.Timer] = None
+        self._pending_full = False
+        self._pending_stock: Set[int] = set()
+        self.stock_updates = 0
+
+    @classmethod
+    def from_env(cls) -> "CatalogSnapshotStore":
+        return cls(
+            path=os.getenv("CATALOG_SNAPSHOT_PATH", "./data/catalog.snapshot"),
+            enabled=os.getenv("CATALOG_SNAPSHOT_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"},
+            publish_delay=float(os.getenv("CATALOG_PUBLISH_DELAY_MS", "200")) / 1000,
+        )
+
+    def current(self) -> Optional[CatalogSnapshot]:
+        if not self.enabled:
+            return None
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if key != self._stat_key:
+            with self._lock:
+                if key != self._stat_key:
+                    # Las vistas que aún apuntan al snapshot anterior lo mantienen
+                    # vivo; el mmap viejo se libera cuando ya nadie lo referencia.
+                    self._snapshot = CatalogSnapshot(self.path)
+                    self._stat_key = key
+        return self._snapshot
+
+    @contextmanager
+    def _file_lock(self):
+        lock_fh = open(f"{self.path}.lock", "a+") if fcntl else None
+        try:
+            if lock_fh:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            yield
+        finally:
+            if lock_fh:
+                fcntl.flock(lock_fh, fcntl.LOCK_UN)
+                lock_fh.close()
+
+    def publish(self) -> Optional[int]:
+        if not self.enabled:
+            return None
+        with self._file_lock():
+            return self._publish_locked()
+
+    def _publish_locked(self) -> Optional[int]:
+        t = ProductModel.__table__
+        with self.engine.connect() as conn:
+            version, updated_at = read_catalog_version(conn)
+            stock_version, stock_updated_at = read_stock_version(conn)
+            rows = conn.execute(
+                select(t.c.id, t.c.name, t.c.brand, t.c.category, t.c.size,
+                       t.c.color, t.c.price, t.c.stock, t.c.description)
+                .order_by(t.c.id)
+            ).all()
+        # No se sobrescribe un snapshot más nuevo publicado por otro proceso
+        existing = read_snapshot_versions(self.path)
+        if existing is not None and existing > (version, stock_version):
+            return existing[0]
+        try:
+            write_snapshot(self.path, rows, version, updated_at, stock_version, stock_updated_at)
+        except OSError:
+            # Por ejemplo en Windows, donde no se puede reemplazar un archivo
+            # mapeado por otro proceso. Este proceso vuelve a leer desde SQL
+            # para no servir un catálogo desactualizado.
+            logger.exception("No se pudo publicar el snapshot; se desactiva en este proceso")
+            self.enabled = False
+            return None
+        logger.info("Snapshot de catálogo publicado (versión %s, %s productos)", version, len(rows))
+        return version
+
+    # ----------------------------------------------------------
+    # Método: publish_stock
+    # ----------------------------------------------------------
+    # Copia de la base de datos al archivo el stock actual de los
+    # productos indicados. Se lee dentro del flock, así el último en
+    # escribir siempre escribe el valor más reciente.
+    # ----------------------------------------------------------
+    def publish_stock(self, product_ids: Iterable[int]) -> Optional[int]:
+        if not self.enabled:
+            return None
+        ids = sorted(set(product_ids))
+        t = ProductModel.__table__
+        with self._file_lock():
+            with self.engine.connect() as conn:
+                version, _ = read_catalog_version(conn)
+                stock_version, stock_updated_at = read_stock_version(conn)
+                stocks = [tuple(r) for r in conn.execute(
+                    select(t.c.id, t.c.stock).where(t.c.id.in_(ids)).order_by(t.c.id)
+                )] if ids else []
+            try:
+                updated = update_snapshot_stock(self.path, version, stocks, stock_version, stock_updated_at)
+            except (OSError, ValueError):
+                updated = False
+            if not updated:
+                return self._publish_locked()
+        self.stock_updates += 1
+        return version
+
+    def _schedule(self) -> None:
+        if self._pending is None:
+            self._pending = threading.Timer(self.publish_delay, self._publish_pending)
+            self._pending.daemon = True
+            self._pending.start()
+
+    def publish_soon(self) -> None:
+        if not self.enabled:
+            return
+        if self.publish_delay <= 0:
+            self.publish()
+            return
+        with self._lock:
+            self._pending_full = True
+            self._schedule()
+
+    def publish_stock_soon(self, product_ids: Iterable[int]) -> None:
+        if not self.enabled:
+            return
+        if self.publish_delay <= 0:
+            self.publish_stock(product_ids)
+            return
+        with self._lock:
+            self._pending_stock.update(product_ids)
+            self._schedule()
+
+    # Toma lo pendiente y lo publica: el archivo completo si se pidió,
+    # o si no, solo el stock de los productos acumulados
+    def _take_pending(self) -> Tuple[bool, Set[int]]:
+        with self._lock:
+            full, ids = self._pending_full, self._pending_stock
+            self._pending, self._pending_full, self._pending_stock = None, False, set()
+        return full, ids
+
+    def _publish_taken(self, full: bool, ids: Set[int]) -> None:
+        if full:
+            self.publish()
+        elif ids:
+            self.publish_stock(ids)
+
+    def _publish_pending(self) -> None:
+        try:
+            self._publish_taken(*self._take_pending())
+        except Exception:
+            logger.exception("No se pudo publicar el snapshot diferido")
+
+    # Publica de inmediato si hay una publicación diferida pendiente (al cerrar)
+    def flush(self) -> None:
+        with self._lock:
+            pending = self._pending
+        if pending is not None:
+            pending.cancel()
+            self._publish_taken(*self._take_pending())
+
+    def ensure_fresh(self) -> Optional[int]:
+        if not self.enabled:
+            return None
+        with self.engine.connect() as conn:
+            version, _ = read_catalog_version(conn)
+            stock_version, _ = read_stock_version(conn)
+        if read_snapshot_versions(self.path) != (version, stock_version):
+            return self.publish()
+        return version
+
+
+# --------------------------------------------------------------
+# Instancia compartida del snapshot para este proceso
+# --------------------------------------------------------------
+catalog_snapshot = CatalogSnapshotStore.from_env()
@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+from typing import Tuple, Optional
+
+from sqlalchemy import select, update, insert
+
+from src.infrastructure.db.models import CatalogMetaModel
+
+# --------------------------------------------------------------
+# Módulo: version.py
+# --------------------------------------------------------------
+# Funciones para leer e incrementar la versión del catálogo guardada
+# en la tabla "catalog_meta". Reciben una Session o una Connection de
+# SQLAlchemy, para poder ejecutarse dentro de la transacción que
+# modifica los productos.
+#
+# La versión del stock es aparte: las reservas cambian solo el stock y
+# no deben invalidar lo que depende del resto de los campos (ETags del
+# catálogo, índice de similitud, snapshot completo).
+# --------------------------------------------------------------
+
+_meta = CatalogMetaModel.__table__
+
+
+# --------------------------------------------------------------
+# Función: read_catalog_version
+# --------------------------------------------------------------
+# Retorna (versión, fecha de actualización). Si la fila aún no existe
+# retorna (0, None).
+# --------------------------------------------------------------
+def read_catalog_version(conn) -> Tuple[int, Optional[datetime]]:
+    row = conn.execute(
+        select(_meta.c.version, _meta.c.updated_at).where(_meta.c.id == 1)
+    ).first()
+    if row is None:
+        return 0, None
+    return row[0], row[1]
+
+
+# --------------------------------------------------------------
+# Función: bump_catalog_version
+# --------------------------------------------------------------
+# Incrementa la versión en una sola sentencia UPDATE (sin leer antes
+# el valor). Si la fila no existe la crea con versión 1.
+# No hace commit: lo hace quien controla la transacción.
+# --------------------------------------------------------------
+def bump_catalog_version(conn) -> None:
+    now = datetime.now(timezone.utc)
+    result = conn.execute(
+        update(_meta)
+        .where(_meta.c.id == 1)
+        .values(version=_meta.c.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(_meta).values(id=1, version=1, updated_at=now))
+
+
+# --------------------------------------------------------------
+# Función: read_stock_version
+# --------------------------------------------------------------
+# Retorna (versión del stock, fecha del último cambio de stock). Si la
+# fila aún no existe retorna (0, None).
+# --------------------------------------------------------------
+def read_stock_version(conn) -> Tuple[int, Optional[datetime]]:
+    row = conn.execute(
+        select(_meta.c.stock_version, _meta.c.stock_updated_at).where(_meta.c.id == 1)
+    ).first()
+    if row is None:
+        return 0, None
+    return row[0], row[1]
+
+
+# --------------------------------------------------------------
+# Función: bump_stock_version
+# --------------------------------------------------------------
+# Igual que bump_catalog_version, pero solo para cambios de stock.
+# No hace commit.
+# --------------------------------------------------------------
+def bump_stock_version(conn) -> None:
+    now = datetime.now(timezone.utc)
+    result = conn.execute(
+        update(_meta)
+        .where(_meta.c.id == 1)
+        .values(stock_version=_meta.c.stock_version + 1, stock_updated_at=now)
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(_meta).values(id=1, version=1, updated_at=now, stock_version=1, stock_updated_at=now))
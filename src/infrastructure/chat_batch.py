@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from src.application.chat_service import ChatService
+from src.application.dtos import ChatMessageRequestDTO, ChatBatchResponseDTO
+from src.infrastructure.api.dependencies import product_repository, chat_repository
+from src.infrastructure.catalog.similarity import similarity_index, PROMPT_ALTERNATIVES
+from src.infrastructure.db.database import SessionLocal
+from src.infrastructure.llm_providers.factory import get_ai_service
+
+# --------------------------------------------------------------
+# Módulo: chat_batch.py
+# --------------------------------------------------------------
+# Punto de entrada de biblioteca y de línea de comandos para procesar
+# lotes de mensajes de chat sin pasar por HTTP (por ejemplo, los jobs
+# nocturnos de QA y cobertura del catálogo).
+#
+# Uso como biblioteca:
+#     from src.infrastructure.chat_batch import run_chat_batch
+#     result = run_chat_batch([ChatMessageRequestDTO(...), ...])
+#
+# Uso por consola (un JSON por línea con session_id y message):
+#     python -m src.infrastructure.chat_batch preguntas.jsonl > respuestas.json
+# --------------------------------------------------------------
+
+load_dotenv()
+
+# Concurrencia por defecto de las llamadas al modelo y tamaño máximo del lote
+DEFAULT_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "4"))
+MAX_BATCH_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "1000"))
+
+
+# --------------------------------------------------------------
+# Función: process_chat_batch
+# --------------------------------------------------------------
+# Versión asíncrona: abre una sesión de base de datos, arma el
+# ChatService con el proveedor de IA compartido y procesa el lote.
+# --------------------------------------------------------------
+async def process_chat_batch(
+    requests: List[ChatMessageRequestDTO], max_concurrency: Optional[int] = None
+) -> ChatBatchResponseDTO:
+    db = SessionLocal()
+    try:
+        service = ChatService(product_repository(db), chat_repository(db), get_ai_service(),
+                              similarity=similarity_index, alternatives_per_product=PROMPT_ALTERNATIVES)
+        return await service.process_batch(requests, max_concurrency or DEFAULT_CONCURRENCY)
+    finally:
+        db.close()
+
+
+# --------------------------------------------------------------
+# Función: run_chat_batch
+# --------------------------------------------------------------
+# Versión síncrona para scripts que no usan asyncio.
+# --------------------------------------------------------------
+def run_chat_batch(
+    requests: List[ChatMessageRequestDTO], max_concurrency: Optional[int] = None
+) -> ChatBatchResponseDTO:
+    return asyncio.run(process_chat_batch(requests, max_concurrency))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Procesa un lote de mensajes de chat")
+    parser.add_argument("input", help="Archivo JSONL con objetos {session_id, message} ('-' = stdin)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    fh = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    with fh:
+        requests = [ChatMessageRequestDTO(**json.loads(line)) for line in fh if line.strip()]
+
+    result = run_chat_batch(requests, args.concurrency)
+    print(result.model_dump_json(indent=2))
+    return 0 if result.failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from src.domain.entities import ChatMessage
+from src.infrastructure.api.dependencies import chat_repository
+from src.infrastructure.cache.session_context_cache import session_cache
+from src.infrastructure.db.database import SessionLocal
+from src.infrastructure.file_lock import locked, try_lock, unlock
+
+# --------------------------------------------------------------
+# Módulo: chat_writer.py
+# --------------------------------------------------------------
+# Escritura en segundo plano de los mensajes de chat, para que la
+# respuesta al cliente (POST /chat, WebSocket) no espere el INSERT.
+#
+# Comportamiento:
+# - antes de retornar, submit() anota los mensajes en el diario del
+#   proceso (CHAT_WRITE_JOURNAL_DIR, un JSONL por proceso) con fsync;
+#   cuando la escritura termina se marca como hecha, y el diario se vacía
+#   cada vez que no queda ninguna pendiente. Si el proceso cae, recover()
+#   reinserta lo anotado y no marcado (omitiendo los mensajes que ya
+#   estén en la base de datos). Cada proceso mantiene un flock sobre su
+#   diario mientras vive, así recover() solo toma los de procesos muertos;
+# - las escrituras de una misma sesión se aplican en el orden en que se
+#   enviaron; wait_for(sesión) espera las que sigan pendientes (el
+#   siguiente turno lo usa antes de guardar el mensaje del usuario);
+# - cada escritura se reintenta CHAT_WRITE_RETRIES veces con espera
+#   creciente;
+# - si aun así falla, los mensajes se agregan a un archivo local
+#   (CHAT_WRITE_DEAD_LETTER, JSONL) con fsync, y se reinsertan con
+#   recover() al siguiente arranque (serve.py lo llama una vez en el
+#   proceso principal; el archivo se protege con flock sobre
+#   "{archivo}.lock", así que varios workers no lo reinsertan dos veces
+#   ni pierden lo que otro agrega mientras se recupera);
+# - flush() espera las escrituras pendientes (se llama al cerrar la
+#   aplicación);
+# - los errores se registran en el log y se cuentan en stats().
+#
+# Si no se puede escribir el diario, submit() espera la escritura en la
+# base de datos antes de retornar. Con CHAT_WRITE_JOURNAL_DIR vacío no
+# hay diario y la escritura es best-effort: una caída del proceso antes
+# del INSERT pierde la respuesta aunque el cliente ya la haya recibido.
+# --------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+
+# Formato de un mensaje en el diario y en el archivo de pendientes
+def _record(m: ChatMessage) -> Dict[str, str]:
+    return {
+        "session_id": m.session_id,
+        "role": m.role,
+        "message": m.message,
+        "timestamp": m.timestamp.isoformat(),
+    }
+
+
+def _message(rec: Dict[str, str]) -> ChatMessage:
+    return ChatMessage(None, rec["session_id"], rec["role"], rec["message"],
+                       datetime.fromisoformat(rec["timestamp"]))
+
+
+class ChatWriter:
+    def __init__(self, retries: int = 3, backoff_seconds: float = 0.2,
+                 dead_letter_path: str = "./data/chat_writes_failed.jsonl",
+                 journal_dir: Optional[str] = "./data/chat_journal"):
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.dead_letter_path = dead_letter_path
+        self.journal_dir = journal_dir or None
+        # Diario de este proceso (se abre, con flock, en la primera escritura)
+        self._journal = None
+        self._journal_path: Optional[str] = None
+        self._journal_lock = threading.Lock()
+        self._journal_entries = 0
+        self._journal_open = 0
+        self._pending: Set[asyncio.Task] = set()
+        # Última escritura programada de cada sesión
+        self._tails: Dict[str, asyncio.Task] = {}
+        self._file_lock = threading.Lock()
+        self.written = 0
+        self.retried = 0
+        self.errors = 0
+        self.dead_lettered = 0
+        self.recovered = 0
+        self.journal_errors = 0
+
+    @classmethod
+    def from_env(cls) -> "ChatWriter":
+        return cls(
+            retries=int(os.getenv("CHAT_WRITE_RETRIES", "3")),
+            backoff_seconds=float(os.getenv("CHAT_WRITE_BACKOFF_SECONDS", "0.2")),
+            dead_letter_path=os.getenv("CHAT_WRITE_DEAD_LETTER", "./data/chat_writes_failed.jsonl"),
+            journal_dir=os.getenv("CHAT_WRITE_JOURNAL_DIR", "./data/chat_journal").strip(),
+        )
+
+    # ----------------------------------------------------------
+    # Método: submit
+    # ----------------------------------------------------------
+    # Programa la escritura de los mensajes (en orden, en una sola
+    # transacción, después de las escrituras anteriores de las mismas
+    # sesiones) y retorna en cuanto quedan anotados en el diario (o,
+    # si el diario falla, cuando termina la escritura). Debe llamarse
+    # desde el event loop.
+    # ----------------------------------------------------------
+    async def submit(self, messages: List[ChatMessage]) -> asyncio.Task:
+        messages = list(messages)
+        sessions = {m.session_id for m in messages}
+        previous = [self._tails[s] for s in sessions if s in self._tails]
+        journaled = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(self._write(messages, previous, journaled))
+        for s in sessions:
+            self._tails[s] = task
+        self._pending.add(task)
+        task.add_done_callback(lambda t: self._done(t, sessions))
+        if not await journaled:
+            await asyncio.wait({task})
+        return task
+
+    def _done(self, task: asyncio.Task, sessions: Set[str]) -> None:
+        self._pending.discard(task)
+        for s in sessions:
+            if self._tails.get(s) is task:
+                del self._tails[s]
+
+    # Espera a que terminen (bien o mal) las escrituras pendientes de la sesión
+    async def wait_for(self, session_id: str) -> None:
+        task = self._tails.get(session_id)
+        if task is not None:
+            await asyncio.wait({task})
+
+    async def _write(self, messages: List[ChatMessage], previous: List[asyncio.Task] = (),
+                     journaled: Optional[asyncio.Future] = None) -> None:
+        entry = None
+        try:
+            entry = await asyncio.to_thread(self._journal_append, messages)
+        except Exception:
+            self.journal_errors += 1
+            logger.exception("No se pudo escribir el diario de mensajes; se espera el guardado")
+        finally:
+            if journaled is not None and not journaled.done():
+                journaled.set_result(entry is not None or self.journal_dir is None)
+
+        if previous:
+            await asyncio.wait(previous)
+        for attempt in range(self.retries + 1):
+            try:
+                await asyncio.to_thread(self._persist, messages)
+                self.written += len(messages)
+                await self._journal_finish(entry)
+                return
+            except Exception:
+                if attempt < self.retries:
+                    self.retried += 1
+                    await asyncio.sleep(self.backoff_seconds * (2 ** attempt))
+                    continue
+                self.errors += 1
+                logger.exception("No se pudieron guardar %s mensajes de chat; se guardan en %s",
+                                 len(messages), self.dead_letter_path)
+        # La caché tenía estos mensajes como pendientes: se descarta la sesión
+        for session_id in {m.session_id for m in messages}:
+            session_cache.invalidate(session_id)
+        try:
+            await asyncio.to_thread(self._dead_letter, messages)
+            self.dead_lettered += len(messages)
+        except Exception:
+            # Queda sin marcar en el diario: recover() la reinserta al arrancar
+            logger.exception("Tampoco se pudo escribir el archivo de mensajes pendientes")
+            return
+        await self._journal_finish(entry)
+
+    # ----------------------------------------------------------
+    # Métodos privados: _journal_append / _journal_done
+    # ----------------------------------------------------------
+    # Anotan una escritura en el diario del proceso (con fsync) y la
+    # marcan como hecha. La marca no necesita fsync: si se pierde,
+    # recover() encuentra los mensajes ya guardados y los omite. Cuando
+    # no queda ninguna escritura anotada sin marcar, el diario se vacía.
+    # ----------------------------------------------------------
+    def _journal_append(self, messages: List[ChatMessage]) -> Optional[int]:
+        if self.journal_dir is None:
+            return None
+        payload = {"messages": [_record(m) for m in messages]}
+        with self._journal_lock:
+            if self._journal is None:
+                os.makedirs(self.journal_dir, exist_ok=True)
+                path = os.path.join(self.journal_dir, f"writes.{os.getpid()}.{uuid.uuid4().hex[:8]}.jsonl")
+                self._journal = try_lock(path)
+                if self._journal is None:
+                    raise OSError(f"No se pudo bloquear el diario {path}")
+                self._journal_path = path
+            self._journal_entries += 1
+            entry = self._journal_entries
+            self._journal.write(json.dumps({"entry": entry, **payload}, ensure_ascii=False) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal_open += 1
+        return entry
+
+    def _journal_done(self, entry: int) -> None:
+        with self._journal_lock:
+            self._journal_open -= 1
+            if self._journal_open == 0:
+                self._journal.flush()
+                self._journal.truncate(0)
+            else:
+                self._journal.write(json.dumps({"done": entry}) + "\n")
+                self._journal.flush()
+
+    async def _journal_finish(self, entry: Optional[int]) -> None:
+        if entry is None:
+            return
+        try:
+            await asyncio.to_thread(self._journal_done, entry)
+        except Exception:
+            logger.exception("No se pudo marcar la escritura %s en el diario", entry)
+
+    def _persist(self, messages: List[ChatMessage]) -> None:
+        db = SessionLocal()
+        try:
+            chat_repository(db).save_messages(messages)
+        finally:
+            db.close()
+
+    def _dead_letter(self, messages: List[ChatMessage]) -> None:
+        folder = os.path.dirname(os.path.abspath(self.dead_letter_path))
+        os.makedirs(folder, exist_ok=True)
+        payload = "".join(json.dumps(_record(m), ensure_ascii=False) + "\n" for m in messages)
+        with self._file_lock, locked(f"{self.dead_letter_path}.lock"), \
+                open(self.dead_letter_path, "a", encoding="utf-8") as fh:
+            fh.write(payload)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    # ----------------------------------------------------------
+    # Método: recover
+    # ----------------------------------------------------------
+    # Reinserta los mensajes del archivo de pendientes (si existe) y lo
+    # elimina, y luego los de los diarios de procesos que ya no existen.
+    # Si la base de datos sigue fallando los archivos se conservan.
+    # ----------------------------------------------------------
+    def recover(self) -> int:
+        count = self._recover_dead_letter() + self._recover_journals()
+        if count:
+            self.recovered += count
+            logger.info("Recuperados %s mensajes de chat pendientes", count)
+        return count
+
+    def _recover_dead_letter(self) -> int:
+        if not os.path.exists(self.dead_letter_path):
+            return 0
+        with self._file_lock, locked(f"{self.dead_letter_path}.lock"):
+            if not os.path.exists(self.dead_letter_path):
+                return 0  # Otro proceso ya lo recuperó
+            with open(self.dead_letter_path, encoding="utf-8") as fh:
+                messages = [_message(rec) for rec in map(json.loads, filter(str.strip, fh))]
+            if messages:
+                self._persist(messages)
+            os.remove(self.dead_letter_path)
+        return len(messages)
+
+    # ----------------------------------------------------------
+    # Método privado: _recover_journals
+    # ----------------------------------------------------------
+    # Un diario cuyo flock se puede tomar es de un proceso que terminó.
+    # Se reinsertan sus escrituras sin marcar, salvo los mensajes que ya
+    # estén guardados (la marca pudo perderse después del INSERT), y se
+    # elimina. Una última línea incompleta es una anotación que no llegó
+    # a completarse (submit() no retornó), así que se ignora.
+    # ----------------------------------------------------------
+    def _recover_journals(self) -> int:
+        if self.journal_dir is None or not os.path.isdir(self.journal_dir):
+            return 0
+        total = 0
+        for name in sorted(os.listdir(self.journal_dir)):
+            path = os.path.join(self.journal_dir, name)
+            if not name.endswith(".jsonl") or path == self._journal_path:
+                continue
+            fh = try_lock(path)
+            if fh is None:
+                continue  # El proceso sigue vivo
+            try:
+                fh.seek(0)
+                entries: Dict[int, List[ChatMessage]] = {}
+                done: Set[int] = set()
+                for line in filter(str.strip, fh):
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "done" in rec:
+                        done.add(rec["done"])
+                    else:
+                        entries[rec["entry"]] = [_message(m) for m in rec["messages"]]
+                pending = [m for entry, items in sorted(entries.items()) if entry not in done for m in items]
+                missing = self._missing(pending)
+                if missing:
+                    self._persist(missing)
+                os.remove(path)
+                total += len(missing)
+            finally:
+                unlock(fh)
+        return total
+
+    def _missing(self, messages: List[ChatMessage]) -> List[ChatMessage]:
+        if not messages:
+            return []
+        db = SessionLocal()
+        try:
+            repo = chat_repository(db)
+            return [m for m in messages
+                    if repo.find_message(m.session_id, m.role, m.message, m.timestamp) is None]
+        finally:
+            db.close()
+
+    async def flush(self) -> None:
+        while self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending_writes": len(self._pending),
+            "written_messages": self.written,
+            "retries": self.retried,
+            "write_errors": self.errors,
+            "dead_lettered_messages": self.dead_lettered,
+            "recovered_messages": self.recovered,
+            "journal": self._journal_path,
+            "journal_open_writes": self._journal_open,
+            "journal_errors": self.journal_errors,
+        }
+
+
+# --------------------------------------------------------------
+# Instancia compartida para este proceso
+# --------------------------------------------------------------
+chat_writer = ChatWriter.from_env()
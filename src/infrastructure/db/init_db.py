@@ -0,0 +1,154 @@
+import logging
+import os
+import sys
+from typing import Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+
+from .database import Base, engine as default_engine, SessionLocal
+from .init_data import load_initial_data
+from . import models  # noqa: F401  (registra las tablas en Base.metadata)
+from src.infrastructure.catalog.version import read_catalog_version, bump_catalog_version
+
+# --------------------------------------------------------------
+# Módulo: init_db.py
+# --------------------------------------------------------------
+# Este módulo concentra la creación del esquema y la carga de datos
+# iniciales, que antes se ejecutaban en cada arranque de la API.
+#
+# - init_database(): crea las tablas, inserta los datos semilla y
+#   registra la versión del esquema. Se ejecuta de forma explícita con:
+#       python -m src.infrastructure.db.init_db
+# - ensure_schema(): verificación barata que se hace al arrancar la API.
+#   En SQLite solo lee "PRAGMA user_version"; si el esquema ya está en la
+#   versión esperada no se ejecuta ninguna otra consulta.
+# - En SQLite, las columnas nuevas de tablas que ya existen se agregan
+#   con ALTER TABLE (create_all solo crea tablas completas).
+#
+# Las bases SQLite nuevas se crean con "auto_vacuum = INCREMENTAL", para
+# que la tarea de retención pueda devolver espacio al disco sin un
+# VACUUM completo. Una base existente se convierte una sola vez con:
+#       python -m src.infrastructure.db.init_db --enable-incremental-vacuum
+# --------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+# Versión actual del esquema. Debe incrementarse cada vez que se agreguen
+# tablas o índices nuevos en models.py, para que los despliegues existentes
+# ejecuten de nuevo init_database() (create_all solo crea lo que falta).
+SCHEMA_VERSION = 7
+
+
+# --------------------------------------------------------------
+# Función: get_schema_version
+# --------------------------------------------------------------
+# Retorna la versión registrada del esquema, o None si el motor no
+# permite guardarla (solo se usa "user_version" de SQLite).
+# --------------------------------------------------------------
+def get_schema_version(bind: Optional[Engine] = None) -> Optional[int]:
+    bind = bind or default_engine
+    if bind.dialect.name != "sqlite":
+        return None
+    with bind.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+# --------------------------------------------------------------
+# Función: _add_missing_columns
+# --------------------------------------------------------------
+# Agrega a las tablas existentes las columnas declaradas en models.py
+# que todavía no tienen. Las columnas nuevas deben admitir NULL o tener
+# un server_default, como exige SQLite para ADD COLUMN.
+# --------------------------------------------------------------
+def _add_missing_columns(bind: Engine) -> None:
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table.name}")')}
+            if not existing:
+                continue  # La tabla no existe: la crea create_all
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN {ddl}')
+                    logger.info("Columna agregada: %s.%s", table.name, column.name)
+
+
+# --------------------------------------------------------------
+# Función: init_database
+# --------------------------------------------------------------
+# Crea las tablas faltantes, carga los datos semilla y guarda la
+# versión del esquema.
+# --------------------------------------------------------------
+def init_database(bind: Optional[Engine] = None) -> None:
+    bind = bind or default_engine
+    if bind.dialect.name == "sqlite":
+        with bind.connect() as conn:
+            # Solo tiene efecto inmediato si el archivo aún no tiene tablas
+            if conn.exec_driver_sql("PRAGMA page_count").scalar() == 0:
+                conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        _add_missing_columns(bind)
+    Base.metadata.create_all(bind=bind)
+
+    db = SessionLocal(bind=bind)
+    try:
+        load_initial_data(db)
+        # Crea la fila de versión del catálogo si aún no existe
+        if read_catalog_version(db)[0] == 0:
+            bump_catalog_version(db)
+            db.commit()
+    finally:
+        db.close()
+
+    if bind.dialect.name == "sqlite":
+        with bind.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {int(SCHEMA_VERSION)}")
+
+
+# --------------------------------------------------------------
+# Función: ensure_schema
+# --------------------------------------------------------------
+# Verificación de arranque. Si la versión no coincide:
+# - con AUTO_INIT_DB=true (por defecto) inicializa la base de datos,
+# - con AUTO_INIT_DB=false falla indicando el comando de inicialización.
+# Para motores distintos de SQLite se conserva el comportamiento anterior
+# (create_all + seed en cada arranque).
+# --------------------------------------------------------------
+def ensure_schema(bind: Optional[Engine] = None) -> bool:
+    bind = bind or default_engine
+    version = get_schema_version(bind)
+    if version == SCHEMA_VERSION:
+        return False
+
+    auto_init = os.getenv("AUTO_INIT_DB", "true").strip().lower() in {"1", "true", "yes", "on"}
+    if version is not None and not auto_init:
+        raise RuntimeError(
+            f"Esquema de base de datos en versión {version}, se esperaba {SCHEMA_VERSION}. "
+            "Ejecuta: python -m src.infrastructure.db.init_db"
+        )
+
+    logger.info("Inicializando base de datos (versión %s → %s)", version, SCHEMA_VERSION)
+    init_database(bind)
+    return True
+
+
+# --------------------------------------------------------------
+# Comando de inicialización
+# --------------------------------------------------------------
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if "--enable-incremental-vacuum" in sys.argv[1:]:
+        from .retention import enable_incremental_vacuum
+
+        converted = enable_incremental_vacuum()
+        print("auto_vacuum=INCREMENTAL activado" if converted else "La base ya usa auto_vacuum=INCREMENTAL")
+        sys.exit(0)
+
+    init_database()
+    print(f"Base de datos inicializada (versión de esquema {get_schema_version()})")
+
+    # Publica también el snapshot del catálogo compartido por los workers
+    from src.infrastructure.catalog.snapshot import catalog_snapshot
+
+    print(f"Snapshot del catálogo: versión {catalog_snapshot.publish()} en {catalog_snapshot.path}")
+    sys.exit(0)
@@ -59,3 +59,97 @@ class ChatMemoryModel(Base):
 # Mejora la velocidad de las consultas por sesión y orden temporal.
 # Es útil para recuperar rápidamente los mensajes recientes de una sesión.
 Index("ix_chat_session_time", ChatMemoryModel.session_id, ChatMemoryModel.timestamp)
+
+
+# --------------------------------------------------------------
+# Clase: CatalogMetaModel
+# --------------------------------------------------------------
+# Representa la tabla "catalog_meta", con una única fila (id = 1)
+# que guarda la versión del catálogo. La versión se incrementa en la
+# misma transacción de cada escritura sobre "products", de modo que
+# los procesos pueden saber si su copia del catálogo está al día.
+# Las reservas y devoluciones de stock solo incrementan "stock_version":
+# así no invalidan las cachés que no dependen del stock.
+# --------------------------------------------------------------
+class CatalogMetaModel(Base):
+    __tablename__ = "catalog_meta"  # Nombre de la tabla en la base de datos
+
+    # Definición de columnas
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    stock_version = Column(Integer, nullable=False, default=0, server_default="0")
+    stock_updated_at = Column(DateTime(timezone=True), nullable=True)
+
+
+# --------------------------------------------------------------
+# Clase: ChatJobModel
+# --------------------------------------------------------------
+# Representa la tabla "chat_jobs": la cola persistente de mensajes de
+# chat que se procesan en segundo plano (POST /chat/jobs).
+# - status: 'queued', 'running', 'done' o 'failed'.
+# - visible_at: instante (epoch, segundos) desde el que el trabajo puede
+#   ser tomado por un worker. Al tomarlo se mueve al futuro (tiempo de
+#   visibilidad); si el worker muere sin terminarlo, vuelve a quedar
+#   disponible para otro.
+# - locked_by: worker que lo está procesando.
+# - result: respuesta del chat en JSON (cuando status = 'done').
+# --------------------------------------------------------------
+class ChatJobModel(Base):
+    __tablename__ = "chat_jobs"  # Nombre de la tabla en la base de datos
+
+    # Definición de columnas
+    id = Column(String(32), primary_key=True)
+    session_id = Column(String(100), nullable=False)
+    message = Column(Text, nullable=False)
+    status = Column(String(10), nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    visible_at = Column(Float, nullable=False)
+    locked_by = Column(String(64))
+    result = Column(Text)
+    error = Column(Text)
+    webhook_url = Column(String(500))
+    webhook_status = Column(Integer)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+# --------------------------------------------------------------
+# Índice compuesto: ix_chat_jobs_status_visible
+# --------------------------------------------------------------
+# Permite que los workers encuentren los trabajos disponibles
+# (status + visible_at) sin recorrer toda la tabla.
+Index("ix_chat_jobs_status_visible", ChatJobModel.status, ChatJobModel.visible_at)
+
+
+# --------------------------------------------------------------
+# Clase: ChatIdempotencyModel
+# --------------------------------------------------------------
+# Representa la tabla "chat_idempotency": la respuesta de POST /chat
+# guardada por (session_id, cabecera Idempotency-Key), para que los
+# reintentos de un cliente no vuelvan a llamar al modelo.
+# - status: 'pending' mientras la primera petición está en curso,
+#   'done' cuando ya tiene respuesta, 'abandoned' si falló y el
+#   siguiente reintento puede retomarla.
+# - fingerprint: hash del mensaje, para detectar una clave reutilizada
+#   con otro mensaje.
+# - expires_at: instante (epoch, segundos) en que la fila deja de valer;
+#   para 'pending' es el plazo tras el cual otra petición puede retomarla.
+# Tabla sin rowid: la clave primaria es la propia clave de búsqueda.
+# --------------------------------------------------------------
+class ChatIdempotencyModel(Base):
+    __tablename__ = "chat_idempotency"  # Nombre de la tabla en la base de datos
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    # Definición de columnas
+    session_id = Column(String(100), primary_key=True)
+    key = Column(String(100), primary_key=True)
+    status = Column(String(10), nullable=False)
+    fingerprint = Column(String(16), nullable=False)
+    response = Column(Text)
+    expires_at = Column(Float, nullable=False, index=True)
+    # Token de la petición que registró la clave (solo ella puede completarla o liberarla)
+    owner = Column(String(32))
+    # Fecha del primer intento: los reintentos guardan el mensaje del usuario
+    # con ella, para reconocer el que ya guardó un intento anterior
+    started_at = Column(DateTime(timezone=True))
@@ -0,0 +1,398 @@
+import gzip
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.engine import Engine
+
+from .database import engine as default_engine
+from .models import ChatMemoryModel
+from src.infrastructure.cache.session_context_cache import session_cache
+from src.infrastructure.file_lock import try_lock, unlock
+
+# --------------------------------------------------------------
+# Módulo: retention.py
+# --------------------------------------------------------------
+# Este módulo implementa la política de retención de la tabla
+# "chat_memory", que de otro modo crece indefinidamente (dos filas
+# por turno de conversación).
+#
+# La tarea de retención:
+# - Archiva las sesiones expiradas (sin actividad durante CHAT_TTL_DAYS)
+#   en archivos JSONL comprimidos con gzip y particionados por fecha.
+# - Recorta las sesiones que superan el máximo de mensajes permitido,
+#   archivando primero los mensajes más antiguos.
+# - Elimina las filas en lotes acotados, con un commit por lote, para
+#   no retener el bloqueo de escritura de SQLite durante mucho tiempo.
+# - Ejecuta periódicamente un "incremental_vacuum" para devolver al
+#   sistema de archivos las páginas liberadas (si la base usa
+#   auto_vacuum=INCREMENTAL; ver enable_incremental_vacuum).
+# - Acumula estadísticas de filas archivadas y espacio recuperado.
+#
+# Las filas siempre se escriben en el archivo antes de borrarse: si el
+# proceso se interrumpe a mitad de un lote, en el peor caso un mensaje
+# queda archivado dos veces, pero nunca se pierde.
+#
+# Con varios procesos (workers de uvicorn) la tarea periódica la ejecuta
+# uno solo: el que tiene el flock de CHAT_RETENTION_LOCK (ver
+# acquire_leadership). Si ese proceso muere, otro toma el bloqueo en su
+# siguiente intento. Además cada ejecución (también las manuales de
+# /ops/retention/run) toma "{lock}.run", para que nunca haya dos a la vez.
+# --------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+# --------------------------------------------------------------
+# Clase: RetentionConfig
+# --------------------------------------------------------------
+# Parámetros de la política de retención, leídos desde el .env.
+# - ttl_days: días sin actividad tras los cuales una sesión expira.
+# - max_messages_per_session: tope de mensajes por sesión (0 = sin tope).
+# - batch_size: número máximo de filas borradas por transacción.
+# - interval_seconds: periodo entre ejecuciones de la tarea en segundo plano.
+# - vacuum_pages: páginas liberadas por cada "incremental_vacuum".
+# - lock_path: archivo de bloqueo que elige el proceso que ejecuta la tarea.
+# --------------------------------------------------------------
+@dataclass
+class RetentionConfig:
+    enabled: bool = False
+    ttl_days: int = 30
+    max_messages_per_session: int = 200
+    archive_dir: str = "./data/archive"
+    batch_size: int = 500
+    interval_seconds: int = 3600
+    vacuum_pages: int = 1000
+    lock_path: str = "./data/retention.lock"
+
+    @classmethod
+    def from_env(cls) -> "RetentionConfig":
+        return cls(
+            enabled=_env_bool("CHAT_RETENTION_ENABLED", False),
+            ttl_days=int(os.getenv("CHAT_TTL_DAYS", "30")),
+            max_messages_per_session=int(os.getenv("CHAT_MAX_MESSAGES_PER_SESSION", "200")),
+            archive_dir=os.getenv("CHAT_ARCHIVE_DIR", "./data/archive"),
+            batch_size=max(1, int(os.getenv("CHAT_RETENTION_BATCH_SIZE", "500"))),
+            interval_seconds=max(1, int(os.getenv("CHAT_RETENTION_INTERVAL_SECONDS", "3600"))),
+            vacuum_pages=int(os.getenv("CHAT_VACUUM_PAGES", "1000")),
+            lock_path=os.getenv("CHAT_RETENTION_LOCK", "./data/retention.lock"),
+        )
+
+
+# --------------------------------------------------------------
+# Clase: RetentionStats
+# --------------------------------------------------------------
+# Estadísticas acumuladas de la tarea de retención desde que arrancó
+# el proceso, más el resumen de la última ejecución.
+# --------------------------------------------------------------
+@dataclass
+class RetentionStats:
+    runs: int = 0
+    sessions_expired: int = 0
+    sessions_trimmed: int = 0
+    rows_archived: int = 0
+    rows_deleted: int = 0
+    bytes_reclaimed: int = 0
+    last_run_at: Optional[datetime] = None
+    last_run_seconds: Optional[float] = None
+    last_error: Optional[str] = None
+    last_run: Dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        if self.last_run_at:
+            data["last_run_at"] = self.last_run_at.isoformat()
+        return data
+
+
+# --------------------------------------------------------------
+# Clase: ChatRetentionJob
+# --------------------------------------------------------------
+# Ejecuta la política de retención sobre "chat_memory".
+# Usa SQLAlchemy Core directamente sobre el engine (sin ORM), ya que
+# trabaja por lotes de filas y no necesita entidades del dominio.
+# --------------------------------------------------------------
+class ChatRetentionJob:
+    def __init__(self, config: Optional[RetentionConfig] = None, bind: Optional[Engine] = None):
+        self.config = config or RetentionConfig.from_env()
+        self.engine = bind or default_engine
+        self.stats = RetentionStats()
+        self._table = ChatMemoryModel.__table__
+        # Evita que dos ejecuciones se solapen dentro del mismo proceso
+        self._lock = threading.Lock()
+        self._vacuum_checked = False
+        # Archivo con el flock de CHAT_RETENTION_LOCK si este proceso ejecuta la tarea periódica
+        self._leader_fh = None
+
+    # ----------------------------------------------------------
+    # Método: acquire_leadership
+    # ----------------------------------------------------------
+    # Retorna True si este proceso es (o acaba de pasar a ser) el que
+    # ejecuta la tarea periódica. El bloqueo se conserva mientras el
+    # proceso viva.
+    # ----------------------------------------------------------
+    def acquire_leadership(self) -> bool:
+        if self._leader_fh is None:
+            self._leader_fh = try_lock(self.config.lock_path)
+            if self._leader_fh is not None:
+                logger.info("Retención: este proceso (pid %s) ejecuta la tarea periódica", os.getpid())
+        return self._leader_fh is not None
+
+    def release_leadership(self) -> None:
+        unlock(self._leader_fh)
+        self._leader_fh = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader_fh is not None
+
+    # ----------------------------------------------------------
+    # Método: run_once
+    # ----------------------------------------------------------
+    # Ejecuta un ciclo completo: sesiones expiradas, tope por sesión
+    # y vacuum incremental. Devuelve el resumen de esta ejecución.
+    # ----------------------------------------------------------
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        if not self._lock.acquire(blocking=False):
+            logger.info("Retención: ya hay una ejecución en curso, se omite")
+            return {}
+        run_fh = try_lock(f"{self.config.lock_path}.run")
+        if run_fh is None:
+            self._lock.release()
+            logger.info("Retención: otro proceso tiene una ejecución en curso, se omite")
+            return {}
+        started = datetime.now(timezone.utc)
+        summary = {
+            "sessions_expired": 0,
+            "sessions_trimmed": 0,
+            "rows_archived": 0,
+            "rows_deleted": 0,
+            "bytes_reclaimed": 0,
+        }
+        try:
+            # Los timestamps se guardan en UTC sin zona horaria en SQLite
+            now = (now or started).astimezone(timezone.utc).replace(tzinfo=None)
+            self._archive_expired_sessions(now, summary)
+            self._trim_long_sessions(now, summary)
+            summary["bytes_reclaimed"] = self._incremental_vacuum()
+            self.stats.last_error = None
+        except Exception as e:
+            logger.exception("Retención: error durante la ejecución")
+            self.stats.last_error = f"{type(e).__name__}: {e}"
+        finally:
+            unlock(run_fh)
+            self._lock.release()
+
+        self.stats.runs += 1
+        self.stats.sessions_expired += summary["sessions_expired"]
+        self.stats.sessions_trimmed += summary["sessions_trimmed"]
+        self.stats.rows_archived += summary["rows_archived"]
+        self.stats.rows_deleted += summary["rows_deleted"]
+        self.stats.bytes_reclaimed += summary["bytes_reclaimed"]
+        self.stats.last_run_at = started
+        self.stats.last_run_seconds = round((datetime.now(timezone.utc) - started).total_seconds(), 3)
+        self.stats.last_run = summary
+        return summary
+
+    # ----------------------------------------------------------
+    # Método privado: _archive_expired_sessions
+    # ----------------------------------------------------------
+    # Busca sesiones cuyo último mensaje es anterior al TTL y las
+    # archiva/borra completas, de a "batch_size" filas por vez.
+    # ----------------------------------------------------------
+    def _archive_expired_sessions(self, now: datetime, summary: Dict[str, int]) -> None:
+        if self.config.ttl_days <= 0:
+            return
+        t = self._table
+        cutoff = now - timedelta(days=self.config.ttl_days)
+        while True:
+            with self.engine.connect() as conn:
+                sessions = conn.execute(
+                    select(t.c.session_id)
+                    .group_by(t.c.session_id)
+                    .having(func.max(t.c.timestamp) < cutoff)
+                    .limit(self.config.batch_size)
+                ).scalars().all()
+            if not sessions:
+                return
+            for session_id in sessions:
+                archived, deleted = self._archive_and_delete(
+                    select(t).where(t.c.session_id == session_id).order_by(t.c.id.asc()),
+                    now,
+                )
+                summary["rows_archived"] += archived
+                summary["rows_deleted"] += deleted
+                summary["sessions_expired"] += 1
+                session_cache.invalidate(session_id)
+
+    # ----------------------------------------------------------
+    # Método privado: _trim_long_sessions
+    # ----------------------------------------------------------
+    # Para cada sesión que supera el tope de mensajes, archiva y borra
+    # los más antiguos conservando los "max_messages_per_session" últimos.
+    # ----------------------------------------------------------
+    def _trim_long_sessions(self, now: datetime, summary: Dict[str, int]) -> None:
+        cap = self.config.max_messages_per_session
+        if cap <= 0:
+            return
+        t = self._table
+        with self.engine.connect() as conn:
+            sessions = conn.execute(
+                select(t.c.session_id)
+                .group_by(t.c.session_id)
+                .having(func.count(t.c.id) > cap)
+            ).scalars().all()
+        for session_id in sessions:
+            with self.engine.connect() as conn:
+                # Id del mensaje más antiguo que se conserva
+                keep_from = conn.execute(
+                    select(t.c.id)
+                    .where(t.c.session_id == session_id)
+                    .order_by(t.c.id.desc())
+                    .offset(cap - 1)
+                    .limit(1)
+                ).scalar()
+            if keep_from is None:
+                continue
+            archived, deleted = self._archive_and_delete(
+                select(t)
+                .where(t.c.session_id == session_id, t.c.id < keep_from)
+                .order_by(t.c.id.asc()),
+                now,
+            )
+            summary["rows_archived"] += archived
+            summary["rows_deleted"] += deleted
+            summary["sessions_trimmed"] += 1
+            session_cache.invalidate(session_id)
+
+    # ----------------------------------------------------------
+    # Método privado: _archive_and_delete
+    # ----------------------------------------------------------
+    # Recorre las filas de la consulta en lotes: cada lote se escribe
+    # primero en el archivo y luego se borra en su propia transacción.
+    # ----------------------------------------------------------
+    def _archive_and_delete(self, query, now: datetime):
+        t = self._table
+        archived = deleted = 0
+        last_id = 0
+        while True:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    query.where(t.c.id > last_id).limit(self.config.batch_size)
+                ).mappings().all()
+            if not rows:
+                return archived, deleted
+            archived += self._write_archive(rows, now)
+            ids = [r["id"] for r in rows]
+            with self.engine.begin() as conn:
+                deleted += conn.execute(delete(t).where(t.c.id.in_(ids))).rowcount
+            last_id = ids[-1]
+
+    # ----------------------------------------------------------
+    # Método privado: _write_archive
+    # ----------------------------------------------------------
+    # Escribe las filas en archivos "dt=AAAA-MM-DD/chat_memory-<run>.jsonl.gz"
+    # según la fecha de cada mensaje. Cada lote se agrega como un miembro
+    # gzip independiente (el formato admite miembros concatenados) y se
+    # sincroniza a disco antes de borrar las filas.
+    # ----------------------------------------------------------
+    def _write_archive(self, rows, now: datetime) -> int:
+        by_day: Dict[str, List[dict]] = {}
+        for r in rows:
+            ts = r["timestamp"]
+            day = ts.strftime("%Y-%m-%d") if ts else now.strftime("%Y-%m-%d")
+            by_day.setdefault(day, []).append({
+                "id": r["id"],
+                "session_id": r["session_id"],
+                "role": r["role"],
+                "message": r["message"],
+                "timestamp": ts.isoformat() if ts else None,
+            })
+
+        run_tag = now.strftime("%Y%m%dT%H%M%S")
+        for day, records in by_day.items():
+            folder = os.path.join(self.config.archive_dir, f"dt={day}")
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"chat_memory-{run_tag}.jsonl.gz")
+            payload = "".join(json.dumps(rec, ensure_ascii=False) + "\n" for rec in records)
+            with open(path, "ab") as fh:
+                fh.write(gzip.compress(payload.encode("utf-8")))
+                fh.flush()
+                os.fsync(fh.fileno())
+        return len(rows)
+
+    # ----------------------------------------------------------
+    # Método privado: _incremental_vacuum
+    # ----------------------------------------------------------
+    # Libera hasta "vacuum_pages" páginas vacías del archivo SQLite.
+    # Solo actúa si la base ya está en "auto_vacuum = INCREMENTAL"
+    # (las bases nuevas se crean así en init_db; las existentes se
+    # convierten con enable_incremental_vacuum). Nunca ejecuta un VACUUM
+    # completo, que bloquearía toda la base mientras dura.
+    # Devuelve los bytes recuperados.
+    # ----------------------------------------------------------
+    def _incremental_vacuum(self) -> int:
+        if self.engine.dialect.name != "sqlite" or self.config.vacuum_pages <= 0:
+            return 0
+        with self.engine.connect() as conn:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+                if not self._vacuum_checked:
+                    logger.warning("Retención: la base no usa auto_vacuum=INCREMENTAL; no se recupera espacio. "
+                                   "Ejecuta: python -m src.infrastructure.db.init_db --enable-incremental-vacuum")
+                    self._vacuum_checked = True
+                return 0
+            page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+            before = conn.exec_driver_sql("PRAGMA page_count").scalar()
+
+            # executescript recorre el PRAGMA hasta el final; con execute()
+            # el driver sqlite3 solo ejecuta un paso (libera una sola página).
+            conn.connection.driver_connection.executescript(
+                f"PRAGMA incremental_vacuum({int(self.config.vacuum_pages)});"
+            )
+            after = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        return max(0, before - after) * page_size
+
+
+# --------------------------------------------------------------
+# Función: enable_incremental_vacuum
+# --------------------------------------------------------------
+# Conversión única de una base existente a "auto_vacuum = INCREMENTAL".
+# Requiere un VACUUM completo que bloquea toda la base mientras dura,
+# por eso no la ejecuta la tarea periódica: se lanza a mano en una
+# ventana de mantenimiento (init_db --enable-incremental-vacuum o
+# POST /ops/retention/enable-incremental-vacuum).
+# Retorna True si la base se convirtió, False si ya lo estaba.
+# --------------------------------------------------------------
+def enable_incremental_vacuum(bind: Optional[Engine] = None) -> bool:
+    bind = bind or default_engine
+    if bind.dialect.name != "sqlite":
+        return False
+    with bind.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+            return False
+        logger.info("Activando auto_vacuum=INCREMENTAL (VACUUM completo)")
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+    return True
+
+
+# --------------------------------------------------------------
+# Instancia compartida de la tarea de retención
+# --------------------------------------------------------------
+# La API la usa para lanzar la tarea en segundo plano y para exponer
+# las estadísticas en /ops/retention.
+retention_job = ChatRetentionJob()
@@ -0,0 +1,64 @@
+import os
+from contextlib import contextmanager
+from typing import IO, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no hay flock, los bloqueos solo aplican dentro del proceso
+    fcntl = None
+
+# --------------------------------------------------------------
+# Módulo: file_lock.py
+# --------------------------------------------------------------
+# Bloqueos entre procesos con flock sobre un archivo (por ejemplo,
+# bajo data/). Con varios workers de uvicorn cada uno importa los
+# mismos objetos compartidos; estos bloqueos permiten que una tarea
+# (recuperar escrituras, retención) la ejecute un solo proceso a la vez.
+#
+# El sistema operativo libera el bloqueo si el proceso muere.
+# --------------------------------------------------------------
+
+
+def _open(path: str) -> IO:
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    return open(path, "a+")
+
+
+# --------------------------------------------------------------
+# Función: try_lock
+# --------------------------------------------------------------
+# Intenta tomar el bloqueo sin esperar. Retorna el archivo abierto
+# (se libera con unlock o al cerrar el proceso) o None si otro proceso
+# lo tiene.
+# --------------------------------------------------------------
+def try_lock(path: str) -> Optional[IO]:
+    fh = _open(path)
+    if fcntl is None:
+        return fh
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fh.close()
+        return None
+    return fh
+
+
+def unlock(fh: Optional[IO]) -> None:
+    if fh is None:
+        return
+    if fcntl is not None:
+        fcntl.flock(fh, fcntl.LOCK_UN)
+    fh.close()
+
+
+# Bloqueo exclusivo que espera a que el otro proceso lo libere
+@contextmanager
+def locked(path: str):
+    fh = _open(path)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        yield
+    finally:
+        unlock(fh)
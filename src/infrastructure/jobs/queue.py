@@ -0,0 +1,221 @@
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, delete, func, select, update, insert
+from sqlalchemy.engine import Engine
+
+from src.infrastructure.db.database import engine as default_engine
+from src.infrastructure.db.models import ChatJobModel
+
+# --------------------------------------------------------------
+# Módulo: queue.py
+# --------------------------------------------------------------
+# Cola persistente de trabajos de chat sobre la tabla "chat_jobs" de
+# SQLite (sin servicios externos).
+#
+# Ciclo de vida de un trabajo:
+#   queued ──claim──> running ──complete──> done
+#                        │
+#                        ├──fail (quedan intentos)──> queued (con espera)
+#                        ├──fail (sin intentos)─────> failed
+#                        └──el worker no responde───> vuelve a estar visible
+#                                                     al vencer visible_at
+#
+# claim() toma varios trabajos en una sola sentencia UPDATE ... RETURNING,
+# así dos workers nunca reciben el mismo trabajo. Mientras lo procesa, el
+# worker extiende el tiempo de visibilidad (extend) para que las llamadas
+# largas al modelo no se consideren abandonadas.
+# --------------------------------------------------------------
+
+_t = ChatJobModel.__table__
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+@dataclass(slots=True)
+class ChatJob:
+    id: str
+    session_id: str
+    message: str
+    status: str
+    attempts: int
+    max_attempts: int
+    webhook_url: Optional[str] = None
+    webhook_status: Optional[int] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# --------------------------------------------------------------
+# Función: job_payload
+# --------------------------------------------------------------
+# Representación pública de un trabajo (GET /chat/jobs/{id} y webhook).
+# --------------------------------------------------------------
+def job_payload(job: ChatJob) -> dict:
+    return {
+        "job_id": job.id,
+        "session_id": job.session_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "result": job.result,
+        "error": job.error if job.status == FAILED else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+class ChatJobQueue:
+    def __init__(self, bind: Optional[Engine] = None, max_attempts: int = 3):
+        self.engine = bind or default_engine
+        self.max_attempts = max_attempts
+
+    @classmethod
+    def from_env(cls) -> "ChatJobQueue":
+        return cls(max_attempts=int(os.getenv("CHAT_JOB_MAX_ATTEMPTS", "3")))
+
+    # ----------------------------------------------------------
+    # Método: enqueue
+    # ----------------------------------------------------------
+    # Agrega un trabajo visible de inmediato y retorna su id.
+    # ----------------------------------------------------------
+    def enqueue(self, session_id: str, message: str, webhook_url: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = _now()
+        with self.engine.begin() as conn:
+            conn.execute(insert(_t).values(
+                id=job_id, session_id=session_id, message=message, status=QUEUED,
+                attempts=0, max_attempts=self.max_attempts, visible_at=time.time(),
+                webhook_url=webhook_url, created_at=now, updated_at=now,
+            ))
+        return job_id
+
+    def get(self, job_id: str) -> Optional[ChatJob]:
+        with self.engine.connect() as conn:
+            row = conn.execute(select(_t).where(_t.c.id == job_id)).first()
+        if row is None:
+            return None
+        return ChatJob(
+            id=row.id, session_id=row.session_id, message=row.message, status=row.status,
+            attempts=row.attempts, max_attempts=row.max_attempts, webhook_url=row.webhook_url,
+            webhook_status=row.webhook_status, result=json.loads(row.result) if row.result else None,
+            error=row.error, created_at=row.created_at, updated_at=row.updated_at,
+        )
+
+    # ----------------------------------------------------------
+    # Método: claim
+    # ----------------------------------------------------------
+    # Toma hasta "limit" trabajos visibles para "worker_id" y los oculta
+    # durante "visibility_timeout" segundos. Antes marca como fallidos
+    # los trabajos abandonados que ya agotaron sus intentos.
+    # ----------------------------------------------------------
+    def claim(self, worker_id: str, limit: int, visibility_timeout: float) -> List[ChatJob]:
+        if limit <= 0:
+            return []
+        now_ts, now = time.time(), _now()
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(_t)
+                .where(_t.c.status == RUNNING, _t.c.visible_at <= now_ts, _t.c.attempts >= _t.c.max_attempts)
+                .values(status=FAILED, locked_by=None, updated_at=now,
+                        error="El worker no terminó el trabajo dentro del tiempo de visibilidad")
+            )
+            available = (
+                select(_t.c.id)
+                .where(_t.c.status.in_((QUEUED, RUNNING)), _t.c.visible_at <= now_ts,
+                       _t.c.attempts < _t.c.max_attempts)
+                .order_by(_t.c.visible_at)
+                .limit(limit)
+                .scalar_subquery()
+            )
+            rows = conn.execute(
+                update(_t)
+                .where(_t.c.id.in_(available))
+                .values(status=RUNNING, locked_by=worker_id, attempts=_t.c.attempts + 1,
+                        visible_at=now_ts + visibility_timeout, updated_at=now)
+                .returning(_t.c.id, _t.c.session_id, _t.c.message, _t.c.attempts,
+                           _t.c.max_attempts, _t.c.webhook_url, _t.c.created_at)
+            ).all()
+        return [
+            ChatJob(id=r.id, session_id=r.session_id, message=r.message, status=RUNNING,
+                    attempts=r.attempts, max_attempts=r.max_attempts, webhook_url=r.webhook_url,
+                    created_at=r.created_at)
+            for r in rows
+        ]
+
+    # Extiende la visibilidad de un trabajo en curso. Retorna False si el
+    # worker ya no es su dueño (otro lo tomó tras vencer el plazo).
+    def extend(self, job_id: str, worker_id: str, visibility_timeout: float) -> bool:
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(_t)
+                .where(_t.c.id == job_id, _t.c.locked_by == worker_id, _t.c.status == RUNNING)
+                .values(visible_at=time.time() + visibility_timeout)
+            )
+        return result.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: dict) -> bool:
+        with self.engine.begin() as conn:
+            updated = conn.execute(
+                update(_t)
+                .where(_t.c.id == job_id, _t.c.locked_by == worker_id, _t.c.status == RUNNING)
+                .values(status=DONE, result=json.dumps(result, ensure_ascii=False), error=None,
+                        locked_by=None, updated_at=_now())
+            )
+        return updated.rowcount == 1
+
+    # ----------------------------------------------------------
+    # Método: fail
+    # ----------------------------------------------------------
+    # Devuelve el trabajo a la cola tras "retry_delay" segundos si le
+    # quedan intentos; si no, lo marca como fallido.
+    # ----------------------------------------------------------
+    def fail(self, job_id: str, worker_id: str, error: str, retry_delay: float) -> bool:
+        with self.engine.begin() as conn:
+            updated = conn.execute(
+                update(_t)
+                .where(_t.c.id == job_id, _t.c.locked_by == worker_id, _t.c.status == RUNNING)
+                .values(
+                    status=case((_t.c.attempts < _t.c.max_attempts, QUEUED), else_=FAILED),
+                    visible_at=time.time() + retry_delay,
+                    error=error[:2000], locked_by=None, updated_at=_now(),
+                )
+            )
+        return updated.rowcount == 1
+
+    def set_webhook_status(self, job_id: str, status: int) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(update(_t).where(_t.c.id == job_id).values(webhook_status=status))
+
+    # Elimina los trabajos terminados (done/failed) más antiguos que "max_age_seconds"
+    def purge(self, max_age_seconds: float) -> int:
+        cutoff = _now() - timedelta(seconds=max_age_seconds)
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                delete(_t).where(_t.c.status.in_((DONE, FAILED)), _t.c.updated_at < cutoff)
+            )
+        return result.rowcount
+
+    # Cantidad de trabajos por estado (para /ops/chat-jobs)
+    def counts(self) -> Dict[str, int]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(_t.c.status, func.count()).group_by(_t.c.status)).all()
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        counts.update({status: n for status, n in rows})
+        return counts
+
+
+# --------------------------------------------------------------
+# Instancia compartida para este proceso
+# --------------------------------------------------------------
+chat_job_queue = ChatJobQueue.from_env()
@@ -0,0 +1,119 @@
+import ipaddress
+import json
+import logging
+import os
+import socket
+import time
+import urllib.error
+import urllib.request
+from typing import Set
+from urllib.parse import urlsplit
+
+# --------------------------------------------------------------
+# Módulo: webhooks.py
+# --------------------------------------------------------------
+# Envío de resultados de trabajos de chat al "webhook_url" del cliente.
+#
+# La URL la elige quien crea el trabajo, así que el servidor no debe
+# poder usarse para llegar a servicios internos (SSRF):
+# - con CHAT_JOB_WEBHOOK_HOSTS (lista separada por comas; "*.dominio"
+#   acepta subdominios) solo se aceptan esos hosts;
+# - sin lista, el host se resuelve por DNS y se rechaza si alguna de sus
+#   direcciones no es pública (privada, loopback, link-local, reservada,
+#   multicast...);
+# - la validación se hace al crear el trabajo y otra vez justo antes de
+#   cada envío (el DNS pudo cambiar), y no se siguen redirecciones.
+# --------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_TIMEOUT = float(os.getenv("CHAT_JOB_WEBHOOK_TIMEOUT_SECONDS", "5"))
+WEBHOOK_RETRIES = int(os.getenv("CHAT_JOB_WEBHOOK_RETRIES", "3"))
+WEBHOOK_HOSTS: Set[str] = {
+    h.strip().lower() for h in os.getenv("CHAT_JOB_WEBHOOK_HOSTS", "").split(",") if h.strip()
+}
+
+
+class WebhookURLError(ValueError):
+    pass
+
+
+def _allowed_host(host: str) -> bool:
+    for pattern in WEBHOOK_HOSTS:
+        if pattern.startswith("*."):
+            if host.endswith(pattern[1:]):
+                return True
+        elif host == pattern:
+            return True
+    return False
+
+
+# --------------------------------------------------------------
+# Función: check_webhook_url
+# --------------------------------------------------------------
+# Lanza WebhookURLError si la URL no se puede usar como webhook.
+# --------------------------------------------------------------
+def check_webhook_url(url: str) -> None:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise WebhookURLError("webhook_url debe ser una URL http(s) con host")
+    if parts.username or parts.password:
+        raise WebhookURLError("webhook_url no puede incluir credenciales")
+    host = parts.hostname.lower()
+
+    if WEBHOOK_HOSTS:
+        if not _allowed_host(host):
+            raise WebhookURLError(f"El host {host} no está en CHAT_JOB_WEBHOOK_HOSTS")
+        return
+
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, ValueError) as e:
+        raise WebhookURLError(f"No se pudo resolver el host {host}") from e
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if not address.is_global or address.is_multicast:
+            raise WebhookURLError(f"El host {host} resuelve a una dirección no pública ({address})")
+
+
+# Las redirecciones no se siguen: el destino no pasó por la validación
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_opener = urllib.request.build_opener(_NoRedirect)
+
+
+# --------------------------------------------------------------
+# Función: post_webhook
+# --------------------------------------------------------------
+# Envía el payload por POST con reintentos ante errores de red o 5xx.
+# Retorna el último código HTTP, o -1 si no hubo respuesta o la URL
+# fue rechazada.
+# --------------------------------------------------------------
+def post_webhook(url: str, payload: dict) -> int:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    last_status = -1
+    for attempt in range(WEBHOOK_RETRIES):
+        try:
+            check_webhook_url(url)
+        except WebhookURLError as e:
+            logger.warning("Webhook rechazado: %s", e)
+            return -1
+        req = urllib.request.Request(url, data=body, method="POST",
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with _opener.open(req, timeout=WEBHOOK_TIMEOUT) as resp:
+                last_status = resp.status
+            if last_status < 500:
+                return last_status
+        except urllib.error.HTTPError as e:
+            last_status = e.code
+            if e.code < 500:
+                return last_status
+        except OSError:
+            last_status = -1
+        time.sleep(0.5 * (2 ** attempt))
+    return last_status
@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Optional, Set
+
+from dotenv import load_dotenv
+
+from src.application.chat_service import ChatService
+from src.application.dtos import ChatMessageRequestDTO
+from src.infrastructure.api.dependencies import product_repository, chat_repository
+from src.infrastructure.catalog.similarity import similarity_index, PROMPT_ALTERNATIVES
+from src.infrastructure.db.database import SessionLocal
+from src.infrastructure.llm_providers.factory import get_ai_service
+from .queue import ChatJob, ChatJobQueue, chat_job_queue, job_payload, DONE, FAILED
+from .webhooks import post_webhook
+
+# --------------------------------------------------------------
+# Módulo: worker.py
+# --------------------------------------------------------------
+# Workers que consumen la cola de trabajos de chat (chat_jobs).
+#
+# Cada proceso ejecuta un ChatJobWorker: toma trabajos de la cola hasta
+# su límite de concurrencia, llama a ChatService como lo hace POST /chat,
+# guarda el resultado y, si el trabajo tiene webhook_url, envía el
+# resultado por POST (ver webhooks.py). Mientras el modelo responde, el
+# worker extiende el tiempo de visibilidad del trabajo; si el proceso
+# muere, el trabajo vuelve a la cola al vencer ese plazo.
+#
+# Un fallo del modelo es un fallo del trabajo (no se guarda el texto de
+# disculpa como resultado), así que se reintenta con espera creciente.
+# El mensaje del usuario se guarda con la fecha de creación del trabajo:
+# en los reintentos, si el intento anterior ya lo guardó, no se repite.
+#
+# Uso:
+#     python -m src.infrastructure.jobs.worker --processes 4 --concurrency 8
+#
+# Con SIGTERM/SIGINT los workers dejan de tomar trabajos y terminan los
+# que tienen en curso antes de salir.
+# --------------------------------------------------------------
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("CHAT_JOB_VISIBILITY_TIMEOUT_SECONDS", "60"))
+JOB_POLL_INTERVAL = float(os.getenv("CHAT_JOB_POLL_INTERVAL_SECONDS", "0.5"))
+JOB_RETRY_DELAY = float(os.getenv("CHAT_JOB_RETRY_DELAY_SECONDS", "5"))
+JOB_RETENTION_HOURS = float(os.getenv("CHAT_JOB_RETENTION_HOURS", "24"))
+
+
+# --------------------------------------------------------------
+# Clase: ChatJobWorker
+# --------------------------------------------------------------
+# Consumidor de la cola dentro de un event loop. "concurrency" es el
+# máximo de trabajos en curso a la vez en este worker.
+# --------------------------------------------------------------
+class ChatJobWorker:
+    def __init__(self, queue: ChatJobQueue, worker_id: Optional[str] = None, concurrency: int = 4,
+                 visibility_timeout: float = JOB_VISIBILITY_TIMEOUT, poll_interval: float = JOB_POLL_INTERVAL):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = max(1, concurrency)
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self._inflight: Set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+        self.processed = 0
+        self.failed = 0
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    # ----------------------------------------------------------
+    # Método: run
+    # ----------------------------------------------------------
+    # Bucle principal: toma tantos trabajos como espacios libres tenga
+    # y espera "poll_interval" cuando la cola está vacía o el worker
+    # está lleno. Al detenerse espera los trabajos en curso.
+    # ----------------------------------------------------------
+    async def run(self) -> None:
+        last_purge = 0.0
+        while not self._stopping.is_set():
+            free = self.concurrency - len(self._inflight)
+            jobs = []
+            if free > 0:
+                try:
+                    jobs = await asyncio.to_thread(self.queue.claim, self.worker_id, free, self.visibility_timeout)
+                except Exception:
+                    logger.exception("No se pudo leer la cola de trabajos")
+            for job in jobs:
+                task = asyncio.create_task(self._process(job))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+            if time.monotonic() - last_purge > 600:
+                last_purge = time.monotonic()
+                try:
+                    await asyncio.to_thread(self.queue.purge, JOB_RETENTION_HOURS * 3600)
+                except Exception:
+                    logger.exception("No se pudieron depurar los trabajos terminados")
+
+            if not jobs or len(self._inflight) >= self.concurrency:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+        if self._inflight:
+            logger.info("Worker %s: esperando %s trabajos en curso", self.worker_id, len(self._inflight))
+            await asyncio.gather(*list(self._inflight), return_exceptions=True)
+
+    # Extiende la visibilidad del trabajo mientras se procesa
+    async def _heartbeat(self, job: ChatJob) -> None:
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            await asyncio.to_thread(self.queue.extend, job.id, self.worker_id, self.visibility_timeout)
+
+    async def _process(self, job: ChatJob) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        product_db, chat_db = SessionLocal(), SessionLocal()
+        try:
+            service = ChatService(product_repository(product_db), chat_repository(chat_db), get_ai_service(),
+                                  similarity=similarity_index, alternatives_per_product=PROMPT_ALTERNATIVES)
+            response = await service.process_message(
+                ChatMessageRequestDTO(session_id=job.session_id, message=job.message),
+                raise_model_errors=True,
+                user_timestamp=job.created_at,
+                resume=job.attempts > 1,
+            )
+            result = response.model_dump(mode="json")
+            if not await asyncio.to_thread(self.queue.complete, job.id, self.worker_id, result):
+                logger.warning("Trabajo %s: otro worker lo tomó antes de terminar", job.id)
+                return
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.exception("Trabajo %s falló (intento %s de %s)", job.id, job.attempts, job.max_attempts)
+            delay = JOB_RETRY_DELAY * (2 ** (job.attempts - 1))
+            await asyncio.to_thread(self.queue.fail, job.id, self.worker_id, f"{type(e).__name__}: {e}", delay)
+        finally:
+            heartbeat.cancel()
+            product_db.close()
+            chat_db.close()
+
+        await self._notify(job.id)
+
+    # Envía el resultado al webhook del trabajo (si tiene) cuando terminó
+    async def _notify(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self.queue.get, job_id)
+        if job is None or not job.webhook_url or job.status not in (DONE, FAILED):
+            return
+        status = await asyncio.to_thread(post_webhook, job.webhook_url, job_payload(job))
+        await asyncio.to_thread(self.queue.set_webhook_status, job_id, status)
+
+
+# --------------------------------------------------------------
+# Procesos de workers
+# --------------------------------------------------------------
+def _run_process(index: int, concurrency: int) -> None:
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [worker-{index}] %(levelname)s %(message)s")
+
+    async def main():
+        worker = ChatJobWorker(chat_job_queue, concurrency=concurrency)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, worker.stop)
+            except NotImplementedError:  # Windows
+                pass
+        logger.info("Worker %s listo (concurrencia %s)", worker.worker_id, concurrency)
+        await worker.run()
+
+    asyncio.run(main())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Procesa la cola de trabajos de chat")
+    parser.add_argument("--processes", type=int,
+                        default=int(os.getenv("CHAT_JOB_WORKER_PROCESSES", "0")) or os.cpu_count() or 1)
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("CHAT_JOB_WORKER_CONCURRENCY", "4")))
+    args = parser.parse_args(argv)
+    # Cada proceso usa 1/N de los límites por minuto del pool de Gemini
+    os.environ.setdefault("GEMINI_POOL_WORKERS", str(max(1, args.processes)))
+
+    if args.processes <= 1:
+        _run_process(0, args.concurrency)
+        return 0
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_run_process, args=(i, args.concurrency)) for i in range(args.processes)]
+    for p in procs:
+        p.start()
+
+    # El proceso principal reenvía la señal de parada a los workers
+    def forward(signum, _frame):
+        for p in procs:
+            if p.is_alive():
+                os.kill(p.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for p in procs:
+        p.join()
+    return 0 if all(p.exitcode == 0 for p in procs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
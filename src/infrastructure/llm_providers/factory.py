@@ -0,0 +1,36 @@
+import os
+from functools import lru_cache
+
+from .gemini_service import GeminiService
+
+# --------------------------------------------------------------
+# Módulo: factory.py
+# --------------------------------------------------------------
+# Punto único para obtener el proveedor de IA que usa la aplicación.
+# La instancia se crea una vez por proceso y se reutiliza en todas las
+# peticiones (el modelo de Gemini y su conexión se inicializan en el
+# primer uso), en lugar de construir un GeminiService por petición.
+#
+# LLM_PROVIDER elige el proveedor:
+# - "gemini" (por defecto): la API de Gemini.
+# - "replay": modelo falso con los largos y tiempos de respuesta de un
+#   tráfico grabado (pruebas de carga, ver src/infrastructure/replay).
+# Con "gemini", si hay varias claves configuradas (GEMINI_POOL o
+# GEMINI_API_KEYS) las llamadas se reparten en un pool (gemini_pool.py).
+# --------------------------------------------------------------
+
+
+@lru_cache(maxsize=1)
+def get_ai_service() -> GeminiService:
+    if os.getenv("LLM_PROVIDER", "gemini").strip().lower() == "replay":
+        from .replay_service import ReplayAIService
+
+        return ReplayAIService.from_env()
+
+    from .gemini_pool import GeminiPool, PooledGeminiService
+
+    pool = GeminiPool.from_env()
+    if pool is not None:
+        return PooledGeminiService(pool)
+    # Toma la clave API de GEMINI_API_KEY o GOOGLE_API_KEY
+    return GeminiService()
@@ -0,0 +1,130 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict
+
+# --------------------------------------------------------------
+# Módulo: fake_gemini_server.py
+# --------------------------------------------------------------
+# Servidor local que imita la API REST de Gemini (generateContent y
+# streamGenerateContent) para probar el pool de claves sin cuota real.
+#
+# Cada API key (cabecera x-goog-api-key) tiene un límite de peticiones
+# por minuto (--rpm); al superarlo responde 429 RESOURCE_EXHAUSTED, como
+# la API real. GET /stats muestra las peticiones aceptadas y rechazadas
+# por clave.
+#
+# Uso:
+#     python -m src.infrastructure.llm_providers.fake_gemini_server --port 9100 --rpm 5
+#     GEMINI_POOL='[{"key": "k1", "endpoint": "http://127.0.0.1:9100"},
+#                   {"key": "k2", "endpoint": "http://127.0.0.1:9100"}]' ...
+# --------------------------------------------------------------
+
+REPLY = "Te recomiendo revisar las opciones de running disponibles en tu talla."
+
+
+class FakeGeminiState:
+    def __init__(self, rpm: int, latency_ms: float):
+        self.rpm = rpm
+        self.latency_ms = latency_ms
+        self._calls: Dict[str, Deque[float]] = {}
+        self.accepted: Dict[str, int] = {}
+        self.rejected: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    # Registra la llamada; False si la clave superó su límite por minuto
+    def admit(self, key: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            window = self._calls.setdefault(key, deque())
+            while window and now - window[0] > 60:
+                window.popleft()
+            if self.rpm and len(window) >= self.rpm:
+                self.rejected[key] = self.rejected.get(key, 0) + 1
+                return False
+            window.append(now)
+            self.accepted[key] = self.accepted.get(key, 0) + 1
+            return True
+
+
+def _chunk(text: str, prompt_tokens: int) -> dict:
+    output_tokens = max(1, len(text) // 4)
+    return {
+        "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": 1, "index": 0}],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        },
+    }
+
+
+def make_handler(state: FakeGeminiState):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, payload) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send(200, {"accepted": state.accepted, "rejected": state.rejected})
+            else:
+                self._send(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            path = self.path.split("?", 1)[0]
+            if not (path.endswith(":generateContent") or path.endswith(":streamGenerateContent")):
+                self._send(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+                return
+            if not state.admit(self.headers.get("x-goog-api-key", "")):
+                self._send(429, {"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).",
+                                           "status": "RESOURCE_EXHAUSTED"}})
+                return
+
+            time.sleep(state.latency_ms / 1000)
+            prompt = "".join(p.get("text", "") for c in request.get("contents", []) for p in c.get("parts", []))
+            prompt_tokens = max(1, len(prompt) // 4)
+            if path.endswith(":streamGenerateContent"):
+                words = REPLY.split(" ")
+                third = len(words) // 3
+                parts = [" ".join(words[:third]) + " ", " ".join(words[third:2 * third]) + " ",
+                         " ".join(words[2 * third:])]
+                self._send(200, [_chunk(p, prompt_tokens) for p in parts])
+            else:
+                self._send(200, _chunk(REPLY, prompt_tokens))
+
+    return Handler
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="API de Gemini falsa para pruebas locales")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--rpm", type=int, default=0, help="Peticiones por minuto por clave (0 = sin límite)")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeGeminiState(args.rpm, args.latency_ms)))
+    print(f"API de Gemini falsa en http://{args.host}:{args.port} (rpm por clave: {args.rpm or 'sin límite'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
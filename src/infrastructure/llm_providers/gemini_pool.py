@@ -0,0 +1,307 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .gemini_service import GeminiService
+
+# --------------------------------------------------------------
+# Módulo: gemini_pool.py
+# --------------------------------------------------------------
+# Pool de claves y modelos de Gemini para superar la cuota de una sola
+# API key.
+#
+# - Cada entrada (clave + modelo) tiene su propio GenerativeServiceClient
+#   (la capa de transporte del SDK), sin usar la configuración global
+#   "genai.configure".
+# - Cada entrada lleva dos baldes de tokens con sus límites por minuto:
+#   peticiones (rpm) y tokens (tpm). Cada llamada descuenta 1 petición y
+#   los tokens estimados del prompt más GEMINI_POOL_OUTPUT_TOKENS, y se
+#   corrige con el uso real que informa la respuesta.
+# - Los baldes viven en cada proceso: con varios procesos usando las
+#   mismas claves, cada uno toma 1/GEMINI_POOL_WORKERS de cada límite
+#   (serve.py y el worker de trabajos lo definen con su número de
+#   procesos si no está en el entorno; si ambos comparten las claves,
+#   debe ser la suma).
+# - Cada petición va a la entrada con más margen disponible. Si ninguna
+#   tiene margen, se espera hasta GEMINI_POOL_MAX_WAIT_SECONDS.
+# - Un 429 pone la entrada en enfriamiento (GEMINI_POOL_COOLDOWN_SECONDS,
+#   se duplica con cada 429 seguido) y la petición se reintenta en otra.
+#
+# Configuración (la primera que esté definida):
+#   GEMINI_POOL='[{"key": "...", "model": "models/gemini-2.5-flash",
+#                  "rpm": 10, "tpm": 250000, "endpoint": "http://127.0.0.1:9100"}]'
+#   GEMINI_API_KEYS=clave1,clave2   (modelos: GEMINI_POOL_MODELS o MODEL_NAME;
+#                                    límites: GEMINI_POOL_RPM / GEMINI_POOL_TPM)
+#
+# "endpoint" permite probar el pool contra un servidor local falso
+# (src/infrastructure/llm_providers/fake_gemini_server.py).
+# --------------------------------------------------------------
+
+# Tokens de salida que se reservan por llamada antes de conocer el uso real
+OUTPUT_TOKENS_ESTIMATE = int(os.getenv("GEMINI_POOL_OUTPUT_TOKENS", "500"))
+
+
+class PoolExhaustedError(RuntimeError):
+    pass
+
+
+# --------------------------------------------------------------
+# Clase: TokenBucket
+# --------------------------------------------------------------
+# Balde que se llena a "per_minute / 60" unidades por segundo hasta
+# "per_minute". El nivel puede quedar negativo si el uso real superó la
+# estimación; se recupera con el tiempo.
+# --------------------------------------------------------------
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Fracción disponible (0 = vacío, 1 = lleno)
+    def headroom(self) -> float:
+        return max(self.level, 0.0) / self.capacity
+
+    def seconds_until(self, amount: float) -> float:
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+
+# --------------------------------------------------------------
+# Clase: PoolEntry
+# --------------------------------------------------------------
+# Una clave con un modelo, sus límites y sus contadores. El cliente del
+# SDK se crea en el primer uso y se llama directamente (generate_content
+# / stream_generate_content de GenerativeServiceClient).
+# --------------------------------------------------------------
+class PoolEntry:
+    def __init__(self, api_key: str, model_name: str, rpm: float, tpm: float,
+                 endpoint: Optional[str] = None, name: Optional[str] = None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.endpoint = endpoint
+        self.name = name or f"…{api_key[-4:]}/{model_name.rsplit('/', 1)[-1]}"
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.cooldown_until = 0.0
+        self.consecutive_429 = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.tokens_used = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google.ai import generativelanguage as glm
+
+            options = {"api_key": self.api_key}
+            if self.endpoint:
+                options["api_endpoint"] = self.endpoint
+            # Cliente propio de esta clave (REST si apunta a un endpoint local)
+            self._client = glm.GenerativeServiceClient(
+                client_options=options, transport="rest" if self.endpoint else None
+            )
+        return self._client
+
+    # Misma respuesta que GenerativeModel.generate_content: un mensaje con
+    # candidates/usage_metadata, o un iterador de ellos con stream=True
+    def generate_content(self, prompt: str, stream: bool = False):
+        from google.ai import generativelanguage as glm
+
+        name = self.model_name if "/" in self.model_name else f"models/{self.model_name}"
+        request = glm.GenerateContentRequest(
+            model=name, contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])]
+        )
+        if stream:
+            return self.client.stream_generate_content(request)
+        return self.client.generate_content(request)
+
+    def headroom(self) -> float:
+        return min(self.requests.headroom(), self.tokens.headroom())
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "code", None) == 429 or type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+
+def _usage_tokens(response) -> Optional[int]:
+    try:
+        return int(response.usage_metadata.total_token_count) or None
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+# --------------------------------------------------------------
+# Clase: GeminiPool
+# --------------------------------------------------------------
+class GeminiPool:
+    def __init__(self, entries: List[PoolEntry], cooldown_seconds: float = 30.0,
+                 max_cooldown_seconds: float = 300.0, max_wait_seconds: float = 10.0):
+        if not entries:
+            raise ValueError("El pool de Gemini necesita al menos una entrada")
+        self.entries = entries
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+
+    # Los límites de cada entrada (rpm/tpm) son de la clave completa; este
+    # proceso usa la parte que le toca entre GEMINI_POOL_WORKERS procesos.
+    @classmethod
+    def from_env(cls) -> Optional["GeminiPool"]:
+        workers = max(1, int(os.getenv("GEMINI_POOL_WORKERS", "1")))
+        rpm = float(os.getenv("GEMINI_POOL_RPM", "60"))
+        tpm = float(os.getenv("GEMINI_POOL_TPM", "1000000"))
+        raw = os.getenv("GEMINI_POOL", "").strip()
+        if raw:
+            entries = [
+                PoolEntry(
+                    api_key=e.get("key") or os.environ[e["key_env"]],
+                    model_name=e.get("model") or os.getenv("MODEL_NAME", "models/gemini-2.5-pro"),
+                    rpm=float(e.get("rpm", rpm)) / workers,
+                    tpm=float(e.get("tpm", tpm)) / workers,
+                    endpoint=e.get("endpoint"),
+                    name=e.get("name"),
+                )
+                for e in json.loads(raw)
+            ]
+        else:
+            keys = [k.strip() for k in os.getenv("GEMINI_API_KEYS", "").split(",") if k.strip()]
+            if not keys:
+                return None
+            models = [m.strip() for m in os.getenv("GEMINI_POOL_MODELS", "").split(",") if m.strip()] \
+                or [os.getenv("MODEL_NAME", "models/gemini-2.5-pro")]
+            entries = [PoolEntry(k, m, rpm / workers, tpm / workers) for k in keys for m in models]
+        return cls(
+            entries,
+            cooldown_seconds=float(os.getenv("GEMINI_POOL_COOLDOWN_SECONDS", "30")),
+            max_cooldown_seconds=float(os.getenv("GEMINI_POOL_MAX_COOLDOWN_SECONDS", "300")),
+            max_wait_seconds=float(os.getenv("GEMINI_POOL_MAX_WAIT_SECONDS", "10")),
+        )
+
+    # ----------------------------------------------------------
+    # Método: _acquire
+    # ----------------------------------------------------------
+    # Elige la entrada con más margen (sin enfriamiento y excluyendo las
+    # ya intentadas) y descuenta la petición y los tokens estimados. Si
+    # ninguna alcanza, espera lo necesario (hasta max_wait_seconds).
+    # ----------------------------------------------------------
+    def _acquire(self, estimate: int, tried: set) -> PoolEntry:
+        deadline = time.monotonic() + self.max_wait_seconds
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                candidates = [e for e in self.entries if id(e) not in tried] or list(self.entries)
+                waits = []
+                for e in candidates:
+                    e.requests.refill(now)
+                    e.tokens.refill(now)
+                    waits.append(max(e.cooldown_until - now,
+                                     e.requests.seconds_until(1), e.tokens.seconds_until(estimate)))
+                ready = [e for e, w in zip(candidates, waits) if w <= 0]
+                if ready:
+                    entry = max(ready, key=lambda e: (e.headroom(), -e.in_flight))
+                    entry.requests.level -= 1
+                    entry.tokens.level -= estimate
+                    entry.in_flight += 1
+                    return entry
+                wait = min(waits)
+            if now + wait > deadline:
+                raise PoolExhaustedError(
+                    f"Todas las claves de Gemini están sin cuota (próxima disponible en {wait:.1f} s)"
+                )
+            time.sleep(min(wait, 1.0))
+
+    def _settle(self, entry: PoolEntry, estimate: int, response=None, error: Optional[Exception] = None) -> None:
+        with self._lock:
+            entry.in_flight -= 1
+            if error is None:
+                used = _usage_tokens(response) if response is not None else None
+                if used is not None:
+                    entry.tokens.level -= used - estimate
+                entry.calls += 1
+                entry.tokens_used += used if used is not None else estimate
+                entry.consecutive_429 = 0
+            elif _is_rate_limited(error):
+                entry.rate_limited += 1
+                now = time.monotonic()
+                # Los 429 de llamadas que ya estaban en curso no alargan el enfriamiento
+                if entry.cooldown_until <= now:
+                    entry.consecutive_429 += 1
+                    cooldown = min(self.cooldown_seconds * 2 ** (entry.consecutive_429 - 1),
+                                   self.max_cooldown_seconds)
+                    entry.cooldown_until = now + cooldown
+            else:
+                entry.errors += 1
+                entry.tokens.level += estimate
+
+    # ----------------------------------------------------------
+    # Método: generate_content
+    # ----------------------------------------------------------
+    # Misma interfaz que GenerativeModel.generate_content. Ante un 429
+    # reintenta en otra entrada (una vez por entrada como máximo).
+    # ----------------------------------------------------------
+    def generate_content(self, prompt: str, stream: bool = False):
+        estimate = len(prompt) // 4 + OUTPUT_TOKENS_ESTIMATE
+        tried: set = set()
+        while True:
+            entry = self._acquire(estimate, tried)
+            tried.add(id(entry))
+            try:
+                response = entry.generate_content(prompt, stream=stream)
+            except Exception as e:
+                self._settle(entry, estimate, error=e)
+                if _is_rate_limited(e) and len(tried) < len(self.entries):
+                    continue
+                raise
+            # En streaming el uso real llega al final; se cuenta lo estimado
+            self._settle(entry, estimate, None if stream else response)
+            return response
+
+    def warm(self) -> None:
+        for entry in self.entries:
+            entry.client
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            now = time.monotonic()
+            entries = []
+            for e in self.entries:
+                e.requests.refill(now)
+                e.tokens.refill(now)
+                entries.append({
+                    "name": e.name,
+                    "model": e.model_name,
+                    "rpm_limit": e.requests.capacity,
+                    "tpm_limit": e.tokens.capacity,
+                    "rpm_utilization": round(1 - e.requests.headroom(), 3),
+                    "tpm_utilization": round(1 - e.tokens.headroom(), 3),
+                    "cooling_down_seconds": round(max(0.0, e.cooldown_until - now), 1),
+                    "in_flight": e.in_flight,
+                    "calls": e.calls,
+                    "tokens_used": e.tokens_used,
+                    "rate_limited": e.rate_limited,
+                    "errors": e.errors,
+                })
+        return {"entries": entries}
+
+
+# --------------------------------------------------------------
+# Clase: PooledGeminiService
+# --------------------------------------------------------------
+# GeminiService con el pool como cliente, en lugar de un único modelo
+# configurado con la clave global.
+# --------------------------------------------------------------
+class PooledGeminiService(GeminiService):
+    def __init__(self, pool: GeminiPool):
+        super().__init__(client=pool, model_name=pool.entries[0].model_name)
+        self.pool = pool
@@ -1,6 +1,5 @@
 import os
-from typing import List
-import google.generativeai as genai
+from typing import Dict, Iterator, List, Optional
 
 # --------------------------------------------------------------
 # Módulo: gemini_service.py
@@ -9,10 +8,19 @@ import google.generativeai as genai
 # toda la comunicación entre la aplicación y la API de Gemini (Google).
 # Contiene la configuración del modelo, la generación de respuestas y
 # el formateo de los productos y el contexto de chat para el prompt.
+#
+# El SDK "google.generativeai" es pesado de importar (~0.5 s), por eso
+# se importa de forma diferida en el primer uso real del modelo y no al
+# cargar el módulo: así el arranque de la API no paga ese costo.
 # --------------------------------------------------------------
 
 # Importa las entidades del dominio necesarias para construir los prompts
 from src.domain.entities import Product, ChatContext
+from src.domain.exceptions import AIServiceError
+
+# Respuestas seguras cuando el modelo falla o no devuelve texto
+ERROR_REPLY = "Lo siento, ahora mismo no pude generar respuesta ({error}). Intenta de nuevo."
+FALLBACK_REPLY = "Puedo ayudarte a elegir tenis: ¿prefieres running o casual, y cuál es tu presupuesto aproximado?"
 
 
 # --------------------------------------------------------------
@@ -21,62 +29,95 @@ from src.domain.entities import Product, ChatContext
 # Gestiona la configuración del modelo Gemini y la generación de respuestas
 # basadas en el mensaje del usuario, los productos disponibles y el historial
 # del chat.
+#
+# "client" permite inyectar el cliente del modelo: cualquier objeto con
+# generate_content(prompt, stream=False) como el de GenerativeModel (el
+# pool de claves, el modelo falso de replay, un doble en pruebas). Con
+# cliente inyectado no hace falta API key.
 # --------------------------------------------------------------
 class GeminiService:
-    def __init__(self):
+    def __init__(self, client=None, model_name: Optional[str] = None, api_key: Optional[str] = None):
         # Obtiene la API key desde las variables de entorno (.env)
         # Se prioriza GOOGLE_API_KEY, pero también acepta GEMINI_API_KEY.
-        self.api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+        if client is None and not self.api_key:
             raise ValueError("No se encontró la API key (GOOGLE_API_KEY o GEMINI_API_KEY).")
 
         # Define el modelo por defecto, con opción de sobrescribirlo mediante MODEL_NAME en .env
-        self.model_name = os.getenv("MODEL_NAME", "models/gemini-2.5-pro")
+        self.model_name = model_name or os.getenv("MODEL_NAME", "models/gemini-2.5-pro")
 
-        # Configura la conexión con la API de Gemini usando la clave obtenida
-        genai.configure(api_key=self.api_key)
+        # Sin cliente inyectado, el modelo generativo se crea en el primer uso (ver propiedad "model")
+        self._model = client
 
-        # Inicializa el modelo generativo (se crea una instancia del modelo configurado)
-        self.model = genai.GenerativeModel(self.model_name)
+    # --------------------------------------------------------------
+    # Propiedad: model
+    # --------------------------------------------------------------
+    # Retorna el cliente inyectado o, la primera vez que se necesita,
+    # importa el SDK, configura la API key e instancia el modelo generativo.
+    # --------------------------------------------------------------
+    @property
+    def model(self):
+        if self._model is None:
+            import google.generativeai as genai
+
+            # Configura la conexión con la API de Gemini usando la clave obtenida
+            genai.configure(api_key=self.api_key)
+            self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    # Crea el cliente antes de la primera petición (calentamiento al arrancar)
+    def warm(self) -> None:
+        warm = getattr(self.model, "warm", None)
+        if warm is not None:
+            warm()
 
     # --------------------------------------------------------------
     # Método: _format_products
     # --------------------------------------------------------------
     # Convierte la lista de productos (entidades del dominio) en un texto
     # legible para incluirlo dentro del prompt que se enviará al modelo Gemini.
+    # "alternatives" asocia el id de un producto agotado con los ids de
+    # productos parecidos con stock (los calcula quien llama).
     # --------------------------------------------------------------
-    def _format_products(self, products: List[Product]) -> str:
+    def _format_products(self, products: List[Product],
+                         alternatives: Optional[Dict[int, List[int]]] = None) -> str:
         # Si no hay productos disponibles, retorna un texto indicativo
         if not products:
             return "(no hay productos disponibles)"
 
         # Genera una cadena con la información formateada de cada producto
-        return "\n".join(
+        lines = [
             f"- {p.name} | Marca:{p.brand} | Cat:{p.category} | "
             f"Talla:{p.size} | Color:{p.color} | ${p.price} | Stock:{p.stock} — {p.description or ''}"
             for p in products
-        )
+        ]
+
+        # A los productos agotados se les agregan las alternativas más parecidas con stock
+        if alternatives:
+            by_id = {p.id: p for p in products}
+            for i, p in enumerate(products):
+                if p.stock == 0:
+                    names = [by_id[pid].name for pid in alternatives.get(p.id, ()) if pid in by_id]
+                    if names:
+                        lines[i] += f" (agotado; alternativas: {', '.join(names)})"
+        return "\n".join(lines)
 
     # --------------------------------------------------------------
-    # Método: generate_response_sync
+    # Método: _build_prompt
     # --------------------------------------------------------------
-    # Genera una respuesta textual del modelo Gemini basada en:
+    # Construye el prompt que se enviará al modelo a partir de:
     # - El mensaje actual del usuario
     # - Los productos disponibles
     # - El historial del chat (contexto)
-    #
-    # Este método se ejecuta de forma síncrona dentro de un hilo separado.
+    # - Las alternativas de los productos agotados (opcional)
     # --------------------------------------------------------------
-    def generate_response_sync(
-        self, user_message: str, products: List[Product], context: ChatContext
-    ) -> str:
-
+    def _build_prompt(self, user_message: str, products: List[Product], context: ChatContext,
+                      alternatives: Optional[Dict[int, List[int]]] = None) -> str:
         # Convierte los productos y el historial en texto
-        products_txt = self._format_products(products or [])
+        products_txt = self._format_products(products or [], alternatives)
         history_txt = (context.format_for_prompt() if context else "") or "(sin historial)"
 
-        # Construye el prompt que se enviará al modelo Gemini
-        prompt = f"""
+        return f"""
 Eres un asistente de compras para una tienda de zapatos.
 Responde en español, de manera profesional, breve y amable. Usa el contexto si existe.
 
@@ -90,25 +131,30 @@ Usuario: {user_message}
 Asistente:
 """.strip()
 
-        # --------------------------------------------------------------
-        # Bloque principal: llamada al modelo generativo
-        # --------------------------------------------------------------
-        try:
-            # Envía el prompt al modelo Gemini
-            resp = self.model.generate_content(prompt)
-        except Exception as e:
-            # Maneja errores de conexión, red o modelo
-            # Retorna una respuesta segura para evitar que el flujo se rompa
-            return f"Lo siento, ahora mismo no pude generar respuesta ({type(e).__name__}). Intenta de nuevo."
-
-        # --------------------------------------------------------------
-        # Extracción de texto de la respuesta (manejo de distintos formatos)
-        # --------------------------------------------------------------
+    # --------------------------------------------------------------
+    # Método: _generate_content
+    # --------------------------------------------------------------
+    # Única llamada al cliente del modelo (el SDK de Gemini o el inyectado).
+    # --------------------------------------------------------------
+    def _generate_content(self, prompt: str, stream: bool = False):
+        return self.model.generate_content(prompt, stream=stream)
 
+    # --------------------------------------------------------------
+    # Método: _chunk_text
+    # --------------------------------------------------------------
+    # Extrae el texto de una respuesta (o fragmento) del modelo,
+    # soportando los distintos formatos que entrega el SDK.
+    # Retorna "" si no hay texto.
+    # --------------------------------------------------------------
+    def _chunk_text(self, resp) -> str:
         # 1) Camino feliz: respuesta directa en 'resp.text'
-        text = getattr(resp, "text", None)
-        if isinstance(text, str) and text.strip():
-            return text.strip()
+        #    (el SDK lanza ValueError si la respuesta no tiene partes)
+        try:
+            text = getattr(resp, "text", None)
+        except ValueError:
+            text = None
+        if isinstance(text, str) and text:
+            return text
 
         # 2) Camino alternativo: buscar texto en candidates/parts
         try:
@@ -118,10 +164,68 @@ Asistente:
                 parts = getattr(content, "parts", None) or []
                 for p in parts:
                     ptxt = getattr(p, "text", None)
-                    if isinstance(ptxt, str) and ptxt.strip():
-                        return ptxt.strip()
+                    if isinstance(ptxt, str) and ptxt:
+                        return ptxt
         except Exception:
             pass
+        return ""
+
+    # --------------------------------------------------------------
+    # Método: generate_response_sync
+    # --------------------------------------------------------------
+    # Genera una respuesta textual completa del modelo Gemini.
+    #
+    # Este método se ejecuta de forma síncrona dentro de un hilo separado.
+    # Si el modelo falla retorna un texto de disculpa, salvo con
+    # "raise_errors", en cuyo caso lanza AIServiceError (para quien debe
+    # distinguir una respuesta de un fallo: trabajos, Idempotency-Key).
+    # --------------------------------------------------------------
+    def generate_response_sync(
+        self, user_message: str, products: List[Product], context: ChatContext,
+        alternatives: Optional[Dict[int, List[int]]] = None, raise_errors: bool = False,
+    ) -> str:
+        prompt = self._build_prompt(user_message, products, context, alternatives)
+
+        # --------------------------------------------------------------
+        # Bloque principal: llamada al modelo generativo
+        # --------------------------------------------------------------
+        try:
+            # Envía el prompt al modelo Gemini
+            resp = self._generate_content(prompt)
+        except Exception as e:
+            # Maneja errores de conexión, red o modelo
+            # Retorna una respuesta segura para evitar que el flujo se rompa
+            if raise_errors:
+                raise AIServiceError(f"{type(e).__name__}: {e}") from e
+            return ERROR_REPLY.format(error=type(e).__name__)
 
-        # 3) Fallback final: respuesta por defecto si no hay texto válido
-        return "Puedo ayudarte a elegir tenis: ¿prefieres running o casual, y cuál es tu presupuesto aproximado?"
+        text = self._chunk_text(resp).strip()
+        # Fallback final: respuesta por defecto si no hay texto válido
+        return text or FALLBACK_REPLY
+
+    # --------------------------------------------------------------
+    # Método: generate_response_stream
+    # --------------------------------------------------------------
+    # Igual que generate_response_sync, pero entrega la respuesta en
+    # fragmentos a medida que el modelo los genera (stream=True).
+    # Es un generador síncrono: se consume desde un hilo separado.
+    # Si el modelo falla (también a mitad de la respuesta) lanza
+    # AIServiceError, para que el texto parcial no se tome como una
+    # respuesta completa.
+    # --------------------------------------------------------------
+    def generate_response_stream(
+        self, user_message: str, products: List[Product], context: ChatContext,
+        alternatives: Optional[Dict[int, List[int]]] = None,
+    ) -> Iterator[str]:
+        prompt = self._build_prompt(user_message, products, context, alternatives)
+        produced = False
+        try:
+            for chunk in self._generate_content(prompt, stream=True):
+                text = self._chunk_text(chunk)
+                if text:
+                    produced = True
+                    yield text
+        except Exception as e:
+            raise AIServiceError(f"{type(e).__name__}: {e}") from e
+        if not produced:
+            yield FALLBACK_REPLY
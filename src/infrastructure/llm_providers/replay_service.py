@@ -0,0 +1,54 @@
+import os
+import time
+from types import SimpleNamespace
+
+from .gemini_service import GeminiService
+from src.infrastructure.replay.recording import ReplayProfile
+
+# --------------------------------------------------------------
+# Módulo: replay_service.py
+# --------------------------------------------------------------
+# Modelo falso para pruebas de carga con tráfico grabado
+# (LLM_PROVIDER=replay). Arma el prompt igual que GeminiService, pero en
+# lugar de llamar a la API responde con el largo y el tiempo de
+# respuesta registrados para ese mensaje (REPLAY_PROFILE, generado con
+# "python -m src.infrastructure.replay.runner profile").
+# --------------------------------------------------------------
+
+_FILLER = ("Tenemos varias opciones que se ajustan a lo que buscas, con buena amortiguación, "
+           "tallas disponibles y precios para distintos presupuestos. ")
+
+# Fragmentos en que se divide la respuesta en modo streaming
+_STREAM_CHUNKS = 5
+
+
+# Cliente con la interfaz de GenerativeModel que responde según el perfil
+class ReplayModel:
+    def __init__(self, profile: ReplayProfile):
+        self.profile = profile
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        # El mensaje del usuario es la última línea "Usuario: ..." del prompt
+        message = prompt.rsplit("\nUsuario: ", 1)[-1].rsplit("\nAsistente:", 1)[0]
+        chars, latency_ms = self.profile.reply_for(message)
+        text = (_FILLER * (chars // len(_FILLER) + 1))[:max(chars, 1)]
+        if not stream:
+            time.sleep(latency_ms / 1000)
+            return SimpleNamespace(text=text)
+        return self._stream(text, latency_ms)
+
+    def _stream(self, text: str, latency_ms: float):
+        size = -(-len(text) // _STREAM_CHUNKS)
+        for start in range(0, len(text), size):
+            time.sleep(latency_ms / 1000 / _STREAM_CHUNKS)
+            yield SimpleNamespace(text=text[start:start + size])
+
+
+class ReplayAIService(GeminiService):
+    def __init__(self, profile: ReplayProfile):
+        super().__init__(client=ReplayModel(profile), model_name="replay")
+        self.profile = profile
+
+    @classmethod
+    def from_env(cls) -> "ReplayAIService":
+        return cls(ReplayProfile.load(os.getenv("REPLAY_PROFILE", "./data/replay_profile.json")))
@@ -0,0 +1,238 @@
+import glob
+import gzip
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from src.infrastructure.db.database import engine as default_engine
+from src.infrastructure.db.models import ChatMemoryModel
+
+# --------------------------------------------------------------
+# Módulo: recording.py
+# --------------------------------------------------------------
+# Reconstruye el tráfico real de chat a partir de la tabla "chat_memory"
+# o del archivo de retención (dt=AAAA-MM-DD/*.jsonl.gz):
+# - una sesión por session_id, con sus turnos en orden;
+# - cada turno es un mensaje del usuario, su desplazamiento desde el
+#   inicio de la sesión y la respuesta registrada (largo en caracteres y
+#   tiempo entre el mensaje y la respuesta);
+# - el inicio de cada sesión se mide desde el inicio de la grabación.
+# Los silencios más largos que "max_gap" se acortan a ese valor, para
+# que una grabación de varios días se pueda reproducir en minutos.
+#
+# Las conversaciones guardadas por versiones anteriores tienen el mensaje
+# y la respuesta con la misma fecha (ambos se guardaban al final): esa
+# diferencia de 0 ms no es un tiempo de respuesta real, así que el turno
+# queda con latencia desconocida (None). El perfil no la usa para la
+# mediana y le asigna la latencia por defecto.
+#
+# También arma el perfil de respuestas (ReplayProfile) que usa el modelo
+# falso (LLM_PROVIDER=replay) para responder con los largos y tiempos
+# registrados.
+# --------------------------------------------------------------
+
+_t = ChatMemoryModel.__table__
+
+# Límite del tiempo de respuesta registrado (descarta respuestas que
+# quedaron sin par por errores o sesiones abandonadas)
+MAX_REPLY_LATENCY_MS = 120_000
+
+
+@dataclass(slots=True)
+class Turn:
+    offset: float  # segundos desde el inicio de la sesión
+    message: str
+    reply_chars: int
+    reply_latency_ms: Optional[float]  # None: respuesta con la misma fecha que el mensaje
+
+
+@dataclass(slots=True)
+class Session:
+    session_id: str
+    start: float  # segundos desde el inicio de la grabación
+    turns: List[Turn] = field(default_factory=list)
+
+
+# Huella del mensaje del usuario (clave del perfil de respuestas)
+def message_key(message: str) -> str:
+    return hashlib.sha256(message.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def _parse_ts(value) -> Optional[datetime]:
+    if value is None:
+        return None
+    ts = datetime.fromisoformat(value) if isinstance(value, str) else value
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+# --------------------------------------------------------------
+# Funciones: load_from_db / load_from_archive
+# --------------------------------------------------------------
+# Retornan los mensajes como diccionarios con session_id, role, message,
+# timestamp e id, opcionalmente filtrados por fecha.
+# --------------------------------------------------------------
+def load_from_db(bind: Optional[Engine] = None, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None) -> List[dict]:
+    query = select(_t.c.id, _t.c.session_id, _t.c.role, _t.c.message, _t.c.timestamp)
+    if since:
+        query = query.where(_t.c.timestamp >= since)
+    if until:
+        query = query.where(_t.c.timestamp < until)
+    with (bind or default_engine).connect() as conn:
+        return [dict(r._mapping) for r in conn.execute(query.order_by(_t.c.session_id, _t.c.id))]
+
+
+def load_from_archive(archive_dir: str, since: Optional[datetime] = None,
+                      until: Optional[datetime] = None) -> List[dict]:
+    records = []
+    for path in sorted(glob.glob(os.path.join(archive_dir, "dt=*", "*.jsonl.gz"))):
+        day = os.path.basename(os.path.dirname(path))[3:]
+        if since and day < since.strftime("%Y-%m-%d"):
+            continue
+        if until and day > until.strftime("%Y-%m-%d"):
+            continue
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                if line.strip():
+                    rec = json.loads(line)
+                    ts = _parse_ts(rec.get("timestamp"))
+                    if (since and ts and ts < since) or (until and ts and ts >= until):
+                        continue
+                    records.append(rec)
+    return records
+
+
+# --------------------------------------------------------------
+# Función: build_sessions
+# --------------------------------------------------------------
+# Agrupa los mensajes por sesión y empareja cada mensaje del usuario con
+# la respuesta del asistente que le sigue. Los mensajes sin fecha se
+# descartan. Retorna las sesiones ordenadas por inicio.
+# --------------------------------------------------------------
+def build_sessions(records: Iterable[dict], max_gap: float = 300.0,
+                   limit: Optional[int] = None) -> List[Session]:
+    by_session: Dict[str, List[Tuple[datetime, int, str, str]]] = {}
+    for rec in records:
+        ts = _parse_ts(rec.get("timestamp"))
+        if ts is None:
+            continue
+        by_session.setdefault(rec["session_id"], []).append(
+            (ts, rec.get("id") or 0, rec["role"], rec["message"])
+        )
+
+    raw: List[Tuple[datetime, str, List[Tuple[datetime, str, int, Optional[float]]]]] = []
+    for session_id, messages in by_session.items():
+        messages.sort(key=lambda m: (m[0], m[1]))
+        turns = []
+        pending = None
+        for ts, _, role, text in messages:
+            if role == "user":
+                if pending:
+                    turns.append((pending[0], pending[1], 0, 0.0))
+                pending = (ts, text)
+            elif pending:
+                gap_ms = (ts - pending[0]).total_seconds() * 1000
+                latency = min(gap_ms, MAX_REPLY_LATENCY_MS) if gap_ms > 0 else None
+                turns.append((pending[0], pending[1], len(text), latency))
+                pending = None
+        if pending:
+            turns.append((pending[0], pending[1], 0, 0.0))
+        if turns:
+            raw.append((turns[0][0], session_id, turns))
+
+    raw.sort(key=lambda s: s[0])
+    if limit:
+        raw = raw[:limit]
+
+    sessions = []
+    clock, previous_start = 0.0, None
+    for started, session_id, turns in raw:
+        if previous_start is not None:
+            clock += min((started - previous_start).total_seconds(), max_gap)
+        previous_start = started
+        session = Session(session_id=session_id, start=clock)
+        offset, previous = 0.0, started
+        for ts, text, chars, latency in turns:
+            offset += min((ts - previous).total_seconds(), max_gap)
+            previous = ts
+            session.turns.append(Turn(offset, text, chars, latency))
+        sessions.append(session)
+    return sessions
+
+
+# --------------------------------------------------------------
+# Clase: ReplayProfile
+# --------------------------------------------------------------
+# Largo y tiempo de respuesta registrados por mensaje del usuario. Si el
+# mismo mensaje aparece varias veces, sus respuestas se entregan por
+# turnos; los mensajes desconocidos reciben la mediana de la grabación.
+#
+# Las respuestas con latencia desconocida reciben "default_latency_ms";
+# sin ese valor, la mediana de las latencias conocidas.
+# "unknown_latency_turns" cuenta cuántas respuestas la recibieron.
+# --------------------------------------------------------------
+class ReplayProfile:
+    def __init__(self, replies: Dict[str, List[Tuple[int, float]]], default: Tuple[int, float],
+                 unknown_latency_turns: int = 0):
+        self.replies = replies
+        self.default = default
+        self.unknown_latency_turns = unknown_latency_turns
+        self._next: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_sessions(cls, sessions: List[Session],
+                      default_latency_ms: Optional[float] = None) -> "ReplayProfile":
+        answered = [t for s in sessions for t in s.turns if t.reply_chars]
+        chars = sorted(t.reply_chars for t in answered)
+        latencies = sorted(t.reply_latency_ms for t in answered if t.reply_latency_ms is not None)
+        if latencies:
+            median_latency = latencies[len(latencies) // 2]
+        else:
+            median_latency = default_latency_ms if default_latency_ms is not None else 1000.0
+        fallback = default_latency_ms if default_latency_ms is not None else median_latency
+
+        replies: Dict[str, List[Tuple[int, float]]] = {}
+        unknown = 0
+        for t in answered:
+            latency = t.reply_latency_ms
+            if latency is None:
+                latency = fallback
+                unknown += 1
+            replies.setdefault(message_key(t.message), []).append((t.reply_chars, latency))
+        if not chars:
+            return cls(replies, (200, median_latency))
+        return cls(replies, (chars[len(chars) // 2], median_latency), unknown)
+
+    @classmethod
+    def load(cls, path: str) -> "ReplayProfile":
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        return cls(
+            {k: [tuple(r) for r in v] for k, v in data["replies"].items()},
+            tuple(data["default"]),
+        )
+
+    def save(self, path: str) -> None:
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump({"default": list(self.default), "replies": self.replies}, fh, separators=(",", ":"))
+
+    # Retorna (caracteres, latencia en ms) para el mensaje del usuario
+    def reply_for(self, message: str) -> Tuple[int, float]:
+        key = message_key(message)
+        values = self.replies.get(key)
+        if not values:
+            return self.default
+        with self._lock:
+            index = self._next.get(key, 0)
+            self._next[key] = index + 1
+        return values[index % len(values)]
@@ -0,0 +1,257 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from .recording import ReplayProfile, Session, build_sessions, load_from_archive, load_from_db
+
+# --------------------------------------------------------------
+# Módulo: runner.py
+# --------------------------------------------------------------
+# Generador de carga que reproduce conversaciones reales contra una
+# instancia en ejecución.
+#
+# 1) Generar el perfil de respuestas del modelo falso:
+#     python -m src.infrastructure.replay.runner profile --out ./data/replay_profile.json
+#
+# 2) Arrancar la instancia a probar con el modelo falso:
+#     LLM_PROVIDER=replay REPLAY_PROFILE=./data/replay_profile.json \
+#         python -m src.infrastructure.api.serve
+#
+# 3) Reproducir el tráfico (2 = el doble de rápido que lo grabado):
+#     python -m src.infrastructure.replay.runner run --target http://127.0.0.1:8000 --speed 2
+#
+# Cada sesión envía sus mensajes a POST /chat en el momento registrado
+# (dividido por --speed), pero nunca antes de recibir la respuesta del
+# turno anterior, como un cliente real. Con --load-history cada sesión
+# abre con GET /chat/history/{session_id}. Las sesiones se envían con
+# el prefijo --session-prefix para no mezclarse con las originales.
+#
+# Fuentes: la tabla chat_memory (--source db, por defecto) o el archivo
+# de retención (--source archive, CHAT_ARCHIVE_DIR).
+#
+# Al terminar muestra por endpoint la cantidad de peticiones, la tasa de
+# errores y la distribución de latencias (p50/p90/p95/p99), además del
+# retraso de envío respecto del horario grabado: crece si el turno
+# anterior de la sesión tardó más que en la grabación, o si el
+# generador no da abasto (subir --concurrency).
+# --------------------------------------------------------------
+
+load_dotenv()
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "mean": round(sum(values) / len(values), 1) if values else 0.0,
+        "p50": round(_percentile(values, 50), 1),
+        "p90": round(_percentile(values, 90), 1),
+        "p95": round(_percentile(values, 95), 1),
+        "p99": round(_percentile(values, 99), 1),
+        "max": round(values[-1], 1) if values else 0.0,
+    }
+
+
+# --------------------------------------------------------------
+# Clase: ReplayStats
+# --------------------------------------------------------------
+# Resultados por endpoint. Un error es un código HTTP >= 400 o una
+# petición que no obtuvo respuesta (código 0).
+# --------------------------------------------------------------
+class ReplayStats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[int, int]] = {}
+        self.send_lag_ms: List[float] = []
+
+    def record(self, endpoint: str, status: int, latency_ms: float, lag_ms: float) -> None:
+        self.latencies.setdefault(endpoint, []).append(latency_ms)
+        codes = self.statuses.setdefault(endpoint, {})
+        codes[status] = codes.get(status, 0) + 1
+        self.send_lag_ms.append(max(lag_ms, 0.0))
+
+    def as_dict(self) -> dict:
+        endpoints = {}
+        for endpoint, latencies in self.latencies.items():
+            codes = self.statuses[endpoint]
+            errors = sum(n for code, n in codes.items() if code == 0 or code >= 400)
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": errors,
+                "error_rate": round(errors / len(latencies), 4),
+                "status": {str(code): n for code, n in sorted(codes.items())},
+                "latency_ms": _distribution(latencies),
+            }
+        return {"endpoints": endpoints, "send_lag_ms": _distribution(self.send_lag_ms)}
+
+
+def _request(method: str, url: str, body: Optional[dict], timeout: float) -> int:
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+
+# --------------------------------------------------------------
+# Clase: TrafficReplayer
+# --------------------------------------------------------------
+# Reproduce las sesiones contra "target". Las peticiones HTTP se hacen
+# en un pool de "concurrency" hilos (urllib, sin dependencias extra).
+# --------------------------------------------------------------
+class TrafficReplayer:
+    def __init__(self, target: str, speed: float = 1.0, concurrency: int = 256, timeout: float = 120.0,
+                 session_prefix: str = "replay-", load_history: bool = False,
+                 max_duration: Optional[float] = None):
+        self.target = target.rstrip("/")
+        self.speed = max(speed, 0.001)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.session_prefix = session_prefix
+        self.load_history = load_history
+        self.max_duration = max_duration
+        self.stats = ReplayStats()
+
+    async def run(self, sessions: List[Session]) -> dict:
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.concurrency))
+        started = time.monotonic()
+        await asyncio.gather(*(self._session(s, started) for s in sessions))
+        elapsed = time.monotonic() - started
+        summary = self.stats.as_dict()
+        summary.update({
+            "target": self.target,
+            "speed": self.speed,
+            "sessions": len(sessions),
+            "elapsed_s": round(elapsed, 1),
+        })
+        return summary
+
+    async def _session(self, session: Session, started: float) -> None:
+        session_id = (self.session_prefix + session.session_id)[:100]
+        opened = False
+        for turn in session.turns:
+            due = (session.start + turn.offset) / self.speed
+            if self.max_duration is not None and due > self.max_duration:
+                return
+            await asyncio.sleep(max(0.0, due - (time.monotonic() - started)))
+            lag_ms = ((time.monotonic() - started) - due) * 1000
+            if self.load_history and not opened:
+                opened = True
+                path = f"/chat/history/{urllib.parse.quote(session_id, safe='')}"
+                await self._call("GET /chat/history/{session_id}", "GET", path, None, lag_ms)
+            await self._call("POST /chat", "POST", "/chat",
+                             {"session_id": session_id, "message": turn.message}, lag_ms)
+
+    async def _call(self, endpoint: str, method: str, path: str, body: Optional[dict], lag_ms: float) -> None:
+        t0 = time.perf_counter()
+        status = await asyncio.to_thread(_request, method, self.target + path, body, self.timeout)
+        self.stats.record(endpoint, status, (time.perf_counter() - t0) * 1000, lag_ms)
+
+
+def _print_report(summary: dict) -> None:
+    print(f"Objetivo {summary['target']}  velocidad x{summary['speed']}  "
+          f"sesiones {summary['sessions']}  duración {summary['elapsed_s']} s")
+    header = f"{'endpoint':<34}{'peticiones':>11}{'errores':>9}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, data in summary["endpoints"].items():
+        lat = data["latency_ms"]
+        print(f"{endpoint:<34}{data['requests']:>11}{data['error_rate']:>9.2%}"
+              f"{lat['p50']:>9}{lat['p90']:>9}{lat['p95']:>9}{lat['p99']:>9}{lat['max']:>9}")
+    lag = summary["send_lag_ms"]
+    print(f"retraso de envío (ms): p50 {lag['p50']}  p99 {lag['p99']}  max {lag['max']}")
+
+
+def _parse_date(value: str) -> datetime:
+    ts = datetime.fromisoformat(value)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _load_sessions(args) -> List[Session]:
+    if args.source == "archive":
+        records = load_from_archive(args.archive_dir, args.since, args.until)
+    else:
+        records = load_from_db(since=args.since, until=args.until)
+    return build_sessions(records, max_gap=args.max_gap, limit=args.sessions)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reproduce tráfico de chat grabado contra una instancia")
+    sub = parser.add_subparsers(dest="command", required=True)
+    profile_cmd = sub.add_parser("profile", help="Genera el perfil de respuestas del modelo falso")
+    run_cmd = sub.add_parser("run", help="Reproduce las conversaciones contra una instancia")
+    for p in (profile_cmd, run_cmd):
+        p.add_argument("--source", choices=("db", "archive"), default="db")
+        p.add_argument("--archive-dir", default=os.getenv("CHAT_ARCHIVE_DIR", "./data/archive"))
+        p.add_argument("--since", type=_parse_date, help="Fecha ISO inicial (inclusive)")
+        p.add_argument("--until", type=_parse_date, help="Fecha ISO final (exclusiva)")
+        p.add_argument("--sessions", type=int, help="Máximo de sesiones (las primeras en comenzar)")
+        p.add_argument("--max-gap", type=float, default=300.0,
+                       help="Silencio máximo (s) entre mensajes o inicios de sesión")
+    profile_cmd.add_argument("--out", default=os.getenv("REPLAY_PROFILE", "./data/replay_profile.json"))
+    profile_cmd.add_argument("--default-latency-ms", type=float,
+                             default=float(os.environ["REPLAY_DEFAULT_LATENCY_MS"])
+                             if os.getenv("REPLAY_DEFAULT_LATENCY_MS") else None,
+                             help="Latencia (ms) para respuestas guardadas con la misma fecha que el mensaje "
+                                  "(por defecto, la mediana de las latencias conocidas)")
+    run_cmd.add_argument("--target", default="http://127.0.0.1:8000")
+    run_cmd.add_argument("--speed", type=float, default=1.0, help="Multiplicador de velocidad (1 = tiempo real)")
+    run_cmd.add_argument("--concurrency", type=int, default=256, help="Peticiones simultáneas máximas")
+    run_cmd.add_argument("--timeout", type=float, default=120.0)
+    run_cmd.add_argument("--duration", type=float, help="Segundos máximos de reproducción")
+    run_cmd.add_argument("--session-prefix", default="replay-")
+    run_cmd.add_argument("--load-history", action="store_true")
+    run_cmd.add_argument("--json-out", help="Guarda el reporte en JSON")
+    args = parser.parse_args(argv)
+
+    sessions = _load_sessions(args)
+    turns = sum(len(s.turns) for s in sessions)
+    span = max((s.start + (s.turns[-1].offset if s.turns else 0) for s in sessions), default=0.0)
+    print(f"{len(sessions)} sesiones, {turns} turnos, {span:.0f} s de tráfico grabado", file=sys.stderr)
+
+    if args.command == "profile":
+        profile = ReplayProfile.from_sessions(sessions, default_latency_ms=args.default_latency_ms)
+        if profile.unknown_latency_turns:
+            fallback = profile.default[1] if args.default_latency_ms is None else args.default_latency_ms
+            print(f"{profile.unknown_latency_turns} respuestas sin latencia registrada (misma fecha que el "
+                  f"mensaje): se usan {fallback:.0f} ms", file=sys.stderr)
+        profile.save(args.out)
+        print(f"Perfil guardado en {args.out}", file=sys.stderr)
+        return 0
+
+    replayer = TrafficReplayer(args.target, speed=args.speed, concurrency=args.concurrency, timeout=args.timeout,
+                               session_prefix=args.session_prefix, load_history=args.load_history,
+                               max_duration=args.duration)
+    summary = asyncio.run(replayer.run(sessions))
+    _print_report(summary)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from src.domain.entities import ChatMessage
+from src.domain.repositories import IChatRepository
+from src.infrastructure.cache.session_context_cache import SessionContextCache
+
+# --------------------------------------------------------------
+# Módulo: cached_chat_repository.py
+# --------------------------------------------------------------
+# Este módulo implementa CachedChatRepository, que envuelve otro
+# repositorio de chat (normalmente SQLChatRepository) y resuelve
+# get_recent_messages desde la caché de contextos de sesión.
+#
+# - Lecturas de contexto: primero la caché; si no está, la base de datos
+#   (y se guarda el resultado en la caché).
+# - Escrituras: se delegan y luego se agregan a la caché (write-through).
+# - Mensajes pendientes (se guardan en segundo plano): entran a la caché
+#   de inmediato y se reemplazan cuando llega la escritura.
+# - Borrado del historial: se delega e invalida la sesión en la caché.
+# El resto de operaciones se delega sin cambios.
+# --------------------------------------------------------------
+
+class CachedChatRepository(IChatRepository):
+    # ----------------------------------------------------------
+    # Constructor
+    # ----------------------------------------------------------
+    # Recibe el repositorio que accede a la base de datos y la caché
+    # compartida del proceso.
+    # ----------------------------------------------------------
+    def __init__(self, inner: IChatRepository, cache: SessionContextCache):
+        self.inner = inner
+        self.cache = cache
+
+    def save_message(self, message: ChatMessage) -> ChatMessage:
+        saved = self.inner.save_message(message)
+        self.cache.append(saved.session_id, [saved])
+        return saved
+
+    def save_messages(self, messages: List[ChatMessage]) -> List[ChatMessage]:
+        saved = self.inner.save_messages(messages)
+        by_session: Dict[str, List[ChatMessage]] = {}
+        for m in saved:
+            by_session.setdefault(m.session_id, []).append(m)
+        for session_id, items in by_session.items():
+            self.cache.append(session_id, items)
+        return saved
+
+    def remember_pending(self, messages: List[ChatMessage]) -> None:
+        by_session: Dict[str, List[ChatMessage]] = {}
+        for m in messages:
+            by_session.setdefault(m.session_id, []).append(m)
+        for session_id, items in by_session.items():
+            self.cache.add_pending(session_id, items)
+
+    def find_message(self, session_id: str, role: str, message: str, timestamp: datetime) -> Optional[ChatMessage]:
+        return self.inner.find_message(session_id, role, message, timestamp)
+
+    def get_session_history(self, session_id: str, limit: Optional[int] = None) -> List[ChatMessage]:
+        return self.inner.get_session_history(session_id, limit)
+
+    def delete_session_history(self, session_id: str) -> int:
+        deleted = self.inner.delete_session_history(session_id)
+        self.cache.invalidate(session_id)
+        return deleted
+
+    # ----------------------------------------------------------
+    # Método: get_recent_messages
+    # ----------------------------------------------------------
+    # Los cambios de otros workers los detecta la propia caché con la
+    # señal compartida. Con SESSION_CACHE_VALIDATE activo, además, antes
+    # de usar la caché se compara su último id con el de la base de datos
+    # (max(id) sobre el índice de session_id); si no coincide, la entrada
+    # se descarta.
+    # Si hay que leer de la base de datos, el resultado solo se guarda en
+    # la caché si la sesión no cambió durante la lectura (un save_message
+    # concurrente pudo agregar un mensaje que la lectura no incluye).
+    # ----------------------------------------------------------
+    def get_recent_messages(self, session_id: str, count: int) -> List[ChatMessage]:
+        cached = self.cache.get(session_id, count)
+        if cached is not None and self.cache.validate:
+            if self.inner.get_last_message_id(session_id) != self.cache.last_id(session_id):
+                self.cache.invalidate(session_id)
+                cached = None
+        if cached is not None:
+            return cached
+
+        if count > self.cache.messages_per_session:
+            return self.inner.get_recent_messages(session_id, count)
+        generation = self.cache.generation(session_id)
+        messages = self.inner.get_recent_messages(session_id, self.cache.messages_per_session)
+        self.cache.put(session_id, messages, expected_generation=generation)
+        return messages[-count:] if count > 0 else []
+
+    def get_session_version(self, session_id: str) -> Tuple[int, Optional[int], Optional[int], Optional[datetime]]:
+        return self.inner.get_session_version(session_id)
+
+    def get_last_message_id(self, session_id: str) -> Optional[int]:
+        return self.inner.get_last_message_id(session_id)
@@ -1,4 +1,6 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 from src.domain.entities import ChatMessage
 from src.domain.repositories import IChatRepository
@@ -12,8 +14,16 @@ from src.infrastructure.db.models import ChatMemoryModel
 # de datos SQLite mediante SQLAlchemy.
 #
 # Implementa la interfaz IChatRepository definida en el dominio.
+#
+# Las lecturas del historial usan consultas Core que devuelven tuplas
+# y se hidratan con ChatMessage.from_trusted (sin objetos ORM ni
+# revalidación de mensajes que ya se validaron al guardarse).
 # --------------------------------------------------------------
 
+# Columnas en el orden de los argumentos de ChatMessage.from_trusted
+_t = ChatMemoryModel.__table__
+_MESSAGE_COLUMNS = (_t.c.id, _t.c.session_id, _t.c.role, _t.c.message, _t.c.timestamp)
+
 class SQLChatRepository(IChatRepository):
     # ----------------------------------------------------------
     # Constructor
@@ -59,6 +69,33 @@ class SQLChatRepository(IChatRepository):
         self.db.refresh(m)
         return self._to_entity(m)
 
+    # ----------------------------------------------------------
+    # Método: save_messages
+    # ----------------------------------------------------------
+    # Guarda varios mensajes con un único flush/commit. Los ids se leen
+    # después del flush para no recargar cada fila tras el commit.
+    # ----------------------------------------------------------
+    def save_messages(self, messages: List[ChatMessage]) -> List[ChatMessage]:
+        if not messages:
+            return []
+        models = [
+            ChatMemoryModel(
+                session_id=m.session_id,
+                role=m.role,
+                message=m.message,
+                timestamp=m.timestamp
+            )
+            for m in messages
+        ]
+        self.db.add_all(models)
+        self.db.flush()
+        saved = [
+            ChatMessage.from_trusted(mm.id, m.session_id, m.role, m.message, m.timestamp)
+            for mm, m in zip(models, messages)
+        ]
+        self.db.commit()
+        return saved
+
     # ----------------------------------------------------------
     # Método: get_session_history
     # ----------------------------------------------------------
@@ -67,13 +104,14 @@ class SQLChatRepository(IChatRepository):
     # ----------------------------------------------------------
     def get_session_history(self, session_id: str, limit: Optional[int] = None) -> List[ChatMessage]:
         q = (
-            self.db.query(ChatMemoryModel)
-            .filter(ChatMemoryModel.session_id == session_id)
-            .order_by(ChatMemoryModel.timestamp.asc())
+            select(*_MESSAGE_COLUMNS)
+            .where(_t.c.session_id == session_id)
+            .order_by(_t.c.timestamp.asc(), _t.c.id.asc())
         )
         if limit:
             q = q.limit(limit)
-        return [self._to_entity(m) for m in q.all()]
+        trusted = ChatMessage.from_trusted
+        return [trusted(*r) for r in self.db.connection().execute(q)]
 
     # ----------------------------------------------------------
     # Método: delete_session_history
@@ -97,11 +135,53 @@ class SQLChatRepository(IChatRepository):
     # ----------------------------------------------------------
     def get_recent_messages(self, session_id: str, count: int) -> List[ChatMessage]:
         q = (
-            self.db.query(ChatMemoryModel)
-            .filter(ChatMemoryModel.session_id == session_id)
-            .order_by(ChatMemoryModel.timestamp.desc())
+            select(*_MESSAGE_COLUMNS)
+            .where(_t.c.session_id == session_id)
+            .order_by(_t.c.timestamp.desc(), _t.c.id.desc())
             .limit(count)
         )
-        result = [self._to_entity(m) for m in q.all()]
+        trusted = ChatMessage.from_trusted
+        result = [trusted(*r) for r in self.db.connection().execute(q)]
         result.reverse()  # Se invierte para conservar el orden lógico
         return result
+
+    # ----------------------------------------------------------
+    # Método: find_message
+    # ----------------------------------------------------------
+    # Busca un mensaje de la sesión con el mismo rol, texto y fecha.
+    # Lo usan los reintentos de trabajos para no guardar dos veces el
+    # mensaje del usuario.
+    # ----------------------------------------------------------
+    def find_message(self, session_id: str, role: str, message: str, timestamp: datetime) -> Optional[ChatMessage]:
+        row = self.db.connection().execute(
+            select(*_MESSAGE_COLUMNS)
+            .where(
+                _t.c.session_id == session_id,
+                _t.c.role == role,
+                _t.c.timestamp == timestamp,
+                _t.c.message == message,
+            )
+            .order_by(_t.c.id.asc())
+            .limit(1)
+        ).first()
+        return ChatMessage.from_trusted(*row) if row is not None else None
+
+    # ----------------------------------------------------------
+    # Método: get_session_version
+    # ----------------------------------------------------------
+    # Calcula en una sola consulta agregada la cantidad de mensajes,
+    # el primer y último id y la fecha del último mensaje de la sesión.
+    # ----------------------------------------------------------
+    def get_session_version(self, session_id: str) -> Tuple[int, Optional[int], Optional[int], Optional[datetime]]:
+        row = self.db.connection().execute(
+            select(func.count(_t.c.id), func.min(_t.c.id), func.max(_t.c.id), func.max(_t.c.timestamp))
+            .where(_t.c.session_id == session_id)
+        ).one()
+        return row[0], row[1], row[2], row[3]
+
+    # Último id de la sesión; SQLite lo resuelve con el índice de
+    # session_id sin recorrer los mensajes (a diferencia de count)
+    def get_last_message_id(self, session_id: str) -> Optional[int]:
+        return self.db.connection().execute(
+            select(func.max(_t.c.id)).where(_t.c.session_id == session_id)
+        ).scalar()
@@ -1,8 +1,19 @@
-from typing import List, Optional
+import os
+import threading
+import time
+from dataclasses import asdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
 from src.domain.entities import Product
+from src.domain.exceptions import InsufficientStockError, ProductNotFoundError, StockBusyError
 from src.domain.repositories import IProductRepository
 from src.infrastructure.db.models import ProductModel
+from src.infrastructure.catalog.version import (
+    bump_catalog_version, read_catalog_version, bump_stock_version, read_stock_version,
+)
 
 # --------------------------------------------------------------
 # Módulo: product_repository.py
@@ -14,8 +25,96 @@ from src.infrastructure.db.models import ProductModel
 # Implementa la interfaz IProductRepository definida en la capa de dominio,
 # asegurando la separación de responsabilidades dentro de la arquitectura
 # hexagonal.
+#
+# Las lecturas usan consultas Core (select de columnas) que devuelven
+# tuplas y se hidratan directamente en entidades Product con el
+# constructor de confianza, sin crear objetos ORM intermedios.
 # --------------------------------------------------------------
 
+# Columnas en el orden de los argumentos de Product.from_trusted
+_t = ProductModel.__table__
+_PRODUCT_COLUMNS = (
+    _t.c.id, _t.c.name, _t.c.brand, _t.c.category, _t.c.size,
+    _t.c.color, _t.c.price, _t.c.stock, _t.c.description,
+)
+
+# Campos que se pueden cambiar en bloque y los obligatorios para crear un producto
+_PATCH_FIELDS = ("name", "brand", "category", "size", "color", "price", "stock", "description")
+_REQUIRED_FIELDS = ("name", "brand", "category", "size", "color", "price", "stock")
+
+# Productos por sentencia UPDATE en bulk_upsert (limita los parámetros por sentencia)
+BULK_CHUNK_SIZE = int(os.getenv("PRODUCT_BULK_CHUNK_SIZE", "500"))
+
+# Reintentos cuando SQLite responde "database is locked" al actualizar stock
+# (además de la espera del busy timeout del driver)
+STOCK_BUSY_RETRIES = int(os.getenv("STOCK_BUSY_RETRIES", "3"))
+STOCK_BUSY_BACKOFF_SECONDS = float(os.getenv("STOCK_BUSY_BACKOFF_SECONDS", "0.05"))
+
+
+# --------------------------------------------------------------
+# Clase: StockStats
+# --------------------------------------------------------------
+# Métricas de contención de las reservas de stock en este proceso
+# (/ops/stock):
+# - lock_wait: tiempo hasta que la primera sentencia UPDATE obtiene el
+#   bloqueo de escritura de SQLite (espera por otros escritores),
+# - hold: tiempo que la transacción retiene ese bloqueo hasta el commit,
+# - busy_retries / busy_failures: reintentos y fallos por base ocupada,
+# - rejected: reservas rechazadas por stock insuficiente.
+# --------------------------------------------------------------
+class StockStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reservations = 0
+        self.releases = 0
+        self.rejected = 0
+        self.busy_retries = 0
+        self.busy_failures = 0
+        self.lock_wait_ms_total = 0.0
+        self.lock_wait_ms_max = 0.0
+        self.hold_ms_total = 0.0
+        self.transactions = 0
+
+    def record(self, kind: str, lock_wait_ms: float = 0.0, hold_ms: float = 0.0) -> None:
+        with self._lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+            if kind in ("reservations", "releases", "rejected"):
+                self.transactions += 1
+                self.lock_wait_ms_total += lock_wait_ms
+                self.lock_wait_ms_max = max(self.lock_wait_ms_max, lock_wait_ms)
+                self.hold_ms_total += hold_ms
+
+    def as_dict(self) -> Dict[str, object]:
+        with self._lock:
+            n = self.transactions
+            attempts = n + self.busy_retries + self.busy_failures
+            return {
+                "reservations": self.reservations,
+                "releases": self.releases,
+                "rejected": self.rejected,
+                "busy_retries": self.busy_retries,
+                "busy_failures": self.busy_failures,
+                "contention_ratio": round((self.busy_retries + self.busy_failures) / attempts, 4) if attempts else None,
+                "lock_wait_ms_avg": round(self.lock_wait_ms_total / n, 3) if n else None,
+                "lock_wait_ms_max": round(self.lock_wait_ms_max, 3),
+                "hold_ms_avg": round(self.hold_ms_total / n, 3) if n else None,
+            }
+
+
+stock_stats = StockStats()
+
+
+# Suma las cantidades repetidas de un mismo producto y ordena por id, para
+# que todas las transacciones actualicen las filas en el mismo orden
+def _merge_items(items: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: Dict[int, int] = {}
+    for product_id, quantity in items:
+        if quantity <= 0:
+            raise ValueError("La cantidad debe ser > 0")
+        merged[product_id] = merged.get(product_id, 0) + quantity
+    return sorted(merged.items())
+
+
 class SQLProductRepository(IProductRepository):
     # ----------------------------------------------------------
     # Constructor
@@ -47,6 +146,17 @@ class SQLProductRepository(IProductRepository):
             description=m.description
         )
 
+    # ----------------------------------------------------------
+    # Método privado: _select
+    # ----------------------------------------------------------
+    # Ejecuta un select de columnas sobre la conexión de la sesión
+    # (misma transacción) y crea las entidades sin revalidarlas.
+    # ----------------------------------------------------------
+    def _select(self, *where) -> List[Product]:
+        rows = self.db.connection().execute(select(*_PRODUCT_COLUMNS).where(*where).order_by(_t.c.id))
+        trusted = Product.from_trusted
+        return [trusted(*r) for r in rows]
+
     # ----------------------------------------------------------
     # Método: get_all
     # ----------------------------------------------------------
@@ -54,7 +164,7 @@ class SQLProductRepository(IProductRepository):
     # y los convierte en entidades del dominio.
     # ----------------------------------------------------------
     def get_all(self) -> List[Product]:
-        return [self._to_entity(m) for m in self.db.query(ProductModel).all()]
+        return self._select()
 
     # ----------------------------------------------------------
     # Método: get_by_id
@@ -63,8 +173,8 @@ class SQLProductRepository(IProductRepository):
     # como entidad del dominio; si no, retorna None.
     # ----------------------------------------------------------
     def get_by_id(self, product_id: int) -> Optional[Product]:
-        m = self.db.query(ProductModel).filter(ProductModel.id == product_id).first()
-        return self._to_entity(m) if m else None
+        found = self._select(_t.c.id == product_id)
+        return found[0] if found else None
 
     # ----------------------------------------------------------
     # Método: get_by_brand
@@ -72,10 +182,7 @@ class SQLProductRepository(IProductRepository):
     # Devuelve una lista de productos filtrados por marca.
     # ----------------------------------------------------------
     def get_by_brand(self, brand: str) -> List[Product]:
-        return [
-            self._to_entity(m)
-            for m in self.db.query(ProductModel).filter(ProductModel.brand == brand).all()
-        ]
+        return self._select(_t.c.brand == brand)
 
     # ----------------------------------------------------------
     # Método: get_by_category
@@ -83,10 +190,7 @@ class SQLProductRepository(IProductRepository):
     # Devuelve una lista de productos filtrados por categoría.
     # ----------------------------------------------------------
     def get_by_category(self, category: str) -> List[Product]:
-        return [
-            self._to_entity(m)
-            for m in self.db.query(ProductModel).filter(ProductModel.category == category).all()
-        ]
+        return self._select(_t.c.category == category)
 
     # ----------------------------------------------------------
     # Método: save
@@ -94,7 +198,8 @@ class SQLProductRepository(IProductRepository):
     # Guarda un producto en la base de datos.
     # - Si el producto ya tiene un ID, actualiza sus campos.
     # - Si no tiene ID, crea un nuevo registro.
-    # Finalmente, hace commit y retorna la entidad actualizada.
+    # Finalmente, incrementa la versión del catálogo, hace commit y
+    # retorna la entidad actualizada.
     # ----------------------------------------------------------
     def save(self, product: Product) -> Product:
         if product.id:
@@ -105,10 +210,11 @@ class SQLProductRepository(IProductRepository):
                 setattr(m, k, getattr(product, k))
         else:
             # Crea un nuevo producto
-            m = ProductModel(**product.__dict__)
+            m = ProductModel(**asdict(product))
             self.db.add(m)
 
-        # Guarda los cambios
+        # Guarda los cambios junto con la nueva versión del catálogo
+        bump_catalog_version(self.db)
         self.db.commit()
         self.db.refresh(m)
         return self._to_entity(m)
@@ -124,5 +230,150 @@ class SQLProductRepository(IProductRepository):
         if not m:
             return False
         self.db.delete(m)
+        bump_catalog_version(self.db)
         self.db.commit()
         return True
+
+    # ----------------------------------------------------------
+    # Método: bulk_upsert
+    # ----------------------------------------------------------
+    # Actualiza en bloques de BULK_CHUNK_SIZE productos con una sola
+    # sentencia por bloque:
+    #     UPDATE products SET price = CASE id WHEN :a THEN :pa ... ELSE price END, ...
+    #     WHERE id IN (...) RETURNING id
+    # (cada columna solo cambia en los ids que la traen). Los que no
+    # existían y traen todos los campos se insertan en un solo INSERT de
+    # varias filas. Todo en una transacción, con un único incremento de
+    # la versión del catálogo.
+    # ----------------------------------------------------------
+    def bulk_upsert(self, items: List[Dict[str, Any]]) -> List[Tuple[Optional[int], str]]:
+        if not items:
+            return []
+        try:
+            conn = self.db.connection()
+            found = set()
+            patches = [i for i in items if i.get("id") is not None]
+            for start in range(0, len(patches), BULK_CHUNK_SIZE):
+                chunk = patches[start:start + BULK_CHUNK_SIZE]
+                ids = [i["id"] for i in chunk]
+                values = {}
+                for f in _PATCH_FIELDS:
+                    whens = {i["id"]: i[f] for i in chunk if i.get(f) is not None}
+                    if whens:
+                        values[f] = case(whens, value=_t.c.id, else_=_t.c[f])
+                if values:
+                    stmt = update(_t).where(_t.c.id.in_(ids)).values(values).returning(_t.c.id)
+                else:
+                    stmt = select(_t.c.id).where(_t.c.id.in_(ids))
+                found.update(conn.execute(stmt).scalars())
+
+            outcomes: List[Tuple[Optional[int], str]] = [None] * len(items)
+            creates = []
+            for idx, item in enumerate(items):
+                if item.get("id") in found:
+                    outcomes[idx] = (item["id"], "updated")
+                elif all(item.get(f) is not None for f in _REQUIRED_FIELDS):
+                    creates.append(idx)
+                else:
+                    outcomes[idx] = (item.get("id"), "not_found")
+
+            if creates:
+                rows = [
+                    {"id": items[idx].get("id"),
+                     **{f: items[idx].get(f) for f in _REQUIRED_FIELDS},
+                     "description": items[idx].get("description") or ""}
+                    for idx in creates
+                ]
+                new_ids = conn.execute(
+                    insert(_t).returning(_t.c.id, sort_by_parameter_order=True), rows
+                ).scalars().all()
+                for idx, product_id in zip(creates, new_ids):
+                    outcomes[idx] = (product_id, "created")
+
+            if found or creates:
+                bump_catalog_version(conn)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return outcomes
+
+    # ----------------------------------------------------------
+    # Métodos: reserve_stock / release_stock
+    # ----------------------------------------------------------
+    # Cada producto se actualiza con un único UPDATE condicional
+    # (stock = stock - n WHERE id = :id AND stock >= n) que retorna el
+    # stock resultante, sin leer la fila antes. Así dos compradores
+    # concurrentes nunca pueden dejar el stock negativo ni pisarse.
+    # ----------------------------------------------------------
+    def reserve_stock(self, items: List[Tuple[int, int]]) -> Dict[int, int]:
+        return self._change_stock(_merge_items(items), reserve=True)
+
+    def release_stock(self, items: List[Tuple[int, int]]) -> Dict[int, int]:
+        return self._change_stock(_merge_items(items), reserve=False)
+
+    # ----------------------------------------------------------
+    # Método privado: _change_stock
+    # ----------------------------------------------------------
+    # Aplica todos los cambios en una transacción corta: el bloqueo de
+    # escritura se toma en el primer UPDATE y se libera en el commit
+    # (junto con el incremento de la versión del stock; la del catálogo
+    # no cambia). Si un producto no existe o no alcanza el stock, se
+    # revierte todo.
+    # ----------------------------------------------------------
+    def _change_stock(self, items: List[Tuple[int, int]], reserve: bool) -> Dict[int, int]:
+        if not items:
+            return {}
+        for attempt in range(STOCK_BUSY_RETRIES + 1):
+            started = time.perf_counter()
+            locked_at = None
+            try:
+                conn = self.db.connection()
+                result: Dict[int, int] = {}
+                for product_id, quantity in items:
+                    stmt = update(_t).where(_t.c.id == product_id)
+                    if reserve:
+                        stmt = stmt.where(_t.c.stock >= quantity).values(stock=_t.c.stock - quantity)
+                    else:
+                        stmt = stmt.values(stock=_t.c.stock + quantity)
+                    row = conn.execute(stmt.returning(_t.c.stock)).first()
+                    if locked_at is None:
+                        locked_at = time.perf_counter()
+                    if row is None:
+                        available = conn.execute(select(_t.c.stock).where(_t.c.id == product_id)).scalar()
+                        self.db.rollback()
+                        if available is None:
+                            raise ProductNotFoundError(f"Producto {product_id} no encontrado")
+                        stock_stats.record("rejected", (locked_at - started) * 1000,
+                                           (time.perf_counter() - locked_at) * 1000)
+                        raise InsufficientStockError(product_id, quantity, available)
+                    result[product_id] = row[0]
+                bump_stock_version(conn)
+                self.db.commit()
+            except OperationalError as e:
+                self.db.rollback()
+                if "locked" not in str(e).lower() and "busy" not in str(e).lower():
+                    raise
+                if attempt == STOCK_BUSY_RETRIES:
+                    stock_stats.record("busy_failures")
+                    raise StockBusyError("La base de datos está ocupada; intenta de nuevo") from e
+                stock_stats.record("busy_retries")
+                time.sleep(STOCK_BUSY_BACKOFF_SECONDS * (2 ** attempt))
+                continue
+
+            done = time.perf_counter()
+            stock_stats.record("reservations" if reserve else "releases",
+                               (locked_at - started) * 1000, (done - locked_at) * 1000)
+            return result
+
+    # ----------------------------------------------------------
+    # Método: get_catalog_version
+    # ----------------------------------------------------------
+    # Retorna la versión del catálogo y su fecha de actualización
+    # desde la tabla "catalog_meta".
+    # ----------------------------------------------------------
+    def get_catalog_version(self) -> Tuple[int, Optional[datetime]]:
+        return read_catalog_version(self.db.connection())
+
+    def get_stock_version(self) -> Tuple[int, Optional[datetime]]:
+        return read_stock_version(self.db.connection())
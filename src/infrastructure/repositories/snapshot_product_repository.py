@@ -0,0 +1,111 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from src.domain.entities import Product
+from src.domain.repositories import IProductRepository
+from src.infrastructure.catalog.snapshot import CatalogSnapshotStore
+
+# --------------------------------------------------------------
+# Módulo: snapshot_product_repository.py
+# --------------------------------------------------------------
+# Este módulo implementa SnapshotProductRepository, un repositorio de
+# productos que resuelve las lecturas desde el snapshot del catálogo
+# mapeado en memoria (compartido entre workers) y delega las escrituras
+# en otro repositorio (normalmente SQLProductRepository).
+#
+# Después de cada escritura se vuelve a publicar el snapshot, para que
+# todos los workers vean el cambio. Si el snapshot no está disponible,
+# las lecturas se delegan también al repositorio SQL.
+# --------------------------------------------------------------
+
+class SnapshotProductRepository(IProductRepository):
+    # ----------------------------------------------------------
+    # Constructor
+    # ----------------------------------------------------------
+    # Recibe el repositorio que persiste los cambios y el almacén
+    # del snapshot del catálogo.
+    # ----------------------------------------------------------
+    def __init__(self, inner: IProductRepository, store: CatalogSnapshotStore):
+        self.inner = inner
+        self.store = store
+
+    # ----------------------------------------------------------
+    # Métodos de lectura
+    # ----------------------------------------------------------
+    # Retornan vistas ProductView (compatibles con Product) sin copiar
+    # los datos del snapshot.
+    # ----------------------------------------------------------
+    def get_all(self) -> List[Product]:
+        snap = self.store.current()
+        if snap is None:
+            return self.inner.get_all()
+        return list(snap)
+
+    def get_by_id(self, product_id: int) -> Optional[Product]:
+        snap = self.store.current()
+        if snap is None:
+            return self.inner.get_by_id(product_id)
+        i = snap.index_of(product_id)
+        return snap.view(i) if i is not None else None
+
+    def get_by_brand(self, brand: str) -> List[Product]:
+        snap = self.store.current()
+        if snap is None:
+            return self.inner.get_by_brand(brand)
+        return [p for p in snap if p.brand == brand]
+
+    def get_by_category(self, category: str) -> List[Product]:
+        snap = self.store.current()
+        if snap is None:
+            return self.inner.get_by_category(category)
+        return [p for p in snap if p.category == category]
+
+    # La versión viene en la cabecera del snapshot (sin consultar la BD)
+    def get_catalog_version(self) -> Tuple[int, Optional[datetime]]:
+        snap = self.store.current()
+        if snap is None:
+            return self.inner.get_catalog_version()
+        return snap.version, datetime.fromtimestamp(snap.updated_at, tz=timezone.utc)
+
+    def get_stock_version(self) -> Tuple[int, Optional[datetime]]:
+        snap = self.store.current()
+        if snap is None:
+            return self.inner.get_stock_version()
+        version, updated_ts = snap.stock_version
+        return version, datetime.fromtimestamp(updated_ts, tz=timezone.utc) if updated_ts else None
+
+    # ----------------------------------------------------------
+    # Métodos de escritura
+    # ----------------------------------------------------------
+    # Se delegan al repositorio interno y luego se publica el snapshot.
+    # ----------------------------------------------------------
+    def save(self, product: Product) -> Product:
+        saved = self.inner.save(product)
+        self.store.publish()
+        return saved
+
+    def delete(self, product_id: int) -> bool:
+        deleted = self.inner.delete(product_id)
+        if deleted:
+            self.store.publish()
+        return deleted
+
+    # Un lote completo se publica una sola vez
+    def bulk_upsert(self, items: List[Dict[str, Any]]) -> List[Tuple[Optional[int], str]]:
+        outcomes = self.inner.bulk_upsert(items)
+        if any(status != "not_found" for _, status in outcomes):
+            self.store.publish()
+        return outcomes
+
+    # Las reservas llegan en ráfagas: el stock de los productos afectados
+    # se copia al snapshot de forma diferida, agrupando las reservas
+    # cercanas, sin regenerar el archivo. El stock autoritativo es el de
+    # la base de datos (el UPDATE condicional).
+    def reserve_stock(self, items: List[Tuple[int, int]]) -> Dict[int, int]:
+        result = self.inner.reserve_stock(items)
+        self.store.publish_stock_soon(result)
+        return result
+
+    def release_stock(self, items: List[Tuple[int, int]]) -> Dict[int, int]:
+        result = self.inner.release_stock(items)
+        self.store.publish_stock_soon(result)
+        return result
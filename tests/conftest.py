@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# --------------------------------------------------------------
+# Configuración de las pruebas
+# --------------------------------------------------------------
+# Los módulos de src crean sus instancias compartidas al importarse,
+# leyendo el entorno: se apuntan a archivos temporales antes de que se
+# importe cualquier prueba, para no tocar data/.
+# --------------------------------------------------------------
+_tmp = tempfile.mkdtemp(prefix="ecommerce-chat-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/test.db")
+os.environ.setdefault("CATALOG_SNAPSHOT_PATH", f"{_tmp}/catalog.snapshot")
+os.environ.setdefault("SESSION_CACHE_SIGNAL_PATH", f"{_tmp}/session_versions.bin")
+os.environ.setdefault("CHAT_WRITE_DEAD_LETTER", f"{_tmp}/chat_writes_failed.jsonl")
+os.environ.setdefault("CHAT_WRITE_JOURNAL_DIR", f"{_tmp}/chat_journal")
+os.environ.setdefault("CHAT_RETENTION_LOCK", f"{_tmp}/retention.lock")
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+from src.infrastructure.db.database import Base  # noqa: E402
+from src.infrastructure.db import models  # noqa: E402,F401  (registra las tablas en Base)
+
+
+# Base de datos SQLite temporal con todas las tablas, una por prueba
+@pytest.fixture
+def engine(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path}/test.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind)
+    yield bind
+    bind.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
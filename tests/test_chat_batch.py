@@ -0,0 +1,86 @@
+import asyncio
+
+from src.application.chat_service import ChatService
+from src.application.dtos import ChatMessageRequestDTO
+from src.domain.exceptions import AIServiceError
+from src.infrastructure.repositories.chat_repository import SQLChatRepository
+from src.infrastructure.repositories.product_repository import SQLProductRepository
+
+
+# Modelo falso: responde con el mensaje y registra el contexto que recibió
+class RecordingAI:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.contexts = {}
+
+    def generate_response_sync(self, message, products, context, alternatives=None, raise_errors=False):
+        self.contexts[message] = [m.message for m in context.messages]
+        if message in self.failing:
+            if raise_errors:
+                raise AIServiceError("modelo caído")
+            return "Lo siento"
+        return f"re: {message}"
+
+
+def _run(session_factory, ai, items, max_concurrency=4):
+    db = session_factory()
+    try:
+        service = ChatService(SQLProductRepository(db), SQLChatRepository(db), ai)
+        requests = [ChatMessageRequestDTO(session_id=s, message=m) for s, m in items]
+        return asyncio.run(service.process_batch(requests, max_concurrency))
+    finally:
+        db.close()
+
+
+def _history(session_factory, session_id):
+    db = session_factory()
+    try:
+        return [(m.role, m.message) for m in SQLChatRepository(db).get_session_history(session_id)]
+    finally:
+        db.close()
+
+
+def test_turns_of_a_session_run_in_order(session_factory):
+    ai = RecordingAI()
+    items = [("a", "a1"), ("b", "b1"), ("a", "a2"), ("b", "b2"), ("a", "a3")]
+
+    result = _run(session_factory, ai, items)
+
+    assert [r.index for r in result.items] == list(range(len(items)))
+    assert [r.response.assistant_message for r in result.items] == [f"re: {m}" for _, m in items]
+    # Cada turno ve en su contexto los turnos anteriores de su sesión (y solo esos)
+    assert ai.contexts["a2"] == ["a1", "re: a1"]
+    assert ai.contexts["a3"] == ["a1", "re: a1", "a2", "re: a2"]
+    assert ai.contexts["b2"] == ["b1", "re: b1"]
+    assert _history(session_factory, "a") == [
+        ("user", "a1"), ("assistant", "re: a1"),
+        ("user", "a2"), ("assistant", "re: a2"),
+        ("user", "a3"), ("assistant", "re: a3"),
+    ]
+
+
+def test_model_failure_is_an_item_error_and_is_not_saved(session_factory):
+    ai = RecordingAI(failing={"a2"})
+
+    result = _run(session_factory, ai, [("a", "a1"), ("a", "a2"), ("a", "a3")])
+
+    assert (result.total, result.succeeded, result.failed) == (3, 2, 1)
+    failed = result.items[1]
+    assert not failed.ok and "modelo caído" in failed.error
+    assert ai.contexts["a3"] == ["a1", "re: a1"]
+    assert _history(session_factory, "a") == [
+        ("user", "a1"), ("assistant", "re: a1"), ("user", "a3"), ("assistant", "re: a3"),
+    ]
+
+
+def test_persist_failure_keeps_the_replies(session_factory, monkeypatch):
+    def broken_save(self, messages):
+        raise RuntimeError("disco lleno")
+
+    monkeypatch.setattr(SQLChatRepository, "save_messages", broken_save)
+
+    result = _run(session_factory, RecordingAI(), [("a", "a1")])
+
+    item = result.items[0]
+    assert item.ok and item.response.assistant_message == "re: a1"
+    assert "disco lleno" in item.persist_error
@@ -0,0 +1,123 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from src.domain.entities import ChatMessage
+from src.infrastructure import chat_writer as chat_writer_module
+from src.infrastructure.chat_writer import ChatWriter
+from src.infrastructure.file_lock import unlock
+from src.infrastructure.repositories.chat_repository import SQLChatRepository
+
+
+@pytest.fixture(autouse=True)
+def database(monkeypatch, session_factory):
+    monkeypatch.setattr(chat_writer_module, "SessionLocal", session_factory)
+
+
+def _writer(tmp_path, **kwargs):
+    return ChatWriter(retries=0, backoff_seconds=0, dead_letter_path=str(tmp_path / "failed.jsonl"),
+                      journal_dir=str(tmp_path / "journal"), **kwargs)
+
+
+def _turn(session_id, n):
+    at = datetime(2026, 1, 1, 12, 0, n, tzinfo=timezone.utc)
+    return [ChatMessage(None, session_id, "user", f"pregunta {n}", at),
+            ChatMessage(None, session_id, "assistant", f"respuesta {n}", at)]
+
+
+def _history(session_factory, session_id):
+    db = session_factory()
+    try:
+        return [m.message for m in SQLChatRepository(db).get_session_history(session_id)]
+    finally:
+        db.close()
+
+
+# Escritor cuya base de datos y archivo de pendientes fallan: la escritura
+# queda solo en el diario, como si el proceso se hubiera caído
+def _stuck_writer(tmp_path):
+    writer = _writer(tmp_path)
+
+    def fail(messages):
+        raise OSError("sin disco")
+
+    writer._persist = fail
+    writer._dead_letter = fail
+    return writer
+
+
+def test_journal_is_emptied_once_writes_are_saved(tmp_path, session_factory):
+    writer = _writer(tmp_path)
+
+    async def scenario():
+        await writer.submit(_turn("s1", 1))
+        await writer.submit(_turn("s1", 2))
+        await writer.flush()
+
+    asyncio.run(scenario())
+    assert _history(session_factory, "s1") == ["pregunta 1", "respuesta 1", "pregunta 2", "respuesta 2"]
+    assert os.path.getsize(writer._journal_path) == 0
+    assert writer.stats()["journal_open_writes"] == 0
+
+
+def test_recover_replays_journal_of_dead_process(tmp_path, session_factory):
+    crashed = _stuck_writer(tmp_path)
+
+    async def scenario():
+        # submit() ya retornó: la escritura está en el diario aunque nunca llegue a la BD
+        await crashed.submit(_turn("s1", 1))
+        await crashed.submit(_turn("s1", 2))
+        await crashed.flush()
+
+    asyncio.run(scenario())
+    assert _history(session_factory, "s1") == []
+
+    # Mientras el proceso vive, su diario no se toca
+    assert _writer(tmp_path).recover() == 0
+
+    # La primera escritura alcanzó a guardarse en parte antes de la caída
+    db = session_factory()
+    try:
+        SQLChatRepository(db).save_message(_turn("s1", 1)[0])
+    finally:
+        db.close()
+
+    unlock(crashed._journal)
+    assert _writer(tmp_path).recover() == 3
+    assert _history(session_factory, "s1") == ["pregunta 1", "respuesta 1", "pregunta 2", "respuesta 2"]
+    assert os.listdir(tmp_path / "journal") == []
+
+
+def test_truncated_last_line_is_ignored(tmp_path, session_factory):
+    crashed = _stuck_writer(tmp_path)
+
+    async def scenario():
+        await crashed.submit(_turn("s1", 1))
+        await crashed.flush()
+
+    asyncio.run(scenario())
+    with open(crashed._journal_path, "a", encoding="utf-8") as fh:
+        fh.write('{"entry": 2, "messages": [{"session_id": "s1"')
+    unlock(crashed._journal)
+
+    assert _writer(tmp_path).recover() == 2
+    assert _history(session_factory, "s1") == ["pregunta 1", "respuesta 1"]
+
+
+def test_submit_waits_for_the_write_if_journal_fails(tmp_path, session_factory):
+    writer = _writer(tmp_path)
+
+    def fail(messages):
+        raise OSError("diario no disponible")
+
+    writer._journal_append = fail
+
+    async def scenario():
+        task = await writer.submit(_turn("s1", 1))
+        return task.done()
+
+    assert asyncio.run(scenario())
+    assert _history(session_factory, "s1") == ["pregunta 1", "respuesta 1"]
+    assert writer.stats()["journal_errors"] == 1
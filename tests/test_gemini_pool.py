@@ -0,0 +1,103 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from src.domain.entities import ChatContext
+from src.infrastructure.llm_providers.fake_gemini_server import REPLY, FakeGeminiState, make_handler
+from src.infrastructure.llm_providers.gemini_pool import GeminiPool, PoolEntry, PooledGeminiService
+
+pytest.importorskip("google.ai.generativelanguage")
+
+
+# API de Gemini falsa en un puerto libre: cada clave acepta 2 peticiones por minuto
+@pytest.fixture
+def fake_server():
+    state = FakeGeminiState(rpm=2, latency_ms=0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}", state
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _pool(endpoint: str, keys, cooldown: float = 30.0) -> GeminiPool:
+    # Límites locales altos: los 429 los decide el servidor
+    entries = [PoolEntry(k, "models/gemini-test", rpm=1000, tpm=10_000_000, endpoint=endpoint, name=k)
+               for k in keys]
+    return GeminiPool(entries, cooldown_seconds=cooldown, max_wait_seconds=0.5)
+
+
+def _entry_stats(pool: GeminiPool, name: str) -> dict:
+    return next(e for e in pool.stats()["entries"] if e["name"] == name)
+
+
+def test_service_answers_through_the_pool(fake_server):
+    endpoint, state = fake_server
+    service = PooledGeminiService(_pool(endpoint, ["k1"]))
+
+    reply = service.generate_response_sync("Hola", [], ChatContext(messages=[]), raise_errors=True)
+    chunks = list(service.generate_response_stream("Hola", [], ChatContext(messages=[])))
+
+    assert reply == REPLY
+    assert "".join(chunks) == REPLY
+    assert state.accepted == {"k1": 2}
+
+
+def test_rate_limited_key_cools_down_and_calls_fail_over(fake_server):
+    endpoint, state = fake_server
+    pool = _pool(endpoint, ["k1", "k2"])
+
+    # 4 llamadas caben en la cuota de las dos claves
+    for _ in range(4):
+        pool.generate_content("hola")
+    assert state.accepted == {"k1": 2, "k2": 2}
+
+    # La quinta recibe 429 en ambas claves y las dos quedan en enfriamiento
+    with pytest.raises(Exception) as excinfo:
+        pool.generate_content("hola")
+    assert getattr(excinfo.value, "code", None) == 429
+    for name in ("k1", "k2"):
+        stats = _entry_stats(pool, name)
+        assert stats["rate_limited"] == 1
+        assert stats["cooling_down_seconds"] > 0
+
+    # Sin claves disponibles dentro de max_wait_seconds, el pool no llama al servidor
+    rejected = dict(state.rejected)
+    with pytest.raises(Exception, match="sin cuota"):
+        pool.generate_content("hola")
+    assert state.rejected == rejected
+
+
+def test_failover_to_the_key_with_quota(fake_server):
+    endpoint, state = fake_server
+    pool = _pool(endpoint, ["k1", "k2"])
+
+    # k1 agota su cuota en el servidor por fuera del pool
+    state.admit("k1")
+    state.admit("k1")
+
+    for _ in range(2):
+        response = pool.generate_content("hola")
+        assert response.candidates[0].content.parts[0].text == REPLY
+
+    assert state.accepted == {"k1": 2, "k2": 2}
+    k1 = _entry_stats(pool, "k1")
+    assert k1["rate_limited"] == 1 and k1["cooling_down_seconds"] > 0
+    assert _entry_stats(pool, "k2")["calls"] == 2
+
+
+def test_limits_are_split_between_workers(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEYS", "a,b")
+    monkeypatch.setenv("GEMINI_POOL_RPM", "60")
+    monkeypatch.setenv("GEMINI_POOL_TPM", "1000")
+    monkeypatch.setenv("GEMINI_POOL_WORKERS", "4")
+    monkeypatch.delenv("GEMINI_POOL", raising=False)
+    monkeypatch.delenv("GEMINI_POOL_MODELS", raising=False)
+
+    pool = GeminiPool.from_env()
+
+    assert [(e.requests.capacity, e.tokens.capacity) for e in pool.entries] == [(15, 250), (15, 250)]
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import create_engine, select
+
+from src.infrastructure.cache.idempotency_store import (
+    ABANDONED, CONFLICT, DONE, NEW, PENDING, IdempotencyStore, fingerprint,
+)
+from src.infrastructure.db.models import ChatIdempotencyModel
+
+_t = ChatIdempotencyModel.__table__
+
+
+@pytest.fixture
+def store(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/idempotency.db")
+    _t.create(engine)
+    return IdempotencyStore(bind=engine, ttl_seconds=60, pending_seconds=0.05, wait_seconds=0.2)
+
+
+def _row(store, session_id, key):
+    with store.engine.connect() as conn:
+        return conn.execute(select(_t).where(_t.c.session_id == session_id, _t.c.key == key)).first()
+
+
+def test_replays_stored_response(store):
+    async def scenario():
+        digest = fingerprint("hola")
+        outcome, token = await store.acquire("s1", "k1", digest)
+        assert outcome == NEW
+        assert await store.complete("s1", "k1", token, {"assistant_message": "respuesta"})
+        return await store.acquire("s1", "k1", digest)
+
+    assert asyncio.run(scenario()) == (DONE, {"assistant_message": "respuesta"})
+
+
+def test_same_key_with_other_message_is_a_conflict(store):
+    async def scenario():
+        await store.acquire("s1", "k1", fingerprint("hola"))
+        return await store.acquire("s1", "k1", fingerprint("otro mensaje"))
+
+    assert asyncio.run(scenario()) == (CONFLICT, None)
+
+
+def test_abandon_frees_the_key(store):
+    async def scenario():
+        digest = fingerprint("hola")
+        _, token = await store.acquire("s1", "k1", digest)
+        await store.abandon("s1", "k1", token)
+        return await store.acquire("s1", "k1", digest)
+
+    outcome, token = asyncio.run(scenario())
+    assert outcome == NEW
+    assert _row(store, "s1", "k1").owner == token
+
+
+# La petición original tarda más que IDEMPOTENCY_PENDING_SECONDS y otra
+# retoma la clave: lo que haga la original después no debe afectar a la
+# nueva dueña.
+def test_takeover_after_pending_expires(store):
+    async def scenario():
+        digest = fingerprint("hola")
+        outcome, slow = await store.acquire("s1", "k1", digest)
+        assert outcome == NEW
+        time.sleep(0.1)  # vence el registro 'pending' de la primera petición
+
+        outcome, fresh = await store.acquire("s1", "k1", digest)
+        assert outcome == NEW
+        assert fresh != slow
+
+        # La petición lenta termina después: ni completa ni libera la clave
+        assert not await store.complete("s1", "k1", slow, {"assistant_message": "vieja"})
+        await store.abandon("s1", "k1", slow)
+        row = _row(store, "s1", "k1")
+        assert (row.status, row.owner) == (PENDING, fresh)
+
+        assert await store.complete("s1", "k1", fresh, {"assistant_message": "nueva"})
+        return await store.acquire("s1", "k1", digest)
+
+    assert asyncio.run(scenario()) == (DONE, {"assistant_message": "nueva"})
+    assert store.stats()["lost_ownership"] == 1
+
+
+# Un reintento tras un fallo recibe la fecha del primer intento, para
+# reconocer el mensaje del usuario que ya guardó ese intento
+def test_retry_keeps_first_attempt_time(store):
+    async def scenario():
+        digest = fingerprint("hola")
+        _, token = await store.acquire("s1", "k1", digest)
+        first = store.first_attempt("s1", "k1")
+        await store.abandon("s1", "k1", token)
+        assert store.first_attempt("s1", "k1") is None
+        assert _row(store, "s1", "k1").status == ABANDONED
+
+        outcome, _ = await store.acquire("s1", "k1", digest)
+        assert outcome == NEW
+        return first, store.first_attempt("s1", "k1")
+
+    first, retried = asyncio.run(scenario())
+    assert first is not None
+    assert retried.replace(tzinfo=None) == first.replace(tzinfo=None)
+
+
+def test_abandoned_key_with_other_message_is_a_conflict(store):
+    async def scenario():
+        _, token = await store.acquire("s1", "k1", fingerprint("hola"))
+        await store.abandon("s1", "k1", token)
+        return await store.acquire("s1", "k1", fingerprint("otro mensaje"))
+
+    assert asyncio.run(scenario()) == (CONFLICT, None)
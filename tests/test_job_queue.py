@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from src.infrastructure.jobs.queue import DONE, FAILED, QUEUED, RUNNING, ChatJobQueue
+
+
+@pytest.fixture
+def queue(engine):
+    return ChatJobQueue(bind=engine, max_attempts=2)
+
+
+def test_claim_hides_job_until_visibility_expires(queue):
+    job_id = queue.enqueue("s1", "hola")
+    [job] = queue.claim("w1", 10, visibility_timeout=0.2)
+    assert (job.id, job.status, job.attempts) == (job_id, RUNNING, 1)
+    assert job.created_at is not None
+    assert queue.claim("w2", 10, visibility_timeout=0.2) == []
+
+    time.sleep(0.25)
+    [again] = queue.claim("w2", 10, visibility_timeout=60)
+    assert (again.id, again.attempts) == (job_id, 2)
+    # El primer worker ya no es el dueño
+    assert not queue.extend(job_id, "w1", 60)
+    assert not queue.complete(job_id, "w1", {"assistant_message": "tarde"})
+    assert queue.complete(job_id, "w2", {"assistant_message": "hola"})
+    assert queue.get(job_id).result == {"assistant_message": "hola"}
+
+
+def test_extend_keeps_job_hidden(queue):
+    job_id = queue.enqueue("s1", "hola")
+    queue.claim("w1", 1, visibility_timeout=0.1)
+    assert queue.extend(job_id, "w1", 60)
+    time.sleep(0.15)
+    assert queue.claim("w2", 1, visibility_timeout=60) == []
+
+
+def test_fail_requeues_until_attempts_run_out(queue):
+    job_id = queue.enqueue("s1", "hola")
+    queue.claim("w1", 1, visibility_timeout=60)
+    assert queue.fail(job_id, "w1", "modelo caído", retry_delay=0)
+    assert queue.get(job_id).status == QUEUED
+
+    queue.claim("w1", 1, visibility_timeout=60)
+    assert queue.fail(job_id, "w1", "modelo caído", retry_delay=0)
+    job = queue.get(job_id)
+    assert (job.status, job.attempts, job.error) == (FAILED, 2, "modelo caído")
+    assert queue.claim("w1", 1, visibility_timeout=60) == []
+
+
+def test_abandoned_job_without_attempts_is_marked_failed(queue):
+    job_id = queue.enqueue("s1", "hola")
+    queue.claim("w1", 1, visibility_timeout=0)
+    queue.claim("w1", 1, visibility_timeout=0)
+    assert queue.claim("w2", 1, visibility_timeout=60) == []
+    assert queue.get(job_id).status == FAILED
+    assert queue.counts() == {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 1}
+
+
+def test_concurrent_workers_never_share_a_job(queue):
+    ids = {queue.enqueue("s1", f"mensaje {n}") for n in range(40)}
+    claimed = {}
+    barrier = threading.Barrier(4)
+
+    def worker(name):
+        barrier.wait()
+        while True:
+            jobs = queue.claim(name, 3, visibility_timeout=60)
+            if not jobs:
+                return
+            for job in jobs:
+                claimed.setdefault(job.id, []).append(name)
+                queue.complete(job.id, name, {"ok": True})
+
+    threads = [threading.Thread(target=worker, args=(f"w{n}",)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert set(claimed) == ids
+    assert all(len(owners) == 1 for owners in claimed.values())
+    assert queue.counts()[DONE] == 40
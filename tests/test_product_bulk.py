@@ -0,0 +1,74 @@
+import pytest
+
+from src.application.dtos import ProductPatchDTO
+from src.application.product_service import ProductService
+from src.domain.entities import Product
+from src.infrastructure.repositories import product_repository
+from src.infrastructure.repositories.product_repository import SQLProductRepository
+
+_FIELDS = dict(name="Zapatilla", brand="Marca", category="Zapatillas", size="42", color="Negro", price=100.0, stock=5)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def existing(db):
+    repo = SQLProductRepository(db)
+    return [repo.save(Product(id=None, **{**_FIELDS, "name": f"Zapatilla {n}"})).id for n in range(3)]
+
+
+def _apply(db, items):
+    return ProductService(SQLProductRepository(db)).bulk_upsert([ProductPatchDTO(**i) for i in items])
+
+
+def _product(db, product_id):
+    db.expire_all()
+    return SQLProductRepository(db).get_by_id(product_id)
+
+
+def test_repeated_ids_are_merged_in_order(db, existing):
+    a = existing[0]
+    version = SQLProductRepository(db).get_catalog_version()[0]
+    result = _apply(db, [{"id": a, "price": 50}, {"id": a, "stock": 9}, {"id": a, "price": 60}])
+
+    assert [(r.index, r.id, r.status) for r in result.items] == [(0, a, "updated"), (1, a, "updated"),
+                                                                 (2, a, "updated")]
+    assert (result.total, result.updated) == (3, 3)
+    p = _product(db, a)
+    assert (p.price, p.stock, p.name) == (60, 9, "Zapatilla 0")
+    assert result.catalog_version == version + 1
+
+
+def test_repeated_new_id_creates_one_product(db, existing):
+    result = _apply(db, [{"id": 500, **_FIELDS}, {"id": 500, "stock": 3}])
+    assert [(r.id, r.status) for r in result.items] == [(500, "created"), (500, "created")]
+    assert _product(db, 500).stock == 3
+    assert len(SQLProductRepository(db).get_all()) == len(existing) + 1
+
+
+def test_mixed_batch_reports_each_item(db, existing):
+    a, b, _ = existing
+    result = _apply(db, [
+        {"id": a, "color": "Rojo"},
+        {"id": 9999, "price": 10},
+        {"id": b, "price": -1},
+        {**_FIELDS, "name": "Nueva"},
+        {"name": "Incompleta"},
+    ])
+    assert [r.status for r in result.items] == ["updated", "not_found", "invalid", "created", "invalid"]
+    assert (result.updated, result.created, result.not_found, result.invalid) == (1, 1, 1, 2)
+    assert _product(db, a).color == "Rojo"
+    assert _product(db, b).price == 100
+    assert _product(db, result.items[3].id).name == "Nueva"
+
+
+def test_updates_span_several_chunks(db, existing, monkeypatch):
+    monkeypatch.setattr(product_repository, "BULK_CHUNK_SIZE", 2)
+    result = _apply(db, [{"id": pid, "stock": 20 + n} for n, pid in enumerate(existing)])
+    assert result.updated == 3
+    assert [_product(db, pid).stock for pid in existing] == [20, 21, 22]
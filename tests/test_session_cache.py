@@ -0,0 +1,130 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.domain.entities import ChatMessage
+from src.infrastructure.cache.session_context_cache import SessionContextCache
+from src.infrastructure.cache.session_versions import SessionVersionBoard
+from src.infrastructure.repositories.cached_chat_repository import CachedChatRepository
+from src.infrastructure.repositories.chat_repository import SQLChatRepository
+
+_BASE = datetime(2026, 1, 1)
+
+
+def _message(session_id, n, role="user"):
+    return ChatMessage(id=None, session_id=session_id, role=role, message=f"m{n}",
+                       timestamp=_BASE + timedelta(seconds=n))
+
+
+def _cache(path, **kwargs):
+    return SessionContextCache(messages_per_session=4, versions=SessionVersionBoard(str(path), slots=64), **kwargs)
+
+
+# Cada "worker" tiene su propia caché; comparten el archivo de la señal
+@pytest.fixture
+def board_path(tmp_path):
+    return tmp_path / "session_versions.bin"
+
+
+def _texts(messages):
+    return [m.message for m in messages]
+
+
+def test_concurrent_writes_keep_cache_equal_to_database(session_factory, board_path):
+    cache = _cache(board_path)
+    errors = []
+
+    def writer(first):
+        db = session_factory()
+        try:
+            repo = CachedChatRepository(SQLChatRepository(db), cache)
+            for n in range(first, first + 20):
+                repo.save_message(_message("s1", n))
+                repo.get_recent_messages("s1", 4)
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=writer, args=(i * 100,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+
+    db = session_factory()
+    try:
+        expected = _texts(SQLChatRepository(db).get_recent_messages("s1", 4))
+        assert _texts(CachedChatRepository(SQLChatRepository(db), cache).get_recent_messages("s1", 4)) == expected
+    finally:
+        db.close()
+
+
+def test_fill_is_skipped_when_session_changed_during_read(board_path):
+    cache = _cache(board_path)
+    generation = cache.generation("s1")
+    cache.append("s1", [_message("s1", 1)])
+    assert not cache.put("s1", [], expected_generation=generation)
+    assert cache.get("s1", 2) is None
+
+
+def test_write_in_other_process_invalidates_entry(session_factory, board_path):
+    worker_a, worker_b = _cache(board_path), _cache(board_path)
+    db = session_factory()
+    try:
+        repo_a = CachedChatRepository(SQLChatRepository(db), worker_a)
+        repo_b = CachedChatRepository(SQLChatRepository(db), worker_b)
+        repo_a.save_message(_message("s1", 1))
+        assert _texts(repo_a.get_recent_messages("s1", 4)) == ["m1"]
+        assert _texts(repo_b.get_recent_messages("s1", 4)) == ["m1"]
+
+        repo_b.save_message(_message("s1", 2, role="assistant"))
+        assert worker_a.get("s1", 4) is None
+        assert worker_a.stats()["stale"] == 1
+        assert _texts(repo_a.get_recent_messages("s1", 4)) == ["m1", "m2"]
+
+        # Y al revés: la escritura de A deja vieja la entrada de B
+        repo_a.save_message(_message("s1", 3))
+        assert worker_b.get("s1", 4) is None
+        assert _texts(repo_b.get_recent_messages("s1", 4)) == ["m1", "m2", "m3"]
+    finally:
+        db.close()
+
+
+def test_hits_do_not_query_database_unless_validate_is_on(session_factory, board_path):
+    db = session_factory()
+    try:
+        inner = SQLChatRepository(db)
+        calls = []
+        original = inner.get_last_message_id
+        inner.get_last_message_id = lambda sid: calls.append(sid) or original(sid)
+
+        repo = CachedChatRepository(inner, _cache(board_path))
+        repo.save_message(_message("s1", 1))
+        repo.get_recent_messages("s1", 4)
+        repo.get_recent_messages("s1", 4)
+        assert calls == []
+
+        # Con validación, un mensaje escrito sin pasar por la caché se detecta
+        checked = CachedChatRepository(inner, _cache(board_path, validate=True))
+        checked.get_recent_messages("s1", 4)
+        inner.save_message(_message("s1", 2))
+        assert _texts(checked.get_recent_messages("s1", 4)) == ["m1", "m2"]
+        assert calls == ["s1"]
+    finally:
+        db.close()
+
+
+def test_saved_reply_replaces_pending_one_with_mixed_timezones(board_path):
+    cache = _cache(board_path)
+    stored = _message("s1", 1)
+    stored.id = 1
+    cache.put("s1", [stored])
+    pending = ChatMessage(id=None, session_id="s1", role="assistant", message="r",
+                          timestamp=datetime.now(timezone.utc))
+    cache.add_pending("s1", [pending])
+    saved = ChatMessage(id=2, session_id="s1", role="assistant", message="r", timestamp=pending.timestamp)
+    cache.append("s1", [saved])
+    assert [m.id for m in cache.get("s1", 4)] == [1, 2]
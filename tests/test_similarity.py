@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from src.domain.entities import Product
+from src.infrastructure.catalog.similarity import SimilarityIndex
+
+
+def _catalog(n, seed=7):
+    rnd = random.Random(seed)
+    words = [f"palabra{i}" for i in range(60)]
+    return [
+        Product(id=i + 1, name=" ".join(rnd.choices(words, k=3)), brand=f"marca{rnd.randrange(6)}",
+                category=f"cat{rnd.randrange(4)}", size=str(rnd.randrange(38, 44)), color=f"color{rnd.randrange(5)}",
+                price=round(rnd.uniform(20, 200), 2), stock=rnd.randrange(0, 3),
+                description=" ".join(rnd.choices(words, k=6)))
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def index():
+    products = _catalog(300)
+    idx = SimilarityIndex(lambda: 1, lambda: products, top_k=8)
+    idx.refresh()
+    idx.compute_neighbors()
+    return idx
+
+
+def _scan(idx, product_id, k, in_stock_only):
+    state = idx._state
+    return idx._scan(state, int(state[0].searchsorted(product_id)), k, in_stock_only)
+
+
+def test_precomputed_neighbors_match_full_scan(index):
+    pids = range(1, 301, 7)
+    expected = [[s for _, s in _scan(index, pid, 5, False)] for pid in pids]
+    scans = index.full_scans
+    assert [[s for _, s in index.similar(pid, 5)] for pid in pids] == expected
+    assert index.full_scans == scans
+    assert index.neighbor_hits == len(pids)
+
+
+def test_in_stock_filter_matches_full_scan(index):
+    stocks = index._state[1]
+    for pid in range(1, 301, 11):
+        result = index.similar(pid, 8, in_stock_only=True)
+        assert all(stocks[int(index._state[0].searchsorted(rid))] > 0 for rid, _ in result)
+        assert [s for _, s in result] == [s for _, s in _scan(index, pid, 8, True)]
+
+
+def test_larger_k_than_precomputed_uses_scan(index):
+    before = index.full_scans
+    assert len(index.similar(1, 20)) == 20
+    assert index.full_scans == before + 1
+
+
+def test_distinct_features_never_share_a_column():
+    products = _catalog(50)
+    idx = SimilarityIndex(lambda: 1, lambda: products, top_k=0)
+    idx.refresh()
+    assert idx.stats()["features"] == len(set(idx._vocab.values()))
+    # Productos sin nada en común no se parecen (con hashing podían colisionar)
+    a = Product(id=1, name="aaa", brand="x", category="y", size="s", color="z", price=10, stock=1)
+    b = Product(id=2, name="bbb", brand="q", category="w", size="m", color="v", price=9000, stock=1)
+    idx = SimilarityIndex(lambda: 2, lambda: [a, b])
+    idx.refresh()
+    assert idx.similar(1, 1) == []
@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from src.domain.entities import Product
+from src.domain.exceptions import InsufficientStockError, ProductNotFoundError
+from src.infrastructure.repositories.product_repository import SQLProductRepository
+
+
+@pytest.fixture
+def products(session_factory):
+    db = session_factory()
+    try:
+        repo = SQLProductRepository(db)
+        return [
+            repo.save(Product(id=None, name=f"Producto {n}", brand="Marca", category="Zapatillas",
+                              size="42", color="Negro", price=100.0, stock=stock)).id
+            for n, stock in enumerate((5, 2))
+        ]
+    finally:
+        db.close()
+
+
+def _call(session_factory, method, *args):
+    db = session_factory()
+    try:
+        return getattr(SQLProductRepository(db), method)(*args)
+    finally:
+        db.close()
+
+
+def _stocks(session_factory, ids):
+    return [_call(session_factory, "get_by_id", pid).stock for pid in ids]
+
+
+def test_reserve_and_release_only_bump_stock_version(session_factory, products):
+    a, b = products
+    catalog_before = _call(session_factory, "get_catalog_version")[0]
+    stock_before = _call(session_factory, "get_stock_version")[0]
+
+    assert _call(session_factory, "reserve_stock", [(a, 2), (b, 1)]) == {a: 3, b: 1}
+    assert _call(session_factory, "release_stock", [(a, 1)]) == {a: 4}
+    assert _stocks(session_factory, products) == [4, 1]
+    assert _call(session_factory, "get_catalog_version")[0] == catalog_before
+    assert _call(session_factory, "get_stock_version")[0] == stock_before + 2
+
+
+def test_insufficient_stock_reserves_nothing(session_factory, products):
+    a, b = products
+    with pytest.raises(InsufficientStockError) as info:
+        _call(session_factory, "reserve_stock", [(a, 1), (b, 3)])
+    assert (info.value.product_id, info.value.requested, info.value.available) == (b, 3, 2)
+    assert _stocks(session_factory, products) == [5, 2]
+
+
+def test_unknown_product_reserves_nothing(session_factory, products):
+    a, _ = products
+    with pytest.raises(ProductNotFoundError):
+        _call(session_factory, "reserve_stock", [(a, 1), (9999, 1)])
+    assert _stocks(session_factory, products) == [5, 2]
+
+
+def test_repeated_product_quantities_are_added_up(session_factory, products):
+    a, _ = products
+    with pytest.raises(InsufficientStockError):
+        _call(session_factory, "reserve_stock", [(a, 3), (a, 3)])
+    assert _call(session_factory, "reserve_stock", [(a, 3), (a, 2)]) == {a: 0}
+
+
+def test_invalid_quantity_is_rejected(session_factory, products):
+    a, _ = products
+    with pytest.raises(ValueError):
+        _call(session_factory, "reserve_stock", [(a, 0)])
+
+
+def test_concurrent_buyers_never_oversell(session_factory, products):
+    a, _ = products
+    outcomes = []
+    barrier = threading.Barrier(10)
+
+    def buyer():
+        barrier.wait()
+        try:
+            _call(session_factory, "reserve_stock", [(a, 1)])
+            outcomes.append("ok")
+        except InsufficientStockError:
+            outcomes.append("agotado")
+
+    threads = [threading.Thread(target=buyer) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(outcomes) == ["agotado"] * 5 + ["ok"] * 5
+    assert _stocks(session_factory, [a]) == [0]